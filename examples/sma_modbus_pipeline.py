@@ -0,0 +1,26 @@
+"""Script polling the SMA SunnyBoy continuously and storing the values in mariaDB and a file"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from sma_modbus.poll_daemon import PollDaemon
+from sma_modbus.pipeline import Pipeline
+from sma_modbus.sinks import FileSink, MariaDBSink
+from mariadb_config import MARIA_DB_CONFIG
+from maria_db_mysql import MariaDBMysql as maria_db, BatchedWriter
+
+# Main
+if __name__ == "__main__":
+    config = {'devices': [{'ip': '192.168.178.29', 'name': 'sunnyboy'}],
+              'intervals': {'live': 1, 'status': 10, 'counters': 300, 'identity': 0}}
+    # the database is written in batches, a slow commit never delays the next poll
+    sinks = {'db': MariaDBSink(BatchedWriter(maria_db(MARIA_DB_CONFIG), max_rows=500, max_delay=10)),
+             'archive': FileSink('sunnyboy.jsonl')}
+    pipeline = Pipeline(sinks, maxsize=100000, overflow='drop-oldest')
+    daemon = PollDaemon(config, emit=pipeline.emit, stats=lambda: {'pipeline': pipeline.stats()})
+    pipeline.start()
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
@@ -3,6 +3,8 @@
 # -*- coding: utf-8 -*-
 import mysql.connector
 from mysql.connector import errorcode
+from .batched_writer import BatchedWriter
+from .spool import Spool
 
 class MariaDBMysql:
     """Class connecting MariaDB Database"""
@@ -21,7 +23,28 @@ class MariaDBMysql:
     def __del__(self):
         #destroy the connector object
         #print("Call destructor")
-        self.connector.close()
+        if self.connector:
+            self.connector.close()
+
+    @property
+    def database(self) -> str:
+        """Name of the configured database"""
+        return self._config['database']
+
+    def reconnect(self):
+        """Method to replace a lost connection by a new one
+        -----
+
+        Returns:
+            MySQLConnection object or False
+        """
+        if self.connector:
+            try:
+                self.connector.close()
+            except mysql.connector.Error:
+                pass
+        self.connector = self.connect()
+        return self.connector
 
     def connect(self):
         """Method to establish connection to database
@@ -0,0 +1,307 @@
+"""module for buffered multi-row inserts into mariaDB database"""
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import time
+from collections import deque
+import mysql.connector
+from mysql.connector import errorcode
+
+# errors of the rows or the statement, retrying the same rows fails again
+_REJECTED = (mysql.connector.DataError, mysql.connector.IntegrityError, mysql.connector.ProgrammingError, \
+             mysql.connector.NotSupportedError)
+
+
+def quote_identifier(name) -> str:
+    """Quote a table or column name with backticks"""
+    return '`' + str(name).replace('`', '``') + '`'
+
+
+class BatchedWriter:
+    """Buffer rows in memory and insert them in batches
+
+    Rows of the same table and columns are written by one parameterized
+    executemany call, which the connector sends as a multi-row INSERT.
+    All tables of a flush are committed in one transaction. The INSERT
+    statements and the cursor are created once and reused.
+
+    Rows the database rejects (e.g. a wrong column or a value out of
+    range) would block all later rows. After max_failures rejections in
+    a row every table of the flush is tried alone, the rejected ones are
+    appended to the dead-letter file as json lines and skipped. Rows
+    failing by a lost connection are never dead-lettered.
+    """
+
+    def __init__(self, database, max_rows = 1000, max_delay = 5.0, max_buffered = 100000, spool = None, \
+                 dead_letter = None, max_failures = 3):
+        """Constructor of BatchedWriter class
+        -----
+
+        Args:
+            database: MariaDBMysql object
+            max_rows: flush when this number of rows is buffered
+            max_delay: flush when the oldest buffered row is older than max_delay seconds
+            max_buffered: max rows kept while the database is unavailable, the oldest are dropped
+            spool: Spool to store rows in while the database is unavailable
+            dead_letter: path of the file for rejected rows, None drops them
+            max_failures: rejections of the same rows before they are dead-lettered
+        """
+        self._database = database
+        self._max_rows = max_rows
+        self._max_delay = max_delay
+        self._max_buffered = max_buffered
+        self._spool = spool
+        self._spool_pending = spool is not None and spool.pending
+        self._dead_letter = dead_letter
+        self._max_failures = max_failures
+        self._rejections = 0
+        self._rejected = False
+        self._buffers = {}
+        # keys of the buffers in the order of the rows, the oldest row is at the left
+        self._order = deque()
+        self._statements = {}
+        self._cursor = None
+        self._buffered = 0
+        self._oldest = None
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.rows_dead = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def buffered(self) -> int:
+        """Number of rows waiting for the next flush"""
+        return self._buffered
+
+    def _statement(self, table, columns) -> str:
+        key = (table, columns)
+        statement = self._statements.get(key)
+        if statement is None:
+            names = ', '.join(quote_identifier(column) for column in columns)
+            marks = ', '.join(['%s'] * len(columns))
+            statement = f"INSERT INTO {quote_identifier(self._database.database)}." \
+                        f"{quote_identifier(table)} ({names}) VALUES ({marks})"
+            self._statements[key] = statement
+        return statement
+
+    def add(self, table, columns, values) -> bool:
+        """Add a row, flush if a threshold is reached
+        -----
+
+        Args:
+            table: string
+            columns: tuple of column names
+            values: tuple of values, same length as columns
+
+        Returns:
+            False if a triggered flush failed, True otherwise
+        """
+        columns = tuple(columns)
+        if len(columns) != len(values):
+            raise ValueError(f"{len(columns)} columns but {len(values)} values")
+        key = (table, columns)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = deque()
+        buffer.append(tuple(values))
+        self._order.append(key)
+        self._buffered += 1
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self._buffered > self._max_buffered:
+            self._drop_oldest()
+        if self._buffered >= self._max_rows:
+            return self.flush()
+        return self.flush_if_due()
+
+    def add_many(self, table, columns, rows) -> bool:
+        """Add several rows of one table, see add"""
+        result = True
+        for values in rows:
+            result = self.add(table, columns, values) and result
+        return result
+
+    def _drop_oldest(self):
+        self._buffers[self._order.popleft()].popleft()
+        self._buffered -= 1
+        self.rows_dropped += 1
+
+    def flush_if_due(self) -> bool:
+        """Flush if the oldest buffered row is older than max_delay
+        -----
+
+        Returns:
+            False if the flush failed, True otherwise
+        """
+        if self._oldest is not None and time.monotonic() - self._oldest >= self._max_delay:
+            return self.flush()
+        return True
+
+    def _get_cursor(self):
+        if self._cursor is None:
+            if not self._database.connector:
+                self._database.reconnect()
+            if not self._database.connector:
+                return None
+            self._cursor = self._database.connector.cursor()
+        return self._cursor
+
+    def _execute(self, batches, commit = True) -> bool:
+        """Insert batches of (table, columns, rows) in one transaction, roll it back if not commit"""
+        self._rejected = False
+        cursor = self._get_cursor()
+        if cursor is None:
+            return False
+        try:
+            for table, columns, rows in batches:
+                statement = self._statement(table, columns)
+                for start in range(0, len(rows), self._max_rows):
+                    cursor.executemany(statement, rows[start:start + self._max_rows])
+            if commit:
+                self._database.connector.commit()
+            else:
+                self._database.connector.rollback()
+        except mysql.connector.Error as err:
+            self._rejected = isinstance(err, _REJECTED)
+            self._handle_error(err)
+            return False
+        return True
+
+    def _write(self, batches) -> bool:
+        """Insert batches in one transaction, dead-letter the rejected ones after max_failures
+
+        -----
+
+        Returns:
+            True if the batches are written or dead-lettered, False to retry them later
+        """
+        if self._execute(batches):
+            self._rejections = 0
+            return True
+        if not self._rejected:
+            # the database is unavailable, not a problem of the rows
+            return False
+        self._rejections += 1
+        if self._rejections < self._max_failures:
+            return False
+        self._rejections = 0
+        # try every batch alone without commit, nothing is stored before the accepted
+        # batches are written together, so an outage keeps all rows for the retry
+        accepted = []
+        rejected = []
+        for batch in batches:
+            if self._execute([batch], commit=False):
+                accepted.append(batch)
+            elif self._rejected:
+                rejected.append(batch)
+            else:
+                return False
+        if accepted and not self._execute(accepted):
+            return False
+        for batch in rejected:
+            self._dead_letter_batch(*batch)
+        return True
+
+    def _dead_letter_batch(self, table, columns, rows):
+        self.rows_dead += len(rows)
+        if self._dead_letter is None:
+            print(f"ERROR: {len(rows)} rows of table {table} rejected by the database, dropped")
+            return
+        print(f"ERROR: {len(rows)} rows of table {table} rejected by the database, "
+              f"appended to {self._dead_letter}")
+        with open(self._dead_letter, 'a', encoding='utf-8') as file:
+            file.write(json.dumps({'table': table, 'columns': list(columns), 'rows': [list(row) for row in rows]}, \
+                                  default=str) + '\n')
+
+    def flush(self) -> bool:
+        """Write all buffered rows in one transaction
+
+        With a spool the rows spooled during an outage are replayed first,
+        if the database is unavailable the buffered rows are spooled.
+        -----
+
+        Returns:
+            True when successful or False when failed, the rows are kept or spooled then
+        """
+        if self._spool is not None and self._spool_pending:
+            dead = self.rows_dead
+            self.rows_replayed += self._spool.replay(self._write) - (self.rows_dead - dead)
+            self._spool_pending = self._spool.pending
+        if not self._buffered:
+            self._oldest = None
+            return not self._spool_pending
+        batches = [(table, columns, list(buffer)) for (table, columns), buffer \
+                   in self._buffers.items() if buffer]
+        dead = self.rows_dead
+        if self._spool_pending or not self._write(batches):
+            # keep the order: while older rows are spooled, newer ones are spooled too
+            self.failed_flushes += 1
+            if self._spool is None:
+                return False
+            for table, columns, rows in batches:
+                for values in rows:
+                    self._spool.append(table, columns, values)
+            self.rows_spooled += self._buffered
+            self._spool_pending = True
+        else:
+            self.flushes += 1
+            self.rows_written += self._buffered - (self.rows_dead - dead)
+        for buffer in self._buffers.values():
+            buffer.clear()
+        self._order.clear()
+        self._buffered = 0
+        self._oldest = None
+        return not self._spool_pending
+
+    def _handle_error(self, err):
+        if err.errno == errorcode.ER_PARSE_ERROR:
+            print(f"ERROR: Syntax! ({err.errno})")
+        else:
+            print(f"ERROR: {err.errno}")
+        try:
+            self._database.connector.rollback()
+        except mysql.connector.Error:
+            pass
+        # the connection may be gone, get a new cursor with the next flush
+        self._close_cursor()
+        if not self._database.connector.is_connected():
+            self._database.reconnect()
+
+    def _close_cursor(self):
+        if self._cursor is not None:
+            try:
+                self._cursor.close()
+            except mysql.connector.Error:
+                pass
+            self._cursor = None
+
+    def stats(self) -> dict:
+        """Return the counters of the writer"""
+        return {'buffered': self._buffered, 'rows_written': self.rows_written, \
+                'rows_dropped': self.rows_dropped, 'rows_spooled': self.rows_spooled, \
+                'rows_replayed': self.rows_replayed, 'rows_dead': self.rows_dead, 'flushes': self.flushes, \
+                'failed_flushes': self.failed_flushes}
+
+    def close(self) -> bool:
+        """Flush the remaining rows and close the cursor
+        -----
+
+        Returns:
+            True when successful or False when rows are lost
+        """
+        result = self.flush()
+        self._close_cursor()
+        if self._spool is not None:
+            self._spool.close()
+            # spooled rows are not lost, they are replayed by the next writer
+            result = result or self._spool_pending
+        return result
@@ -0,0 +1,259 @@
+"""module for a durable local spool of rows while the database is unavailable"""
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+# record header: kind, payload length, crc32 of payload
+_HEADER = struct.Struct('>BII')
+_FORMAT_ID = struct.Struct('>H')
+_KIND_FORMAT = 1
+_KIND_ROW = 2
+
+_SEGMENT_SUFFIX = '.spool'
+
+# signature character of a value : struct character of its fixed part
+_SIGNATURE_TO_STRUCT = {'n': '', '?': '?', 'q': 'q', 'd': 'd', 's': 'I'}
+
+
+def _signature(values) -> str:
+    signature = ''
+    for value in values:
+        if value is None:
+            signature += 'n'
+        elif isinstance(value, bool):
+            signature += '?'
+        elif isinstance(value, int):
+            signature += 'q'
+        elif isinstance(value, float):
+            signature += 'd'
+        else:
+            signature += 's'
+    return signature
+
+
+class _RowFormat:
+    """Binary layout of rows with the same table, columns and value types"""
+    __slots__ = ('table', 'columns', 'signature', 'struct')
+
+    def __init__(self, table, columns, signature):
+        self.table = table
+        self.columns = columns
+        self.signature = signature
+        self.struct = struct.Struct('>' + ''.join(_SIGNATURE_TO_STRUCT[char] for char in signature))
+
+    def pack(self, values) -> bytes:
+        fixed = []
+        tail = []
+        for char, value in zip(self.signature, values):
+            if char == 'n':
+                continue
+            if char == 's':
+                data = (value if isinstance(value, str) else str(value)).encode('utf-8')
+                tail.append(data)
+                fixed.append(len(data))
+            else:
+                fixed.append(value)
+        return self.struct.pack(*fixed) + b''.join(tail)
+
+    def unpack(self, buffer, offset, end) -> tuple:
+        fixed = self.struct.unpack_from(buffer, offset)
+        position = offset + self.struct.size
+        values = []
+        index = 0
+        for char in self.signature:
+            if char == 'n':
+                values.append(None)
+                continue
+            value = fixed[index]
+            index += 1
+            if char == 's':
+                length = value
+                value = bytes(buffer[position:position + length]).decode('utf-8')
+                position += length
+            values.append(value)
+        if position != end:
+            raise ValueError('row record has a wrong length')
+        return tuple(values)
+
+
+class Spool:
+    """Append-only, segment based spool of table rows
+
+    Rows are appended as compact binary records to segment files in a
+    directory. Each segment is self-contained: it starts with the row
+    formats (table, columns, value types) it uses, every row record
+    references a format. Records carry a crc32, a torn record at the end
+    of a segment after a crash is ignored. fsync is done in batches.
+    Closed segments are replayed in order via mmap and deleted after the
+    database accepted them.
+    """
+
+    def __init__(self, directory, segment_size = 8 * 1024 * 1024, sync_every = 1000, sync_interval = 1.0):
+        """Constructor of Spool class
+        -----
+
+        Args:
+            directory: directory of the segment files, created if missing
+            segment_size: start a new segment when the current one is bigger (bytes)
+            sync_every: fsync after this number of appended rows
+            sync_interval: fsync when the last fsync is older than this (seconds)
+        """
+        self._directory = directory
+        self._segment_size = segment_size
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._formats = {}
+        self._format_cache = {}
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.rows_appended = 0
+        self.rows_replayed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _segments(self) -> list:
+        names = sorted(name for name in os.listdir(self._directory) if name.endswith(_SEGMENT_SUFFIX))
+        return [os.path.join(self._directory, name) for name in names]
+
+    @property
+    def pending(self) -> bool:
+        """True if rows are waiting for replay"""
+        return any(os.path.getsize(path) > 0 for path in self._segments())
+
+    def _open_segment(self):
+        segments = self._segments()
+        number = int(os.path.basename(segments[-1])[:-len(_SEGMENT_SUFFIX)]) + 1 if segments else 1
+        path = os.path.join(self._directory, f'{number:012d}{_SEGMENT_SUFFIX}')
+        self._file = open(path, 'ab')
+        self._formats = {}
+
+    def _write_record(self, kind, payload):
+        self._file.write(_HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload)
+
+    def append(self, table, columns, values):
+        """Append one row
+        -----
+
+        Args:
+            table: string
+            columns: tuple of column names
+            values: tuple of values (None, bool, int, float, other types are stored as str)
+        """
+        if self._file is None:
+            self._open_segment()
+        signature = _signature(values)
+        key = (table, tuple(columns), signature)
+        format_id = self._formats.get(key)
+        if format_id is None:
+            format_id = len(self._formats)
+            self._formats[key] = format_id
+            self._write_record(_KIND_FORMAT, _FORMAT_ID.pack(format_id) + \
+                               json.dumps([table, list(columns), signature]).encode('utf-8'))
+        row_format = self._row_format(key)
+        self._write_record(_KIND_ROW, _FORMAT_ID.pack(format_id) + row_format.pack(values))
+        self.rows_appended += 1
+        self._unsynced += 1
+        if self._unsynced >= self._sync_every or \
+           time.monotonic() - self._last_sync >= self._sync_interval:
+            self.sync()
+        if self._file.tell() >= self._segment_size:
+            self._close_segment()
+
+    def _row_format(self, key):
+        # formats are cached across segments, only their ids are per segment
+        row_format = self._format_cache.get(key)
+        if row_format is None:
+            row_format = self._format_cache[key] = _RowFormat(*key)
+        return row_format
+
+    def sync(self):
+        """Flush and fsync the current segment
+        """
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _close_segment(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def read_segment(path) -> list:
+        """Read the rows of a segment file
+        -----
+
+        Args:
+            path: path of the segment file
+
+        Returns:
+            list of (table, columns, rows) in order of the first row of each table and columns
+        """
+        groups = {}
+        formats = {}
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                offset = 0
+                size = len(buffer)
+                while offset + _HEADER.size <= size:
+                    kind, length, crc = _HEADER.unpack_from(buffer, offset)
+                    start = offset + _HEADER.size
+                    end = start + length
+                    if end > size or zlib.crc32(buffer[start:end]) != crc:
+                        # torn write at the end of the segment
+                        break
+                    format_id, = _FORMAT_ID.unpack_from(buffer, start)
+                    if kind == _KIND_FORMAT:
+                        table, columns, signature = json.loads(bytes(buffer[start + 2:end]))
+                        row_format = _RowFormat(table, tuple(columns), signature)
+                        formats[format_id] = row_format
+                        groups.setdefault((table, tuple(columns)), [])
+                    else:
+                        row_format = formats[format_id]
+                        groups[(row_format.table, row_format.columns)].append( \
+                            row_format.unpack(buffer, start + 2, end))
+                    offset = end
+        return [(table, columns, rows) for (table, columns), rows in groups.items() if rows]
+
+    def replay(self, write) -> int:
+        """Replay all segments in order and delete the accepted ones
+        -----
+
+        Args:
+            write: function called with the list of (table, columns, rows) of one
+                   segment, it returns True if the rows are stored (in one transaction)
+
+        Returns:
+            number of replayed rows, replay stops at the first refused segment
+        """
+        self._close_segment()
+        replayed = 0
+        for path in self._segments():
+            batches = self.read_segment(path)
+            if batches and not write(batches):
+                break
+            os.remove(path)
+            replayed += sum(len(rows) for _, _, rows in batches)
+        self.rows_replayed += replayed
+        return replayed
+
+    def close(self):
+        """Sync and close the current segment
+        """
+        self._close_segment()
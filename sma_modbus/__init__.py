@@ -2,4 +2,29 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
-from .sma_modbus import SunnyBoy
+# the classes are imported on first use, so 'python -m sma_modbus get' and
+# the light modules (register_map, tcp_reader, ...) do not import pymodbus
+_EXPORTS = {'SunnyBoy': '.sma_modbus',
+            'AsyncSunnyBoy': '.async_sma_modbus',
+            'FleetPoller': '.fleet_poller',
+            'ConnectionPool': '.connection_pool',
+            'ResponseCache': '.response_cache',
+            'GatewayClient': '.gateway',
+            'TcpReader': '.tcp_reader',
+            'PowerLimitController': '.power_control'}
+
+__all__ = tuple(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    import importlib
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
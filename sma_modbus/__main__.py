@@ -0,0 +1,320 @@
+"""Command line interface of sma_modbus"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+
+# keys of a cli record which are not fields of the register map
+_RECORD_KEYS = ('timestamp', 'device')
+
+
+def _poll(args):
+    from .poll_daemon import PollDaemon, load_config, build_pipeline, build_filter, build_aggregator, \
+        print_record
+    config = load_config(args.config)
+    pipeline = build_pipeline(config)
+    deadband = build_filter(config, print_record if pipeline is None else pipeline.emit)
+    # the aggregation needs every sample, the deadband filter gets its output
+    emit = build_aggregator(config, deadband)
+
+    def stats():
+        result = {}
+        if pipeline is not None:
+            result['pipeline'] = pipeline.stats()
+        if hasattr(deadband, 'stats'):
+            result['deadband'] = deadband.stats()
+        if hasattr(emit, 'stats'):
+            result['aggregate'] = emit.stats()
+        return result
+
+    if args.workers > 1:
+        from .sharded_poller import ShardedPoller
+        daemon = ShardedPoller(config, workers=args.workers, emit=emit, stats=stats)
+        # start the processes before the threads of the pipeline
+        daemon.start()
+    else:
+        daemon = PollDaemon(config, emit=emit, stats=stats)
+    if pipeline is not None:
+        pipeline.start()
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if hasattr(emit, 'flush'):
+            emit.flush()
+        if pipeline is not None:
+            pipeline.stop()
+    return 0
+
+
+def _exporter(args):
+    from .exporter import MetricsServer, MetricsStore
+    from .instrumentation import Instrumentation
+    from .poll_daemon import PollDaemon, load_config, build_pipeline
+    config = load_config(args.config)
+    config.setdefault('stats_interval', 0)
+    pipeline = build_pipeline(config)
+    daemon = None
+    instrumentation = Instrumentation()
+    store = MetricsStore(connection_stats=lambda: daemon.pool.stats(), instrumentation=instrumentation)
+
+    def emit(record):
+        store.update(record)
+        if pipeline is not None:
+            pipeline.emit(record)
+
+    daemon = PollDaemon(config, emit=emit, observe=store.observe, instrumentation=instrumentation)
+    server = MetricsServer(store, args.listen, args.port)
+    server.start()
+    print(f"INFO: serving metrics on http://{args.listen}:{args.port}/metrics", flush=True)
+    if pipeline is not None:
+        pipeline.start()
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        if pipeline is not None:
+            pipeline.stop()
+    return 0
+
+
+def _discover(args):
+    import asyncio
+    import time
+    from .discovery import discover, save_inventory
+    unit_ids = None
+    if args.unit_ids:
+        first, _, last = args.unit_ids.partition('-')
+        unit_ids = range(int(first), int(last or first) + 1)
+    tic = time.perf_counter()
+    devices = asyncio.run(discover(args.network, args.port, unit_ids, args.timeout, args.concurrency))
+    for device in devices:
+        print(f"{device['ip']}:{device['port']}/{device['device_unit_id']}  {device['device_type']}  "
+              f"serial {device['serial_number']}  software {device['software_packet']}")
+    print(f"INFO: found {len(devices)} devices in {time.perf_counter() - tic:.1f} s", flush=True)
+    if args.output:
+        save_inventory(devices, args.output)
+    return 0 if devices else 1
+
+
+def _simulate(args):
+    import asyncio
+    from .simulator import SimulatorSettings, serve_fleet
+    settings = SimulatorSettings(latency=args.latency, jitter=args.jitter, drop_rate=args.drop_rate, \
+                                 exception_rate=args.exception_rate, peak_power=args.peak_power, \
+                                 phases=args.phases, day_seconds=args.day_seconds)
+
+    async def serve():
+        servers = await serve_fleet(args.host, args.port, args.devices, args.unit_ids, settings)
+        print(f"INFO: simulating {args.devices} x {len(args.unit_ids)} devices on "
+              f"{args.host}:{args.port}..{args.port + args.devices - 1}", flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for server in servers:
+                await server.shutdown()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _check_fields(names):
+    from .register_map import REGISTER_MAP, CONTROL_MAP
+    known = tuple(REGISTER_MAP) + tuple(CONTROL_MAP)
+    unknown = [name for name in names or () if name not in known]
+    if unknown:
+        print(f"ERROR: unknown fields {', '.join(unknown)}, known: {', '.join(known)}", file=sys.stderr)
+    return not unknown
+
+
+def _read_record(reader, args, names):
+    """Read a record of the fields, the messages of the reader go to stderr"""
+    import contextlib
+    with contextlib.redirect_stdout(sys.stderr):
+        values = reader.read_values(names)
+    if values is False:
+        return None
+    record = {'timestamp': values.pop('timestamp'), 'device': f'{args.ip}:{args.port}/{args.unit_id}'}
+    record.update(values)
+    return record
+
+
+def _print_record(record, output_format, header = True):
+    """Write a record as json line, csv row or plain values to stdout"""
+    if output_format == 'json':
+        import json
+        print(json.dumps(record), flush=True)
+    elif output_format == 'csv':
+        import csv
+        from .sinks import flatten_record
+        flat = flatten_record(record)
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        if header:
+            writer.writerow(flat)
+        writer.writerow(flat.values())
+        sys.stdout.flush()
+    else:
+        for name, value in record.items():
+            if name not in _RECORD_KEYS:
+                print(' '.join(map(str, value)) if isinstance(value, tuple) else value)
+
+
+def _reader(args):
+    from .tcp_reader import TcpReader
+    return TcpReader(args.ip, args.port, args.unit_id, args.timeout)
+
+
+def _get(args):
+    if not _check_fields(args.fields):
+        return 2
+    with _reader(args) as reader:
+        record = _read_record(reader, args, args.fields)
+    if record is None:
+        return 1
+    _print_record(record, args.format)
+    # e.g. exception responses of a gateway for a unit id without device
+    return 0 if any(record[name] is not None for name in record if name not in _RECORD_KEYS) else 1
+
+
+def _watch(args):
+    import time
+    if not _check_fields(args.fields):
+        return 2
+    header = True
+    reads = 0
+    with _reader(args) as reader:
+        deadline = time.monotonic()
+        try:
+            while not args.count or reads < args.count:
+                record = _read_record(reader, args, args.fields)
+                reads += 1
+                if record is not None:
+                    _print_record(record, args.format, header)
+                    header = False
+                # drift free: the next read is due interval after the last due time
+                deadline += args.interval
+                time.sleep(max(0.0, deadline - time.monotonic()))
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def _benchmark(args):
+    import json
+    from . import benchmark
+    report = benchmark.run(repeat=args.repeat, fleet_sizes=tuple(args.fleet_sizes), \
+                           latency=args.latency, port=args.port, \
+                           mariadb_config=args.mariadb_config, mariadb_rows=args.mariadb_rows)
+    print(json.dumps(report['results'], indent=2))
+    if args.output:
+        benchmark.save(report, args.output)
+    budget = benchmark.STARTUP_BUDGET_MS if args.startup_budget is None else args.startup_budget
+    over_budget = benchmark.check_budget(report, budget)
+    for metric, value, limit in over_budget:
+        print(f"BUDGET: {metric}: {value} ms > {limit} ms")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = benchmark.compare(json.load(file), report, args.threshold)
+        for metric, before, value in regressions:
+            print(f"REGRESSION: {metric}: {before} -> {value}")
+        return 1 if regressions or over_budget else 0
+    return 1 if over_budget else 0
+
+
+def main(argv = None) -> int:
+    """Entry point of 'python -m sma_modbus'"""
+    parser = argparse.ArgumentParser(prog='python -m sma_modbus', \
+                                     description='Read SMA devices by modbus tcp')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    # get, snapshot and watch read with the TcpReader, they start without importing pymodbus
+    device = argparse.ArgumentParser(add_help=False)
+    device.add_argument('ip', help='ip address of the device')
+    device.add_argument('--port', type=int, default=502, help='modbus tcp port')
+    device.add_argument('--unit-id', type=int, default=3, help='UnitID of the device')
+    device.add_argument('--timeout', type=float, default=3.0, help='timeout of connect and requests in s')
+
+    get = commands.add_parser('get', parents=[device], help='read fields once and print their values')
+    get.add_argument('fields', nargs='+', help='field names, e.g. total_yield active_power')
+    get.add_argument('--format', choices=('value', 'json', 'csv'), default='value', \
+                     help='one value per line (tuple elements separated by blanks), json or csv')
+    get.set_defaults(func=_get)
+
+    snapshot = commands.add_parser('snapshot', parents=[device], help='read all fields once')
+    snapshot.add_argument('--fields', nargs='+', help='field names (default all)')
+    snapshot.add_argument('--format', choices=('json', 'csv', 'value'), default='json', help='output format')
+    snapshot.set_defaults(func=_get)
+
+    watch = commands.add_parser('watch', parents=[device], help='read fields periodically, one record per line')
+    watch.add_argument('--fields', nargs='+', help='field names (default all)')
+    watch.add_argument('--interval', type=float, default=5.0, help='seconds between two reads')
+    watch.add_argument('--count', type=int, default=0, help='number of reads, 0 until interrupted')
+    watch.add_argument('--format', choices=('json', 'csv'), default='json', \
+                       help='json lines or csv with one header line')
+    watch.set_defaults(func=_watch)
+
+    poll = commands.add_parser('poll', help='poll devices continuously, to the configured sinks or stdout')
+    poll.add_argument('--config', required=True, help='json configuration file')
+    poll.add_argument('--workers', type=int, default=1, help='number of worker processes for large fleets')
+    poll.set_defaults(func=_poll)
+
+    exporter = commands.add_parser('exporter', help='serve the values of the polled devices for Prometheus')
+    exporter.add_argument('--config', required=True, help='json configuration file, see poll')
+    exporter.add_argument('--listen', default='0.0.0.0', help='interface of the http server')
+    exporter.add_argument('--port', type=int, default=9105, help='tcp port of the http server')
+    exporter.set_defaults(func=_exporter)
+
+    discover = commands.add_parser('discover', help='scan a network for SMA devices and write an inventory')
+    discover.add_argument('network', help='CIDR like 192.168.178.0/24 or a single ip')
+    discover.add_argument('--port', type=int, default=502, help='modbus tcp port')
+    discover.add_argument('--unit-ids', help='probe a range of unit ids like 3-123 (gateways), '
+                          'default: ask unit 1 for the device unit id')
+    discover.add_argument('--timeout', type=float, default=0.5, help='timeout of connects and requests in s')
+    discover.add_argument('--concurrency', type=int, default=256, help='max hosts probed at the same time')
+    discover.add_argument('--output', help='write the inventory json, usable as "inventory" of the poll config')
+    discover.set_defaults(func=_discover)
+
+    simulate = commands.add_parser('simulate', help='serve simulated SunnyBoy devices')
+    simulate.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    simulate.add_argument('--port', type=int, default=5020, help='first tcp port')
+    simulate.add_argument('--devices', type=int, default=1, help='number of ports/hosts')
+    simulate.add_argument('--unit-ids', type=int, nargs='+', default=[3], help='UnitIDs of every port')
+    simulate.add_argument('--latency', type=float, default=0.0, help='response delay in s')
+    simulate.add_argument('--jitter', type=float, default=0.0, help='max random extra delay in s')
+    simulate.add_argument('--drop-rate', type=float, default=0.0, help='probability to drop the connection')
+    simulate.add_argument('--exception-rate', type=float, default=0.0, \
+                          help='probability of a modbus exception response')
+    simulate.add_argument('--peak-power', type=float, default=3600.0, help='ac power at noon in W')
+    simulate.add_argument('--phases', type=int, choices=(1, 3), default=1, help='number of ac phases')
+    simulate.add_argument('--day-seconds', type=float, default=86400.0, \
+                          help='length of a simulated day in s')
+    simulate.set_defaults(func=_simulate)
+
+    bench = commands.add_parser('benchmark', help='benchmark against simulated devices')
+    bench.add_argument('--output', help='save the results as json')
+    bench.add_argument('--compare', help='json results of a previous run, exit 1 on regressions')
+    bench.add_argument('--threshold', type=float, default=0.10, help='relative change counted as regression')
+    bench.add_argument('--startup-budget', type=float, \
+                       help='max ms of a one-shot get over the bare interpreter, exit 1 if exceeded (default 75)')
+    bench.add_argument('--repeat', type=int, default=200, help='samples per measurement')
+    bench.add_argument('--latency', type=float, default=0.0, help='latency of the simulated devices in s')
+    bench.add_argument('--port', type=int, default=15020, help='first port of the simulated devices')
+    bench.add_argument('--fleet-sizes', type=int, nargs='*', default=[1, 10, 100], \
+                       help='numbers of devices for the fleet sweep')
+    bench.add_argument('--mariadb-config', help='json with "config", "table" and "column" for the insert benchmark')
+    bench.add_argument('--mariadb-rows', type=int, default=2000, help='rows of the insert benchmark')
+    bench.set_defaults(func=_benchmark)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,240 @@
+"""module to downsample records to windows with min, max, mean, last and energy"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+from .deadband import RECORD_KEYS
+from .register_map import REGISTER_MAP
+
+# factor from the unit of the power field to W
+POWER_UNITS = {'W': 1.0, 'kW': 1000.0}
+
+
+def _trapezoid(t1, p1, t2, p2, start, end) -> float:
+    """Integral of the line through (t1, p1), (t2, p2) between max(t1, start) and min(t2, end) in W*s"""
+    begin = max(t1, start)
+    stop = min(t2, end)
+    if stop <= begin:
+        return 0.0
+    slope = (p2 - p1) / (t2 - t1)
+    return (p1 + slope * (begin - t1) + p1 + slope * (stop - t1)) / 2 * (stop - begin)
+
+
+class _Window:
+    """Running statistics of the fields of one device, group and window size"""
+    __slots__ = ('start', 'end', 'samples', 'fields', 'energy')
+
+    def __init__(self, start, size):
+        self.start = start
+        self.end = start + size
+        self.samples = 0
+        # name --> list of [count, min, max, sum, last], one per element
+        self.fields = {}
+        self.energy = 0.0
+
+    def add(self, record):
+        self.samples += 1
+        for name, value in record.items():
+            if name in RECORD_KEYS:
+                continue
+            values = value if isinstance(value, (tuple, list)) else (value,)
+            stats = self.fields.get(name)
+            if stats is None:
+                stats = self.fields[name] = [[0, math.inf, -math.inf, 0.0, None] for _ in values]
+            for item, stat in zip(values, stats):
+                stat[4] = item
+                if item is None or isinstance(item, (str, bool)):
+                    continue
+                stat[0] += 1
+                stat[3] += item
+                if item < stat[1]:
+                    stat[1] = item
+                if item > stat[2]:
+                    stat[2] = item
+
+    def record(self, device, group, size, energy) -> dict:
+        record = {'timestamp': self.start, 'device': device, 'group': f'{group}_{size}s', \
+                  'samples': self.samples}
+        for name, stats in self.fields.items():
+            if all(stat[0] == 0 for stat in stats):
+                # enums and missing values, only the last one is meaningful
+                lasts = tuple(stat[4] for stat in stats)
+                record[f'{name}_last'] = lasts if len(lasts) > 1 else lasts[0]
+                continue
+            columns = {'min': [], 'max': [], 'mean': [], 'last': []}
+            for count, low, high, total, last in stats:
+                columns['min'].append(low if count else None)
+                columns['max'].append(high if count else None)
+                columns['mean'].append(total / count if count else None)
+                columns['last'].append(last)
+            for suffix, values in columns.items():
+                record[f'{name}_{suffix}'] = tuple(values) if len(values) > 1 else values[0]
+        if energy:
+            record['energy'] = round(self.energy / 3600, 3)
+        return record
+
+
+class _Stream:
+    """State of the records of one device and group"""
+    __slots__ = ('windows', 'last_time', 'last_power')
+
+    def __init__(self):
+        self.windows = {}
+        self.last_time = None
+        self.last_power = None
+
+
+class Aggregator:
+    """Streaming stage reducing high rate records to per window statistics
+
+    The records of the aggregated groups (default 'live') of every device
+    are reduced to one record per window size (e.g. 60 and 900 s) with
+    min, max, mean and last of every field (name_min, ... and samples),
+    enums only with last. The windows are aligned to multiples of their
+    size, a window record is forwarded with the first record after its
+    end and has the group name with the size, e.g. 'live_60s'. Memory is
+    constant per device, group and window.
+
+    The power field (total of active_power, in kW) is integrated by the
+    trapezoidal rule to the energy of the window in Wh. Samples more than
+    max_gap seconds apart are not integrated. The integrated energy is
+    checked against the difference of the total_yield counter (daily_yield
+    without it) between two records of the 'counters' group, which are
+    forwarded with an 'energy_check' record: counter_energy,
+    integrated_energy (both Wh), deviation (relative to the counter) and
+    complete (False if a gap was not integrated).
+
+    Records of other groups are forwarded unchanged.
+    """
+    def __init__(self, forward, windows = (60, 900), groups = ('live',), power_field = 'active_power', \
+                 max_gap = 10.0, raw = False, tolerance = 0.05):
+        """Constructor of aggregator
+
+        Keyword arguments:
+
+        forward -- function called with every forwarded record
+
+        windows -- window sizes in s (default (60, 900))
+
+        groups -- register groups which are aggregated (default ('live',))
+
+        power_field -- field integrated to the energy, element 0 of tuples (default 'active_power')
+
+        max_gap -- max seconds between two samples which are integrated (default 10)
+
+        raw -- forward the records of the aggregated groups too (default False)
+
+        tolerance -- relative deviation of an energy check counted as mismatch (default 0.05)
+
+        """
+        self._forward = forward
+        self._windows = tuple(sorted(windows))
+        self._groups = frozenset(groups)
+        self._power_field = power_field
+        register = REGISTER_MAP.get(power_field)
+        self._power_factor = POWER_UNITS.get(register.unit, 1.0) if register is not None else 1.0
+        self._max_gap = max_gap
+        self._raw = raw
+        self._tolerance = tolerance
+        self._streams = {}
+        # device --> integrated energy in W*s, gaps and the state at the last counter record
+        self._energy = {}
+        self.samples = 0
+        self.windows = 0
+        self.gaps = 0
+        self.checks = 0
+        self.mismatches = 0
+
+    def _power(self, record):
+        value = record.get(self._power_field)
+        if isinstance(value, (tuple, list)):
+            value = value[0] if value else None
+        if value is None:
+            return None
+        return value * self._power_factor
+
+    def __call__(self, record):
+        """Aggregate or forward a record"""
+        group = record.get('group')
+        if group == 'counters':
+            self._check_energy(record)
+        if group not in self._groups:
+            self._forward(record)
+            return
+        if self._raw:
+            self._forward(record)
+        self.samples += 1
+        device = record.get('device')
+        now = record['timestamp']
+        stream = self._streams.get((device, group))
+        if stream is None:
+            stream = self._streams[(device, group)] = _Stream()
+        power = self._power(record)
+        energy = self._energy.setdefault(device, {'total': 0.0, 'gaps': 0, 'checkpoint': None})
+        integrate = power is not None and stream.last_power is not None
+        if integrate and now - stream.last_time > self._max_gap:
+            integrate = False
+            self.gaps += 1
+            energy['gaps'] += 1
+        if integrate:
+            energy['total'] += _trapezoid(stream.last_time, stream.last_power, now, power, -math.inf, math.inf)
+        for size in self._windows:
+            window = stream.windows.get(size)
+            if integrate and window is not None:
+                window.energy += _trapezoid(stream.last_time, stream.last_power, now, power, \
+                                            window.start, window.end)
+            if window is None or now >= window.end:
+                if window is not None:
+                    self._emit_window(device, group, size, window)
+                window = stream.windows[size] = _Window(now - now % size, size)
+                if integrate:
+                    window.energy += _trapezoid(stream.last_time, stream.last_power, now, power, \
+                                                window.start, window.end)
+            window.add(record)
+        if power is not None:
+            stream.last_time, stream.last_power = now, power
+        elif self._power_field in record and stream.last_power is not None:
+            # a missing value ends the integration like a gap
+            stream.last_time = stream.last_power = None
+            self.gaps += 1
+            energy['gaps'] += 1
+
+    def _emit_window(self, device, group, size, window):
+        self.windows += 1
+        self._forward(window.record(device, group, size, self._power_field in window.fields))
+
+    def _check_energy(self, record):
+        counter = record.get('total_yield')
+        if counter is None:
+            counter = record.get('daily_yield')
+        if counter is None:
+            return
+        device = record.get('device')
+        energy = self._energy.setdefault(device, {'total': 0.0, 'gaps': 0, 'checkpoint': None})
+        checkpoint = energy['checkpoint']
+        energy['checkpoint'] = (counter, energy['total'], energy['gaps'])
+        if checkpoint is None or counter < checkpoint[0]:
+            # first counter record or daily_yield reset at midnight
+            return
+        counter_energy = counter - checkpoint[0]
+        integrated_energy = (energy['total'] - checkpoint[1]) / 3600
+        deviation = (integrated_energy - counter_energy) / counter_energy if counter_energy else None
+        complete = energy['gaps'] == checkpoint[2]
+        self.checks += 1
+        if complete and deviation is not None and abs(deviation) > self._tolerance:
+            self.mismatches += 1
+        self._forward({'timestamp': record['timestamp'], 'device': device, 'group': 'energy_check', \
+                       'counter_energy': counter_energy, 'integrated_energy': round(integrated_energy, 3), \
+                       'deviation': None if deviation is None else round(deviation, 4), 'complete': complete})
+
+    def flush(self):
+        """Forward the open windows, e.g. before shutdown"""
+        for (device, group), stream in self._streams.items():
+            for size, window in stream.windows.items():
+                self._emit_window(device, group, size, window)
+            stream.windows.clear()
+
+    def stats(self) -> dict:
+        """Return the counters of the aggregator"""
+        return {'samples': self.samples, 'windows': self.windows, 'gaps': self.gaps, \
+                'checks': self.checks, 'mismatches': self.mismatches}
@@ -0,0 +1,343 @@
+"""Class for asynchronous SMA Modbus Connection"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from pymodbus.client import AsyncModbusTcpClient as AsyncModBusClient
+from pymodbus import (FramerType, ExceptionResponse, ModbusException)
+from .instrumentation import OK, EXCEPTION_RESPONSE, ERROR, NO_CONNECTION, CIRCUIT_OPEN
+from .modbus_constants import ModbusConstants as CONSTS
+from .read_planner import DEFAULT_MAX_GAP
+from .register_map import compile_plan
+from .sma_modbus import SmaModbus, SunnyBoySnapshot, decode_block, exception_outcome
+
+
+class AsyncSmaModbus:
+    """Base class for SMA Modbus with TCP on asyncio
+
+    The connection is not established in the constructor,
+    call 'await connect()' or use the object as async context manager.
+    """
+    def __init__(self, ip, port = 502, device_unit_id = 3, timeout = 3, retries = 3, health = None):
+        """Constructor of async modbus object
+
+        Keyword arguments:
+
+        ip -- ip address of device
+
+        port -- port of device (default 502)
+
+        device_unit_id -- UnitID (default 3)
+
+        timeout -- timeout of connect and requests in seconds (default 3)
+
+        retries -- number of retries of a request (default 3)
+
+        health -- DeviceHealth for adaptive timeouts and circuit breaker (default None)
+
+        """
+        self._client = AsyncModBusClient(ip, port=port, framer=FramerType.SOCKET, \
+                                         timeout=timeout, retries=retries)
+        self._health = health
+        self._ip = ip
+        self._port = port
+        self._device_unit_id = device_unit_id
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._ip!r}, port={self._port}, device_unit_id={self._device_unit_id})'
+
+    @property
+    def ip(self):
+        """ip address of device"""
+        return self._ip
+
+    @property
+    def port(self):
+        """port of device"""
+        return self._port
+
+    @property
+    def device_unit_id(self):
+        """UnitID of device"""
+        return self._device_unit_id
+
+    @property
+    def connected(self) -> bool:
+        """True if the client is connected"""
+        return self._client.connected
+
+    @property
+    def health(self):
+        """DeviceHealth of device or None"""
+        return self._health
+
+    @health.setter
+    def health(self, health):
+        self._health = health
+
+    async def read_device_unit_id(self):
+        """Read the device unit id
+
+        see SmaModbus.read_device_unit_id
+        ---
+        Register: 42109; U32, U16, U16
+        """
+        try:
+            readings = await self._client.read_holding_registers(42109, count=4, slave=1)
+        except ModbusException as exc:
+            print(f">>> read_device_unit_id: Received ModbusException({exc}) from library")
+            return False
+        if readings.isError():
+            print(f">>> read_device_unit_id: Received Modbus library error({readings})")
+            return False
+        unit_id = self.convert_registers(readings.registers, 'U16')[3]
+        return unit_id
+
+    async def connect(self) -> bool:
+        """Establish connection of client
+
+        -----
+        Returns:
+            True if connected, False otherwise
+        """
+        health = self._health
+        if health is not None:
+            if not health.ready():
+                return False
+            self._client.comm_params.timeout_connect = health.timeout
+        tic = time.perf_counter()
+        try:
+            if not await self._client.connect():
+                print(f"ERROR: client cannot connect to ModBus-Server {self._ip}:{self._port}!")
+                if health is not None:
+                    health.record(time.perf_counter() - tic, NO_CONNECTION)
+                return False
+        except Exception as exc:
+            print(f"ERROR: received an exception {exc}! Probably an Syntax Error!")
+            if health is not None:
+                health.record(time.perf_counter() - tic, NO_CONNECTION)
+            return False
+        return True
+
+    def close(self):
+        """Close connection of client
+        """
+        if self._client.connected:
+            self._client.close()
+        return None
+
+    async def read_register_block(self, register_address, count):
+        """Read a block of raw holding registers from SMA device
+
+        Keyword arguments:
+
+        register_address -- number of first register address
+
+        count -- number of registers (16 bit words) to read
+
+        -----
+        Returns:
+            list of register values if successful, False otherwise
+        --
+        Function code : 0x03
+        """
+        registers = await self.request_register_block(register_address, count)
+        return registers if isinstance(registers, list) else False
+
+    async def request_register_block(self, register_address, count):
+        """Read a block of raw holding registers, see SmaModbus.request_register_block
+
+        The DeviceHealth gets the outcome of the request, after the
+        response is classified.
+
+        -----
+        Returns:
+            list of register values if successful, the outcome otherwise,
+            see instrumentation (e.g. EXCEPTION_RESPONSE, TIMEOUT)
+        """
+        health = self._health
+        if health is None:
+            return await self._request(register_address, count, None)
+        if not health.allow():
+            return CIRCUIT_OPEN
+        tic = time.perf_counter()
+        registers = await self._request(register_address, count, health.timeout)
+        health.record(time.perf_counter() - tic, OK if isinstance(registers, list) else registers)
+        return registers
+
+    async def _request(self, register_address, count, timeout):
+        """Send a read request, return the registers or the outcome of a failed request
+
+        timeout -- timeout of the request in s, None for the timeout of the client
+        """
+        if timeout is not None:
+            # pymodbus reads the timeout of every request from the parameters of the client,
+            # the health decides instead of the retries
+            self._client.comm_params.timeout_connect = timeout
+            self._client.ctx.retries = 0
+        try:
+            result = await self._client.read_holding_registers(register_address, \
+                count=count, slave=self._device_unit_id)
+        except ModbusException as exc:
+            print(f">>> read_holding_register: Received ModbusException({exc}) from library")
+            return exception_outcome(exc)
+        if isinstance(result, ExceptionResponse):
+            print(f">>> read_holding_register: Received Modbus library exception ({result})")
+            # THIS IS NOT A PYTHON EXCEPTION, but a valid modbus message
+            return EXCEPTION_RESPONSE
+        if result.isError():
+            print(f">>> read_holding_register: Received Modbus library error({result})")
+            return ERROR
+        return result.registers
+
+    async def read_holding_register(self, register_address, datatype, count = 1):
+        """Read the holding register from SMA device
+
+        Keyword arguments:
+
+        register_address -- number of register address
+
+        datatype -- U8, U16, U32, etc...
+
+        count -- number of datatypes to read (default 1)
+
+        --
+        Function code : 0x03
+        """
+        length = CONSTS.TYPE_TO_LENGTH[datatype] * count
+        registers = await self.read_register_block(register_address, length)
+        if registers is False:
+            return False
+        return self.convert_registers(registers, datatype)
+
+    convert_registers = staticmethod(SmaModbus.convert_registers)
+
+
+class AsyncSunnyBoy(AsyncSmaModbus):
+    """class for the asynchronous connection to the SMA SunnyBoy by Modbus.
+
+    Same getters as SunnyBoy, all of them are coroutines.
+    """
+    # Capabilities of the device, e.g. of a profiles.CapabilityCache; read_snapshot
+    # reads only the supported fields then, see SunnyBoy.detect_capabilities
+    capabilities = None
+
+    async def read_value(self, name):
+        """Read a single value of the register map
+
+        Keyword arguments:
+
+        name -- field name, see register_map.REGISTER_MAP
+
+        -----
+        Returns:
+            converted value if successful, False otherwise
+        """
+        plan, = compile_plan(frozenset((name,)), 0)
+        registers = await self.read_register_block(plan.start, plan.count)
+        if registers is False:
+            return False
+        values = decode_block(plan, registers)
+        if values is False:
+            return False
+        return values[name]
+
+    async def read_snapshot(self, fields = None, max_gap = DEFAULT_MAX_GAP) -> SunnyBoySnapshot:
+        """Read several values with a minimal number of modbus requests
+
+        see SunnyBoy.read_snapshot
+        """
+        names = SunnyBoySnapshot.field_names(fields)
+        values = {}
+        if self.capabilities is not None:
+            plans = self.capabilities.plan(names, max_gap)
+        else:
+            plans = compile_plan(names, max_gap)
+        for plan, registers in zip(plans, await self.read_plan_registers(plans)):
+            if registers is not False:
+                decode_block(plan, registers, values)
+        return SunnyBoySnapshot(time.time(), **values)
+
+    async def read_plan_registers(self, plans) -> list:
+        """Read the raw registers of the blocks of a decode plan
+
+        Keyword arguments:
+
+        plans -- tuple of BlockPlan, see register_map.compile_plan
+
+        -----
+        Returns:
+            list of raw register lists, False for each failed read
+        """
+        return [await self.read_register_block(plan.start, plan.count) for plan in plans]
+
+    async def get_device_class(self) -> str:
+        """Read the device class; Register address: 30051; U32"""
+        return await self.read_value('device_class')
+
+    async def get_device_type(self) -> str:
+        """Read the device type; Register address: 30053; U32"""
+        return await self.read_value('device_type')
+
+    async def get_serial_number(self) -> int:
+        """Read the serial number; Register address: 30057; U32"""
+        return await self.read_value('serial_number')
+
+    async def get_software_packet(self) -> int:
+        """Read the software packet information; Register address: 30059; U32"""
+        return await self.read_value('software_packet')
+
+    async def get_status_of_device(self) -> str:
+        """Read the device status; Register address: 30201; U32"""
+        return await self.read_value('status_of_device')
+
+    async def get_grid_relay_status(self) -> str:
+        """Read the status of the grid relay/contact; Register address: 30217; U32"""
+        return await self.read_value('grid_relay_status')
+
+    async def get_derating(self) -> str:
+        """Read the derating state of the device; Register address: 30219; U32"""
+        return await self.read_value('derating')
+
+    async def get_total_yield(self) -> int:
+        """Read the total yield in Wh; Register address: 30513; U64"""
+        return await self.read_value('total_yield')
+
+    async def get_daily_yield(self) -> int:
+        """Read the daily yield in Wh; Register address: 30517; U64"""
+        return await self.read_value('daily_yield')
+
+    async def get_operating_time(self) -> int:
+        """Read the operating time in s; Register address: 30521; U64"""
+        return await self.read_value('operating_time')
+
+    async def get_feed_in_time(self) -> int:
+        """Read the feed-in time in s; Register address: 30525; U64"""
+        return await self.read_value('feed_in_time')
+
+    async def get_dc_current_in(self) -> float:
+        """Read the incoming dc current in A; Register address: 30769; S32"""
+        return await self.read_value('dc_current_in')
+
+    async def get_dc_voltage_in(self) -> float:
+        """Read the incoming dc voltage in V; Register address: 30771; S32"""
+        return await self.read_value('dc_voltage_in')
+
+    async def get_dc_power_in(self):
+        """Read the incoming dc power in W; Register address: 30773; S32"""
+        return await self.read_value('dc_power_in')
+
+    async def get_active_power(self) -> tuple:
+        """Read the active power of sum, L1, L2, L3 in kW; Register address: 30775; 4 x S32"""
+        return await self.read_value('active_power')
+
+    async def get_ac_current(self) -> tuple:
+        """Read the actual current of phases L1, L2, L3 in A; Register address: 30977; 3 x S32"""
+        return await self.read_value('ac_current')
@@ -0,0 +1,315 @@
+"""module to benchmark polling, decoding and storing against simulated devices"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+from .register_map import REGISTER_MAP, SNAPSHOT_PLAN
+from .simulator import SimulatorSettings, SimulatorThread
+from .sma_modbus import SunnyBoy
+
+GETTERS = ('get_device_class', 'get_device_type', 'get_serial_number', 'get_software_packet', \
+           'get_status_of_device', 'get_grid_relay_status', 'get_derating', \
+           'get_total_yield', 'get_daily_yield', 'get_operating_time', 'get_feed_in_time', \
+           'get_dc_current_in', 'get_dc_voltage_in', 'get_dc_power_in', \
+           'get_active_power', 'get_ac_current')
+
+# result keys where a higher value is better, all others are durations
+HIGHER_IS_BETTER = ('per_s',)
+
+# max ms a one-shot 'python -m sma_modbus get' may take longer than the bare interpreter
+STARTUP_BUDGET_MS = 75.0
+
+
+def percentiles(samples) -> dict:
+    """Return p50, p90, p99 and max of duration samples in ms"""
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+
+    def pick(fraction):
+        return round(ordered[min(last, int(round(fraction * last)))] * 1000, 4)
+    return {'p50_ms': pick(0.50), 'p90_ms': pick(0.90), 'p99_ms': pick(0.99), 'max_ms': pick(1.0)}
+
+
+def _timed(function, repeat) -> list:
+    samples = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - tic)
+    return samples
+
+
+def bench_getters(host, port, repeat) -> dict:
+    """Latency percentiles of every getter"""
+    sunny_obj = SunnyBoy(host, port)
+    results = {name: percentiles(_timed(getattr(sunny_obj, name), repeat)) for name in GETTERS}
+    sunny_obj.close()
+    return results
+
+
+def bench_snapshot(host, port, repeat) -> dict:
+    """Latency of a full snapshot, by read_snapshot and by calling all getters"""
+    sunny_obj = SunnyBoy(host, port)
+    results = {'read_snapshot': percentiles(_timed(sunny_obj.read_snapshot, repeat)), \
+               'all_getters': percentiles(_timed( \
+                   lambda: [getattr(sunny_obj, name)() for name in GETTERS], repeat))}
+    sunny_obj.close()
+    return results
+
+
+def bench_fleet(host, port, sizes, repeat) -> dict:
+    """Sweep time of the FleetPoller for several fleet sizes"""
+    from .async_sma_modbus import AsyncSunnyBoy
+    from .fleet_poller import FleetPoller
+
+    async def sweep(size):
+        devices = [AsyncSunnyBoy(host, port + index) for index in range(size)]
+        # all simulated devices share one ip, so the per host limit must not serialize them
+        poller = FleetPoller(devices, max_in_flight=size, max_per_host=size)
+        await poller.poll()
+        samples = []
+        for _ in range(repeat):
+            await poller.poll()
+            samples.append(poller.last_sweep_time)
+        poller.close()
+        return samples
+
+    return {f'devices_{size}': percentiles(asyncio.run(sweep(size))) for size in sizes}
+
+
+def bench_gateway(host, port, units, repeat) -> dict:
+    """Sweep time of many unit ids behind one port, one request at a time and pipelined"""
+    from .async_sma_modbus import AsyncSunnyBoy
+    from .gateway import GatewayClient
+    unit_ids = range(3, 3 + units)
+
+    async def sequential():
+        devices = [AsyncSunnyBoy(host, port, device_unit_id=unit_id) for unit_id in unit_ids]
+        for device in devices:
+            await device.connect()
+        samples = []
+        for _ in range(repeat):
+            tic = time.perf_counter()
+            for device in devices:
+                await device.read_snapshot()
+            samples.append(time.perf_counter() - tic)
+        for device in devices:
+            device.close()
+        return samples
+
+    async def pipelined():
+        samples = []
+        async with GatewayClient(host, port) as gateway:
+            for _ in range(repeat):
+                tic = time.perf_counter()
+                await gateway.read_snapshots(unit_ids)
+                samples.append(time.perf_counter() - tic)
+        return samples
+
+    return {f'sequential_{units}': percentiles(asyncio.run(sequential())), \
+            f'pipelined_{units}': percentiles(asyncio.run(pipelined()))}
+
+
+def bench_control(host, port, repeat) -> dict:
+    """Duration of control cycles of the PowerLimitController, with a write and coalesced"""
+    from .power_control import PowerLimitController
+    sunny_obj = SunnyBoy(host, port)
+    # an alternating grid power changes the limit in every cycle
+    grid_power = itertools.cycle((200.0, -200.0))
+    writing = PowerLimitController(sunny_obj, lambda: next(grid_power))
+    writing.prepare()
+    # every limit but the first is coalesced
+    coalescing = PowerLimitController(sunny_obj, lambda: 0.0, min_change=float('inf'), refresh=float('inf'))
+    results = {'cycle_write': percentiles(_timed(writing.step, repeat)), \
+               'cycle_coalesced': percentiles(_timed(coalescing.step, repeat))}
+    writing.release()
+    sunny_obj.close()
+    return results
+
+
+def bench_startup(host, port, repeat) -> dict:
+    """Wall time of new interpreters: bare, importing the package and one-shot get commands
+
+    cli_get_overhead_ms is the p50 of 'python -m sma_modbus get' minus the
+    p50 of the bare interpreter, it is checked against the startup budget.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (root, os.environ.get('PYTHONPATH')))))
+    commands = {'interpreter': ('-c', 'pass'), \
+                'import_package': ('-c', 'import sma_modbus'), \
+                'import_sunnyboy': ('-c', 'from sma_modbus import SunnyBoy'), \
+                'cli_get': ('-m', 'sma_modbus', 'get', host, 'total_yield', '--port', str(port))}
+    results = {}
+    for name, arguments in commands.items():
+        results[name] = percentiles(_timed(lambda: subprocess.run((sys.executable,) + arguments, env=env, \
+            stdout=subprocess.DEVNULL, check=True), repeat))
+    results['cli_get_overhead_ms'] = round(results['cli_get']['p50_ms'] - results['interpreter']['p50_ms'], 4)
+    return results
+
+
+def check_budget(report, budget_ms = STARTUP_BUDGET_MS) -> list:
+    """Return the (metric, value, budget) of a report over the startup budget"""
+    overhead = report['results'].get('startup', {}).get('cli_get_overhead_ms')
+    if overhead is None or overhead <= budget_ms:
+        return []
+    return [('startup.cli_get_overhead_ms', overhead, budget_ms)]
+
+
+def bench_decode(host, port, repeat) -> dict:
+    """Decode throughput of raw register buffers, by the decode paths of the clients
+
+    decode_register_readings decodes a read response of 124 registers as
+    62 U32 values, decode_block decodes the blocks of the snapshot plan
+    like read_snapshot does.
+    """
+    sunny_obj = SunnyBoy(host, port)
+    generator = random.Random(1)
+    readings = SimpleNamespace(registers=[generator.randrange(0x10000) for _ in range(124)])
+    tic = time.perf_counter()
+    for _ in range(repeat):
+        sunny_obj.decode_register_readings(readings, 'U32', 62)
+    readings_time = time.perf_counter() - tic
+    blocks = [(plan, [generator.randrange(0x8000) for _ in range(plan.count)]) for plan in SNAPSHOT_PLAN]
+    for register in REGISTER_MAP.values():
+        # valid enum codes for the enum fields
+        for plan, words in blocks:
+            if register.enum is not None and plan.start <= register.address < plan.start + plan.count:
+                code = next(iter(register.enum))
+                words[register.address - plan.start:register.address - plan.start + 2] = \
+                    [code >> 16, code & 0xFFFF]
+    snapshot_registers = sum(plan.count for plan in SNAPSHOT_PLAN)
+    tic = time.perf_counter()
+    for _ in range(repeat):
+        values = {}
+        for plan, words in blocks:
+            sunny_obj.decode_block(plan, words, values)
+    plan_time = time.perf_counter() - tic
+    sunny_obj.close()
+    return {'decode_register_readings_u32': {'registers_per_s': round(124 * repeat / readings_time)}, \
+            'snapshot_plan': {'registers_per_s': round(snapshot_registers * repeat / plan_time), \
+                              'snapshots_per_s': round(repeat / plan_time)}}
+
+
+def bench_mariadb(config_path, rows) -> dict:
+    """Insert rate of MariaDBMysql row by row and of the BatchedWriter
+
+    The json config contains the connection 'config' and a 'table' with a float 'column'.
+    """
+    from maria_db_mysql import MariaDBMysql, BatchedWriter
+    with open(config_path, encoding='utf-8') as file:
+        config = json.load(file)
+    database = MariaDBMysql(config['config'])
+    table, column = config['table'], config['column']
+    tic = time.perf_counter()
+    for index in range(rows):
+        database.insert_by_sql_insert_stmt(table, f'`{column}`', index * 0.5)
+    single_time = time.perf_counter() - tic
+    writer = BatchedWriter(database, max_rows=1000, max_delay=3600)
+    tic = time.perf_counter()
+    for index in range(rows):
+        writer.add(table, (column,), (index * 0.5,))
+    writer.close()
+    batched_time = time.perf_counter() - tic
+    return {'insert_by_sql_insert_stmt': {'rows_per_s': round(rows / single_time)}, \
+            'batched_writer': {'rows_per_s': round(rows / batched_time)}}
+
+
+def run(repeat = 200, fleet_sizes = (1, 10, 100), latency = 0.0, port = 15020, \
+        mariadb_config = None, mariadb_rows = 2000, gateway_units = 20) -> dict:
+    """Run the benchmark suite against simulated devices
+
+    Keyword arguments:
+
+    repeat -- number of samples per measurement (default 200)
+
+    fleet_sizes -- numbers of devices for the fleet sweep (default (1, 10, 100))
+
+    latency -- response latency of the simulated devices in s (default 0)
+
+    port -- first port of the simulated devices (default 15020)
+
+    mariadb_config -- json file for the MariaDB benchmark (default None, skipped)
+
+    mariadb_rows -- number of rows inserted by the MariaDB benchmark (default 2000)
+
+    gateway_units -- number of unit ids behind the simulated gateway (default 20)
+
+    -----
+    Returns:
+        dict of results, see save
+    """
+    host = '127.0.0.1'
+    settings = SimulatorSettings(latency=latency, phases=3)
+    results = {}
+    with SimulatorThread(host, port, max(fleet_sizes or (1,)), settings=settings, seed=1):
+        results['getters'] = bench_getters(host, port, repeat)
+        results['snapshot'] = bench_snapshot(host, port, repeat)
+        if fleet_sizes:
+            results['fleet'] = bench_fleet(host, port, fleet_sizes, max(1, repeat // 20))
+        results['control'] = bench_control(host, port, repeat)
+        results['startup'] = bench_startup(host, port, max(3, repeat // 20))
+        results['decode'] = bench_decode(host, port, repeat * 50)
+    gateway_port = port + max(fleet_sizes or (1,))
+    with SimulatorThread(host, gateway_port, 1, unit_ids=range(3, 3 + gateway_units), settings=settings, seed=1):
+        results['gateway'] = bench_gateway(host, gateway_port, gateway_units, max(1, repeat // 20))
+    if mariadb_config:
+        results['mariadb'] = bench_mariadb(mariadb_config, mariadb_rows)
+    return {'timestamp': time.time(), \
+            'python': platform.python_version(), \
+            'settings': {'repeat': repeat, 'latency': latency}, \
+            'results': results}
+
+
+def save(report, path):
+    """Save a benchmark report as json"""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+
+def _flatten(results, prefix = '') -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(baseline, report, threshold = 0.10) -> list:
+    """Compare a report with a baseline report
+
+    Keyword arguments:
+
+    baseline -- report dict of the previous version
+
+    report -- report dict of the current version
+
+    threshold -- relative change counted as regression (default 0.10)
+
+    -----
+    Returns:
+        list of (metric, baseline value, current value) of the regressions
+    """
+    old = _flatten(baseline['results'])
+    new = _flatten(report['results'])
+    regressions = []
+    for metric, value in new.items():
+        before = old.get(metric)
+        if not before or not isinstance(value, (int, float)):
+            continue
+        change = (value - before) / before
+        if metric.endswith(HIGHER_IS_BETTER):
+            change = -change
+        if change > threshold:
+            regressions.append((metric, before, value))
+    return regressions
@@ -0,0 +1,267 @@
+"""module to provide a pool of persistent modbus connections"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import contextlib
+import random
+import socket
+import threading
+import time
+from pymodbus.client import ModbusTcpClient as ModBusClient
+from pymodbus import FramerType
+
+
+class _PoolEntry:
+    """Pooled client and its bookkeeping"""
+    __slots__ = ('key', 'client', 'lock', 'users', 'last_used', 'ever_connected', 'failures_in_row', 'retry_at')
+
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        # held for a request and its response, the client has one socket
+        self.lock = threading.RLock()
+        self.users = 0
+        self.last_used = 0.0
+        self.ever_connected = False
+        self.failures_in_row = 0
+        self.retry_at = 0.0
+
+
+class ConnectionPool:
+    """Pool of modbus tcp clients keyed by (ip, port, device unit id)
+
+    Sockets are kept open when a SmaModbus object is closed, so the
+    next object for the same device reuses the connection. Connections
+    idle for a while are probed before reuse. Failed connects are
+    retried with exponential backoff and jitter; while backing off a
+    connect fails immediately instead of blocking the caller.
+
+    All objects of a device share its client, also across threads; a
+    request holds the client exclusively by lease().
+    """
+    def __init__(self, timeout = 3, probe_after = 10.0, backoff_base = 0.5, backoff_max = 60.0, retries = 3):
+        """Constructor of connection pool
+
+        Keyword arguments:
+
+        timeout -- timeout of connect and requests in seconds (default 3)
+
+        probe_after -- idle time in seconds after which a socket is probed before reuse (default 10)
+
+        backoff_base -- delay in seconds after the first failed connect (default 0.5)
+
+        backoff_max -- max delay in seconds between two connects (default 60)
+
+        retries -- number of retries of a request without response (default 3)
+
+        """
+        self._timeout = timeout
+        self._retries = retries
+        self._probe_after = probe_after
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._entries = {}
+        self._by_client = {}
+        self._lock = threading.Lock()
+        self._reconnect_callbacks = []
+        self._reconnects = 0
+        self._failures = 0
+        self._probe_failures = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def acquire(self, ip, port = 502, device_unit_id = 3):
+        """Get the pooled client of a device
+
+        Keyword arguments:
+
+        ip -- ip address of device
+
+        port -- port of device (default 502)
+
+        device_unit_id -- UnitID (default 3)
+
+        -----
+        Returns:
+            ModbusTcpClient, connected if possible
+        """
+        key = (ip, port, device_unit_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                client = ModBusClient(ip, port=port, framer=FramerType.SOCKET, timeout=self._timeout, \
+                                      retries=self._retries)
+                entry = _PoolEntry(key, client)
+                self._entries[key] = entry
+                self._by_client[id(client)] = entry
+            entry.users += 1
+        self.ensure_connected(entry.client)
+        return entry.client
+
+    def release(self, client):
+        """Give a client back to the pool, the socket stays open
+
+        Keyword arguments:
+
+        client -- client returned by acquire
+
+        """
+        with self._lock:
+            entry = self._by_client.get(id(client))
+            if entry is not None and entry.users > 0:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+
+    def invalidate(self, client):
+        """Close the socket of a client after an error, next use reconnects
+
+        Keyword arguments:
+
+        client -- client returned by acquire
+
+        """
+        entry = self._entry(client)
+        if entry is None:
+            client.close()
+            return
+        with entry.lock:
+            client.close()
+
+    def _entry(self, client):
+        with self._lock:
+            return self._by_client.get(id(client))
+
+    @contextlib.contextmanager
+    def lease(self, client):
+        """Use a client exclusively, e.g. for one request and its response
+
+        The client is connected first, see ensure_connected.
+
+        Keyword arguments:
+
+        client -- client returned by acquire
+
+        -----
+        Returns:
+            context manager giving True if connected, False otherwise (also after close)
+        """
+        entry = self._entry(client)
+        if entry is None:
+            yield False
+            return
+        with entry.lock:
+            yield self.ensure_connected(client)
+
+    def add_reconnect_callback(self, callback):
+        """Register a function called with (ip, port, device_unit_id) after every reconnect
+
+        Keyword arguments:
+
+        callback -- function to call, registered once
+
+        """
+        if callback not in self._reconnect_callbacks:
+            self._reconnect_callbacks.append(callback)
+
+    def ensure_connected(self, client) -> bool:
+        """Make sure the client is connected
+
+        Idle sockets are probed first. A closed socket is reconnected
+        unless the device is still in backoff after failed connects.
+
+        Keyword arguments:
+
+        client -- client returned by acquire
+
+        -----
+        Returns:
+            True if connected, False otherwise (also after close)
+        """
+        entry = self._entry(client)
+        if entry is None:
+            return False
+        with entry.lock:
+            return self._connect(entry)
+
+    def _connect(self, entry) -> bool:
+        client = entry.client
+        now = time.monotonic()
+        if client.is_socket_open():
+            if now - entry.last_used < self._probe_after or self._probe(client):
+                entry.last_used = now
+                return True
+            with self._lock:
+                self._probe_failures += 1
+            client.close()
+        if now < entry.retry_at:
+            return False
+        try:
+            connected = client.connect()
+        except Exception as exc:
+            print(f"ERROR: received an exception {exc}!")
+            connected = False
+        if not connected:
+            with self._lock:
+                self._failures += 1
+            delay = min(self._backoff_max, self._backoff_base * 2 ** entry.failures_in_row)
+            # full jitter keeps a fleet of failed devices from reconnecting in lockstep
+            entry.retry_at = now + random.uniform(0, delay)
+            entry.failures_in_row += 1
+            return False
+        entry.failures_in_row = 0
+        entry.retry_at = 0.0
+        entry.last_used = now
+        if entry.ever_connected:
+            with self._lock:
+                self._reconnects += 1
+            for callback in self._reconnect_callbacks:
+                callback(*entry.key)
+        entry.ever_connected = True
+        return True
+
+    @staticmethod
+    def _probe(client) -> bool:
+        """Check without a modbus round trip if the peer closed the socket"""
+        sock = client.socket
+        if sock is None:
+            return False
+        try:
+            sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            # nothing to read and no FIN received, the socket is alive
+            return True
+        except OSError:
+            return False
+        # b'' means the peer closed the connection, unsolicited data is stale
+        return False
+
+    def stats(self) -> dict:
+        """Return statistics of the pool
+
+        -----
+        Returns:
+            dict with number of open, idle and in use connections,
+            and the counters reconnects, failures, probe_failures
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+        open_entries = [entry for entry in entries if entry.client.is_socket_open()]
+        return {'open': len(open_entries), \
+                'idle': sum(1 for entry in open_entries if entry.users == 0), \
+                'in_use': sum(1 for entry in entries if entry.users > 0), \
+                'reconnects': self._reconnects, \
+                'failures': self._failures, \
+                'probe_failures': self._probe_failures}
+
+    def close(self):
+        """Close all connections of the pool
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                entry.client.close()
+            self._entries.clear()
+            self._by_client.clear()
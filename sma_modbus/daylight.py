@@ -0,0 +1,73 @@
+"""module to compute the sun position and to suspend polls at night"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import time
+
+# unix time of the epoch J2000.0, 2000-01-01 12:00 UTC
+_J2000 = 946728000.0
+
+
+def sun_elevation(latitude, longitude, timestamp = None) -> float:
+    """Return the elevation of the sun above the horizon in degrees
+
+    Low precision formulas of the astronomical almanac, good to about
+    one degree, without refraction.
+
+    Keyword arguments:
+
+    latitude -- degrees north
+
+    longitude -- degrees east
+
+    timestamp -- unix time (default now)
+
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    days = (timestamp - _J2000) / 86400.0
+    mean_longitude = (280.460 + 0.9856474 * days) % 360.0
+    mean_anomaly = math.radians((357.528 + 0.9856003 * days) % 360.0)
+    ecliptic_longitude = math.radians(mean_longitude + 1.915 * math.sin(mean_anomaly) \
+                                      + 0.020 * math.sin(2 * mean_anomaly))
+    obliquity = math.radians(23.439 - 0.0000004 * days)
+    declination = math.asin(math.sin(obliquity) * math.sin(ecliptic_longitude))
+    right_ascension = math.atan2(math.cos(obliquity) * math.sin(ecliptic_longitude), \
+                                 math.cos(ecliptic_longitude))
+    sidereal_time = math.radians((280.46061837 + 360.98564736629 * days + longitude) % 360.0)
+    hour_angle = sidereal_time - right_ascension
+    lat = math.radians(latitude)
+    return math.degrees(math.asin(math.sin(lat) * math.sin(declination) + \
+                                  math.cos(lat) * math.cos(declination) * math.cos(hour_angle)))
+
+
+class DaylightSchedule:
+    """Tell if a PV plant at a location can produce, by the elevation of the sun
+
+    Example (PollDaemon configuration):
+        "daylight": {"latitude": 52.5, "longitude": 13.4, "min_elevation": -5,
+                     "groups": ["live"]}
+    """
+    __slots__ = ('latitude', 'longitude', 'min_elevation')
+
+    def __init__(self, latitude, longitude, min_elevation = -5.0):
+        """Constructor of daylight schedule
+
+        Keyword arguments:
+
+        latitude -- degrees north
+
+        longitude -- degrees east
+
+        min_elevation -- sun elevation in degrees below which it is night; below 0 polls
+                         start before sunrise, when the inverters wake up (default -5)
+
+        """
+        self.latitude = latitude
+        self.longitude = longitude
+        self.min_elevation = min_elevation
+
+    def is_daylight(self, timestamp = None) -> bool:
+        """Return True if the sun is above min_elevation"""
+        return sun_elevation(self.latitude, self.longitude, timestamp) >= self.min_elevation
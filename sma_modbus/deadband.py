@@ -0,0 +1,130 @@
+"""module to forward only records with significant changes"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+
+# keys of a record which identify it and are never compared
+RECORD_KEYS = ('timestamp', 'device', 'group')
+
+
+class Deadband:
+    """Absolute and relative deadband of one field
+
+    A value is significant if it differs from the last forwarded value
+    by more than absolute or more than relative * |last value|.
+    """
+    __slots__ = ('absolute', 'relative')
+
+    def __init__(self, absolute = 0.0, relative = 0.0):
+        """Constructor of deadband
+
+        Keyword arguments:
+
+        absolute -- change in the unit of the field (default 0, every change)
+
+        relative -- change relative to the last forwarded value, e.g. 0.02 for 2 % (default 0)
+
+        """
+        self.absolute = absolute
+        self.relative = relative
+
+    def changed(self, last, value) -> bool:
+        """Return True if value differs significantly from last"""
+        if isinstance(value, (tuple, list)):
+            if not isinstance(last, (tuple, list)) or len(last) != len(value):
+                return True
+            return any(self.changed(old, new) for old, new in zip(last, value))
+        if value is None or last is None or isinstance(value, (str, bool)) or isinstance(last, (str, bool)):
+            return value != last
+        return abs(value - last) > max(self.absolute, self.relative * abs(last))
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a deadband from a number (absolute) or a dict with 'absolute' and 'relative'"""
+        if isinstance(config, Deadband):
+            return config
+        if isinstance(config, (int, float)):
+            return cls(absolute=config)
+        return cls(config.get('absolute', 0.0), config.get('relative', 0.0))
+
+
+class DeadbandFilter:
+    """Streaming filter stage forwarding only records with significant changes
+
+    The records of every device and group are compared with the last
+    forwarded record of the same device and group. A record is forwarded
+    if any field changed by more than its deadband, if the set of fields
+    changed, or as heartbeat after max_silence seconds without forwarded
+    record, so a gap in the data always means "no change" and never
+    "no data". Use it as emit function in front of the sinks, e.g.
+    PollDaemon(config, emit=DeadbandFilter(pipeline.emit)).
+    """
+    def __init__(self, forward, deadbands = None, default = 0.0, max_silence = 300.0):
+        """Constructor of deadband filter
+
+        Keyword arguments:
+
+        forward -- function called with every forwarded record
+
+        deadbands -- dict of field name and Deadband, number (absolute) or dict with
+                     'absolute' and 'relative'; None ignores the field (default None)
+
+        default -- deadband of the other fields (default 0, every change is forwarded)
+
+        max_silence -- seconds after which an unchanged record is forwarded as
+                       heartbeat, None disables the heartbeat (default 300)
+
+        """
+        self._forward = forward
+        self._deadbands = {name: None if config is None else Deadband.from_config(config) \
+                           for name, config in (deadbands or {}).items()}
+        self._default = Deadband.from_config(default)
+        self._max_silence = max_silence
+        self._last = {}
+        self.forwarded = 0
+        self.suppressed = 0
+        self.heartbeats = 0
+
+    def __call__(self, record):
+        """Forward the record if it is significant, see class description
+
+        -----
+        Returns:
+            True if the record was forwarded, False if suppressed
+        """
+        key = (record.get('device'), record.get('group'))
+        now = record.get('timestamp')
+        if now is None:
+            now = time.time()
+        last = self._last.get(key)
+        if last is not None and not self._changed(last[1], record):
+            if self._max_silence is None or now - last[0] < self._max_silence:
+                self.suppressed += 1
+                return False
+            self.heartbeats += 1
+        self._last[key] = (now, record)
+        self.forwarded += 1
+        self._forward(record)
+        return True
+
+    def _changed(self, last, record) -> bool:
+        if last.keys() != record.keys():
+            return True
+        for name, value in record.items():
+            if name in RECORD_KEYS:
+                continue
+            deadband = self._deadbands.get(name, self._default)
+            if deadband is not None and deadband.changed(last[name], value):
+                return True
+        return False
+
+    def reset(self):
+        """Forget the last forwarded records, the next record of every device is forwarded
+        """
+        self._last.clear()
+
+    def stats(self) -> dict:
+        """Return the counters of the filter"""
+        return {'forwarded': self.forwarded, 'suppressed': self.suppressed, \
+                'heartbeats': self.heartbeats}
@@ -0,0 +1,188 @@
+"""module to discover SMA devices in a subnet and write a fleet inventory"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import ipaddress
+import json
+import time
+from pymodbus import FramerType, ModbusException
+from pymodbus.client import AsyncModbusTcpClient
+from .register_map import REGISTER_GROUPS, compile_plan
+
+# all identity registers are decoded from one read per unit id
+IDENTITY_PLAN, = compile_plan(frozenset(REGISTER_GROUPS['identity']), 16)
+
+# unit ids of SMA devices behind a gateway, unit 1 answers for the gateway itself
+DEFAULT_UNIT_IDS = range(3, 124)
+
+
+async def port_open(ip, port = 502, timeout = 0.5) -> bool:
+    """Return True if a tcp connect to ip:port succeeds within timeout"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def scan_hosts(network, port = 502, timeout = 0.5, concurrency = 256) -> list:
+    """Scan a network for hosts listening on the modbus port
+
+    Keyword arguments:
+
+    network -- CIDR like '192.168.178.0/24' or a single ip
+
+    port -- tcp port (default 502)
+
+    timeout -- connect timeout per host in s (default 0.5)
+
+    concurrency -- max number of connects at the same time (default 256)
+
+    -----
+    Returns:
+        list of ip strings in order of the network
+    """
+    net = ipaddress.ip_network(network, strict=False)
+    hosts = list(net.hosts()) or [net.network_address]
+    limit = asyncio.Semaphore(concurrency)
+
+    async def probe(ip):
+        async with limit:
+            return await port_open(str(ip), port, timeout)
+
+    found = await asyncio.gather(*(probe(ip) for ip in hosts))
+    return [str(ip) for ip, is_open in zip(hosts, found) if is_open]
+
+
+async def _read_identity(client, unit_id):
+    try:
+        result = await client.read_holding_registers(IDENTITY_PLAN.start, count=IDENTITY_PLAN.count, \
+                                                     slave=unit_id)
+    except ModbusException:
+        return None
+    if result.isError() or len(result.registers) != IDENTITY_PLAN.count:
+        return None
+    return IDENTITY_PLAN.decode(result.registers)
+
+
+async def _read_device_unit_id(client):
+    # register 42109 on unit 1: physical serial number, SusyID, device unit id
+    try:
+        result = await client.read_holding_registers(42109, count=4, slave=1)
+    except ModbusException:
+        return None
+    if result.isError() or len(result.registers) != 4:
+        return None
+    return result.registers[3]
+
+
+async def probe_host(ip, port = 502, unit_ids = None, timeout = 0.5, connections = 4) -> list:
+    """Find the SMA devices of a host and read their identity
+
+    Without unit_ids the device unit id is read from register 42109 of
+    unit 1, which is one request for a single inverter. With unit_ids
+    (e.g. behind a Data Manager) every unit id is probed, spread over
+    a few connections since a gateway answers one request per connection
+    at a time.
+
+    Keyword arguments:
+
+    ip -- ip of the host
+
+    port -- tcp port (default 502)
+
+    unit_ids -- iterable of unit ids to probe (default None, ask unit 1)
+
+    timeout -- timeout per request in s (default 0.5)
+
+    connections -- max number of connections to the host (default 4)
+
+    -----
+    Returns:
+        list of device dicts with ip, port, device_unit_id and the identity fields
+    """
+    async def connect():
+        client = AsyncModbusTcpClient(ip, port=port, framer=FramerType.SOCKET, timeout=timeout, retries=0)
+        if not await client.connect():
+            client.close()
+            return None
+        return client
+
+    client = await connect()
+    if client is None:
+        return []
+    devices = []
+    try:
+        if unit_ids is None:
+            unit_id = await _read_device_unit_id(client)
+            unit_ids = [] if unit_id is None else [unit_id]
+        unit_ids = list(unit_ids)
+        clients = [client]
+        while len(clients) < min(connections, len(unit_ids)):
+            extra = await connect()
+            if extra is None:
+                break
+            clients.append(extra)
+        queue = iter(unit_ids)
+
+        async def worker(worker_client):
+            for unit_id in queue:
+                identity = await _read_identity(worker_client, unit_id)
+                if identity is not None:
+                    devices.append(dict({'ip': ip, 'port': port, 'device_unit_id': unit_id}, **identity))
+
+        try:
+            await asyncio.gather(*(worker(worker_client) for worker_client in clients))
+        finally:
+            for extra in clients[1:]:
+                extra.close()
+    finally:
+        client.close()
+    return sorted(devices, key=lambda device: device['device_unit_id'])
+
+
+async def discover(network, port = 502, unit_ids = None, timeout = 0.5, concurrency = 256, \
+                   connections = 4) -> list:
+    """Scan a network and probe all hosts with an open modbus port
+
+    see scan_hosts and probe_host for the arguments
+
+    -----
+    Returns:
+        list of device dicts in order of ip and unit id
+    """
+    hosts = await scan_hosts(network, port, timeout, concurrency)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def probe(ip):
+        async with limit:
+            return await probe_host(ip, port, unit_ids, timeout, connections)
+
+    found = await asyncio.gather(*(probe(ip) for ip in hosts))
+    return [device for devices in found for device in devices]
+
+
+def save_inventory(devices, path):
+    """Write the discovered devices as inventory file
+
+    The file has the 'devices' list of the poll daemon configuration,
+    with the serial number as name.
+    """
+    inventory = {'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'), \
+                 'devices': [dict(device, name=str(device.get('serial_number') or \
+                                                   f"{device['ip']}:{device['port']}/{device['device_unit_id']}")) \
+                             for device in devices]}
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(inventory, file, indent=2, ensure_ascii=False)
+
+
+def load_inventory(path) -> list:
+    """Return the device list of an inventory file"""
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)['devices']
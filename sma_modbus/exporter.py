@@ -0,0 +1,233 @@
+"""module to export the values of SMA devices for Prometheus"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .deadband import RECORD_KEYS
+from .register_map import REGISTER_MAP
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# label values of the elements of multi value fields
+ELEMENT_LABELS = {'active_power': ('phase', ('total', 'L1', 'L2', 'L3')), \
+                  'ac_current': ('phase', ('L1', 'L2', 'L3'))}
+
+# cumulative statistics of the ConnectionPool, the others are gauges
+CONNECTION_COUNTERS = ('reconnects', 'failures', 'probe_failures')
+
+# upper bounds of the poll latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, like a Prometheus histogram
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Add a value"""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels) -> list:
+        """Return the exposition lines of the histogram"""
+        lines = []
+        total = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {total}')
+        lines.append(f'{name}_sum{_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{_labels(labels)} {self.count}')
+        return lines
+
+
+class MetricsStore:
+    """Latest values of all devices, rendered in the Prometheus text format
+
+    The poll daemon updates the store with every record and every poll
+    duration, scrapes only render the stored values. The text is rendered
+    once per update, repeated scrapes are answered from memory.
+    """
+    def __init__(self, connection_stats = None, instrumentation = None):
+        """Constructor of metrics store
+
+        Keyword arguments:
+
+        connection_stats -- function returning the ConnectionPool stats (default None)
+
+        instrumentation -- Instrumentation of the modbus requests (default None)
+
+        """
+        self._connection_stats = connection_stats
+        self._instrumentation = instrumentation
+        self._values = {}
+        self._polled = {}
+        self._latency = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._text = None
+
+    def update(self, record):
+        """Store the values of a record, usable as emit function of the PollDaemon"""
+        device = record.get('device')
+        with self._lock:
+            for name, value in record.items():
+                if name not in RECORD_KEYS:
+                    self._values[(name, device)] = value
+            self._polled[(device, record.get('group'))] = record.get('timestamp')
+            self._text = None
+
+    def observe(self, device, group, duration, ok):
+        """Store a poll duration, usable as observe function of the PollDaemon"""
+        with self._lock:
+            histogram = self._latency.get((device, group))
+            if histogram is None:
+                histogram = self._latency[(device, group)] = Histogram()
+            histogram.observe(duration)
+            if not ok:
+                self._errors[(device, group)] = self._errors.get((device, group), 0) + 1
+            self._text = None
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text format"""
+        with self._lock:
+            if self._text is None:
+                self._text = self._render()
+            text = self._text
+        # connection and request statistics change without records, they are rendered with every scrape
+        lines = []
+        if self._connection_stats is not None:
+            for name, value in self._connection_stats().items():
+                if name in CONNECTION_COUNTERS:
+                    lines.append(f'# TYPE sma_connection_{name}_total counter\n' \
+                                 f'sma_connection_{name}_total {value}\n')
+                else:
+                    lines.append(f'# TYPE sma_connections_{name} gauge\nsma_connections_{name} {value}\n')
+        if self._instrumentation is not None:
+            lines.append(self._render_requests(self._instrumentation.stats()))
+        return text + ''.join(lines)
+
+    @staticmethod
+    def _render_requests(stats) -> str:
+        lines = ['# HELP sma_requests_total modbus requests by outcome', '# TYPE sma_requests_total counter']
+        counters = dict(stats['counters'])
+        decode_failures = counters.pop('decode_failures')
+        for outcome, count in counters.items():
+            lines.append(f'sma_requests_total{_labels((("outcome", outcome),))} {count}')
+        lines.append('# TYPE sma_decode_failures_total counter')
+        lines.append(f'sma_decode_failures_total {decode_failures}')
+        lines.append('# HELP sma_request_duration_seconds modbus round trip time per device')
+        lines.append('# TYPE sma_request_duration_seconds summary')
+        for device, summary in stats['device'].items():
+            for quantile in ('p50', 'p90', 'p99'):
+                labels = (('device', device), ('quantile', int(quantile[1:]) / 100))
+                lines.append(f'sma_request_duration_seconds{_labels(labels)} {summary[quantile]}')
+            labels = (('device', device),)
+            lines.append(f'sma_request_duration_seconds_sum{_labels(labels)} {summary["sum"]}')
+            lines.append(f'sma_request_duration_seconds_count{_labels(labels)} {summary["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def _render(self) -> str:
+        lines = []
+        families = {}
+        for (name, device), value in self._values.items():
+            families.setdefault(name, []).append((device, value))
+        for name, samples in families.items():
+            register = REGISTER_MAP.get(name)
+            if register is None:
+                continue
+            lines.append(f'# HELP sma_{name} {name} in {register.unit}, register {register.address}')
+            lines.append(f'# TYPE sma_{name} gauge')
+            for device, value in samples:
+                lines.extend(self._samples(name, register, (('device', device),), value))
+        lines.append('# HELP sma_last_poll_timestamp_seconds unix time of the last poll of a register group')
+        lines.append('# TYPE sma_last_poll_timestamp_seconds gauge')
+        for (device, group), timestamp in self._polled.items():
+            labels = (('device', device), ('group', group))
+            lines.append(f'sma_last_poll_timestamp_seconds{_labels(labels)} {timestamp}')
+        lines.append('# HELP sma_poll_duration_seconds duration of the polls of a register group')
+        lines.append('# TYPE sma_poll_duration_seconds histogram')
+        for (device, group), histogram in self._latency.items():
+            lines.extend(histogram.render('sma_poll_duration_seconds', (('device', device), ('group', group))))
+        lines.append('# HELP sma_poll_errors_total polls without any readable value')
+        lines.append('# TYPE sma_poll_errors_total counter')
+        for (device, group), count in self._errors.items():
+            lines.append(f'sma_poll_errors_total{_labels((("device", device), ("group", group)))} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _samples(name, register, labels, value) -> list:
+        if value is None:
+            return []
+        if isinstance(value, tuple):
+            label, names = ELEMENT_LABELS.get(name, ('index', tuple(str(index) for index in range(len(value)))))
+            lines = []
+            for element, item in zip(names, value):
+                if item is not None:
+                    lines.append(f'sma_{name}{_labels(labels + ((label, element),))} {item}')
+            return lines
+        if register.enum is not None:
+            # enum values are exported info style, the text is a label
+            return [f'sma_{name}{_labels(labels + (("state", value),))} 1']
+        return [f'sma_{name}{_labels(labels)} {value}']
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.store.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """HTTP server answering GET /metrics from a MetricsStore
+    """
+    daemon_threads = True
+
+    def __init__(self, store, host = '0.0.0.0', port = 9105):
+        """Constructor of metrics server
+
+        Keyword arguments:
+
+        store -- MetricsStore
+
+        host -- interface to listen on (default '0.0.0.0')
+
+        port -- tcp port (default 9105)
+
+        """
+        self.store = store
+        super().__init__((host, port), _MetricsHandler)
+
+    def start(self) -> threading.Thread:
+        """Serve in a background thread"""
+        thread = threading.Thread(target=self.serve_forever, name='sma-exporter', daemon=True)
+        thread.start()
+        return thread
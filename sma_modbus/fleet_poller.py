@@ -0,0 +1,145 @@
+"""module to poll a fleet of SMA devices concurrently"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from .read_planner import DEFAULT_MAX_GAP
+from .register_map import REGISTER_MAP, compile_plan
+
+
+class FleetPoller:
+    """Poll snapshots of many AsyncSunnyBoy devices concurrently
+
+    The number of requests in flight is limited for the whole fleet
+    and for every host, since several unit ids can share one ip
+    (e.g. behind a SMA Data Manager).
+    """
+    def __init__(self, devices, max_in_flight = 32, max_per_host = 1, \
+                 fields = None, max_gap = DEFAULT_MAX_GAP, health = None):
+        """Constructor of fleet poller
+
+        Keyword arguments:
+
+        devices -- iterable of AsyncSunnyBoy objects
+
+        max_in_flight -- max number of devices polled at the same time (default 32)
+
+        max_per_host -- max number of devices of one ip polled at the same time (default 1)
+
+        fields -- field names to read, see register_map.REGISTER_MAP (default all)
+
+        max_gap -- max number of unused registers read between two fields (default 16)
+
+        health -- dict of DeviceHealth arguments, every device without own DeviceHealth
+                  gets one, so dead devices do not slow down the sweeps (default None)
+
+        """
+        self.devices = list(devices)
+        if health is not None:
+            from .health import DeviceHealth
+            for device in self.devices:
+                if device.health is None:
+                    device.health = DeviceHealth(**health)
+        self.fields = fields
+        self.max_gap = max_gap
+        self._max_in_flight = max_in_flight
+        self._max_per_host = max_per_host
+        self._fleet_limit = None
+        self._host_limits = {}
+        self._decoder = None
+        self.last_sweep_time = None
+
+    def _limits(self, device):
+        # semaphores are created lazily to bind them to the running event loop
+        if self._fleet_limit is None:
+            self._fleet_limit = asyncio.Semaphore(self._max_in_flight)
+        if device.ip not in self._host_limits:
+            self._host_limits[device.ip] = asyncio.Semaphore(self._max_per_host)
+        return self._fleet_limit, self._host_limits[device.ip]
+
+    async def poll_device(self, device):
+        """Poll the snapshot of one device within the in-flight limits
+
+        Keyword arguments:
+
+        device -- AsyncSunnyBoy object
+
+        -----
+        Returns:
+            SunnyBoySnapshot if successful, None otherwise
+        """
+        if device.health is not None and not device.health.ready():
+            # circuit open, no request until the next probe
+            return None
+        fleet_limit, host_limit = self._limits(device)
+        async with host_limit, fleet_limit:
+            if not device.connected and not await device.connect():
+                return None
+            try:
+                return await device.read_snapshot(self.fields, self.max_gap)
+            except Exception as exc:
+                print(f"ERROR: polling {device} failed with {exc!r}")
+                return None
+
+    async def poll(self) -> list:
+        """Poll all devices once
+
+        -----
+        Returns:
+            list of (device, snapshot) tuples in order of devices,
+            snapshot is None if the device could not be polled
+        """
+        tic = time.perf_counter()
+        snapshots = await asyncio.gather(*(self.poll_device(device) for device in self.devices))
+        self.last_sweep_time = time.perf_counter() - tic
+        return list(zip(self.devices, snapshots))
+
+    async def _poll_registers(self, device, plans):
+        if device.health is not None and not device.health.ready():
+            return [False] * len(plans)
+        fleet_limit, host_limit = self._limits(device)
+        async with host_limit, fleet_limit:
+            if not device.connected and not await device.connect():
+                return [False] * len(plans)
+            try:
+                return await device.read_plan_registers(plans)
+            except Exception as exc:
+                print(f"ERROR: polling {device} failed with {exc!r}")
+                return [False] * len(plans)
+
+    async def poll_columns(self):
+        """Poll all devices once and decode the sweep with numpy
+
+        The raw registers of all devices are decoded by a
+        vectorized.VectorDecoder in a few array operations per block,
+        instead of per value in python. Requires numpy.
+
+        -----
+        Returns:
+            numpy structured array with one row per device in order of devices,
+            see vectorized.VectorDecoder; fields of failed reads are NaN
+            (integers register.nan, enums ENUM_NAN)
+        """
+        if self._decoder is None:
+            from .vectorized import VectorDecoder
+            names = frozenset(REGISTER_MAP if self.fields is None else self.fields)
+            self._decoder = VectorDecoder(compile_plan(names, self.max_gap))
+        plans = self._decoder.plans
+        tic = time.perf_counter()
+        reads = await asyncio.gather(*(self._poll_registers(device, plans) for device in self.devices))
+        self.last_sweep_time = time.perf_counter() - tic
+        blocks = []
+        valid = []
+        for index, plan in enumerate(plans):
+            blank = [0] * plan.count
+            column = [read[index] for read in reads]
+            valid.append([registers is not False for registers in column])
+            blocks.append([registers if registers is not False else blank for registers in column])
+        return self._decoder.decode(blocks, valid)
+
+    def close(self):
+        """Close the connections of all devices
+        """
+        for device in self.devices:
+            device.close()
@@ -0,0 +1,330 @@
+"""module to pipeline the requests of many unit ids over one connection to a SMA gateway"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from .async_sma_modbus import AsyncSunnyBoy
+from .instrumentation import TIMEOUT, EXCEPTION_RESPONSE, ERROR, NO_CONNECTION
+from .mbap import MBAP, frame, read_request, decode_read_response
+from .read_planner import DEFAULT_MAX_GAP
+from .register_map import compile_plan
+from .sma_modbus import SunnyBoySnapshot, decode_block
+
+
+class GatewayClient:
+    """Modbus TCP client keeping several requests of any unit ids in flight on one socket
+
+    A SMA Data Manager or Cluster Controller serves many inverters on one
+    ip with different unit ids and accepts only a few connections. The
+    requests are written without waiting for the previous response, every
+    request has its own MBAP transaction id and the responses are matched
+    by it as they arrive, in any order. A sweep over N unit ids takes
+    about one round trip plus the processing time of the gateway instead
+    of N round trips.
+
+    The connection is not established in the constructor,
+    call 'await connect()' or use the object as async context manager.
+    """
+    def __init__(self, ip, port = 502, timeout = 3, max_in_flight = 16):
+        """Constructor of gateway client
+
+        Keyword arguments:
+
+        ip -- ip address of gateway
+
+        port -- port of gateway (default 502)
+
+        timeout -- timeout of connect and requests in seconds (default 3)
+
+        max_in_flight -- max number of requests sent without response (default 16)
+
+        """
+        self._ip = ip
+        self._port = port
+        self._timeout = timeout
+        self._max_in_flight = max_in_flight
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._pending = {}
+        self._next_tid = 0
+        self._slots = None
+        self._connect_lock = None
+        self.requests = 0
+        self.timeouts = 0
+        # responses dropped since their unit id differs from the one of the request
+        self.mismatches = 0
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._ip!r}, port={self._port})'
+
+    @property
+    def ip(self):
+        """ip address of gateway"""
+        return self._ip
+
+    @property
+    def port(self):
+        """port of gateway"""
+        return self._port
+
+    @property
+    def connected(self) -> bool:
+        """True if the client is connected"""
+        return self._writer is not None and not self._writer.is_closing()
+
+    @property
+    def in_flight(self) -> int:
+        """number of requests waiting for their response"""
+        return len(self._pending)
+
+    async def connect(self) -> bool:
+        """Establish connection of client, concurrent calls share one connect
+
+        -----
+        Returns:
+            True if connected, False otherwise
+        """
+        # asyncio objects are created lazily to bind them to the running event loop
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self._max_in_flight)
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            try:
+                self._reader, self._writer = await asyncio.wait_for( \
+                    asyncio.open_connection(self._ip, self._port), self._timeout)
+            except (OSError, asyncio.TimeoutError) as exc:
+                print(f"ERROR: client cannot connect to ModBus-Server {self._ip}:{self._port}! ({exc!r})")
+                return False
+            self._receiver = asyncio.ensure_future(self._receive(self._reader))
+        return True
+
+    def close(self):
+        """Close connection of client, pending requests fail
+        """
+        if self._receiver is not None:
+            self._receiver.cancel()
+            self._receiver = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending(ConnectionError('connection closed'))
+        return None
+
+    def _fail_pending(self, exc):
+        for _, future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+
+    async def _receive(self, reader):
+        """Match the responses by transaction id and unit id until the connection ends"""
+        try:
+            while True:
+                header = await reader.readexactly(MBAP.size)
+                tid, _, length, unit_id = MBAP.unpack(header)
+                if length < 1:
+                    raise ConnectionError(f'invalid frame length {length}')
+                pdu = await reader.readexactly(length - 1)
+                pending = self._pending.get(tid)
+                # responses of timed out requests are dropped
+                if pending is None:
+                    continue
+                if pending[0] != unit_id:
+                    self.mismatches += 1
+                    print(f">>> request: response of unit {unit_id} to a request of unit {pending[0]} dropped")
+                    continue
+                del self._pending[tid]
+                if not pending[1].done():
+                    pending[1].set_result(pdu)
+        except asyncio.CancelledError:
+            raise
+        except (OSError, asyncio.IncompleteReadError) as exc:
+            print(f"ERROR: connection to {self._ip}:{self._port} lost ({exc!r})")
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._fail_pending(ConnectionError(f'connection to {self._ip}:{self._port} lost'))
+
+    def _transaction_id(self) -> int:
+        self._next_tid = self._next_tid % 0xFFFF + 1
+        while self._next_tid in self._pending:
+            self._next_tid = self._next_tid % 0xFFFF + 1
+        return self._next_tid
+
+    async def request(self, unit_id, pdu, timeout = None) -> bytes:
+        """Send a request pdu and wait for the response pdu
+
+        Keyword arguments:
+
+        unit_id -- UnitID of the device behind the gateway
+
+        pdu -- function code and data of the request
+
+        timeout -- timeout of the response in s (default None, timeout of the client)
+
+        -----
+        Returns:
+            response pdu, None on timeout or lost connection
+        """
+        if not self.connected and not await self.connect():
+            return None
+        async with self._slots:
+            tid = self._transaction_id()
+            future = asyncio.get_running_loop().create_future()
+            self._pending[tid] = (unit_id, future)
+            self.requests += 1
+            try:
+                self._writer.write(frame(tid, unit_id, pdu))
+                response = await asyncio.wait_for(future, self._timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                print(f">>> request: no response of unit {unit_id} from {self._ip}:{self._port}")
+                return None
+            except (ConnectionError, AttributeError):
+                return None
+            finally:
+                self._pending.pop(tid, None)
+        return response
+
+    async def read_register_block(self, register_address, count, unit_id):
+        """Read a block of raw holding registers from a device behind the gateway
+
+        Keyword arguments:
+
+        register_address -- number of first register address
+
+        count -- number of registers (16 bit words) to read
+
+        unit_id -- UnitID of the device
+
+        -----
+        Returns:
+            list of register values if successful, False otherwise
+        --
+        Function code : 0x03
+        """
+        registers = await self.request_register_block(register_address, count, unit_id)
+        return registers if isinstance(registers, list) else False
+
+    async def request_register_block(self, register_address, count, unit_id, timeout = None):
+        """Read a block of raw holding registers, see read_register_block
+
+        -----
+        Returns:
+            list of register values if successful, the outcome otherwise,
+            see instrumentation (e.g. EXCEPTION_RESPONSE, TIMEOUT)
+        """
+        response = await self.request(unit_id, read_request(register_address, count), timeout)
+        if response is None:
+            return TIMEOUT if self.connected else NO_CONNECTION
+        registers = decode_read_response(response, count)
+        if registers == EXCEPTION_RESPONSE:
+            print(f">>> read_holding_register: Received Modbus exception code {response[1]} of unit {unit_id}")
+        elif registers == ERROR:
+            print(f">>> read_holding_register: Received malformed response of unit {unit_id}")
+        return registers
+
+    async def read_snapshots(self, unit_ids, fields = None, max_gap = DEFAULT_MAX_GAP) -> dict:
+        """Read snapshots of several devices, all requests are pipelined
+
+        Keyword arguments:
+
+        unit_ids -- iterable of UnitIDs
+
+        fields -- field names to read, see register_map.REGISTER_MAP (default all)
+
+        max_gap -- max number of unused registers read between two fields (default 16)
+
+        -----
+        Returns:
+            dict of UnitID and SunnyBoySnapshot, missing fields are None
+        """
+        unit_ids = list(unit_ids)
+        plans = compile_plan(SunnyBoySnapshot.field_names(fields), max_gap)
+        reads = await asyncio.gather(*(self.read_register_block(plan.start, plan.count, unit_id) \
+                                       for unit_id in unit_ids for plan in plans))
+        now = time.time()
+        snapshots = {}
+        for index, unit_id in enumerate(unit_ids):
+            values = {}
+            for plan, registers in zip(plans, reads[index * len(plans):(index + 1) * len(plans)]):
+                if registers is not False:
+                    decode_block(plan, registers, values)
+            snapshots[unit_id] = SunnyBoySnapshot(now, **values)
+        return snapshots
+
+    def device(self, device_unit_id = 3, health = None):
+        """Return a GatewaySunnyBoy of a unit id sharing the connection"""
+        return GatewaySunnyBoy(self, device_unit_id, health)
+
+
+class GatewaySunnyBoy(AsyncSunnyBoy):
+    """AsyncSunnyBoy behind a gateway, using the connection of a GatewayClient
+
+    The blocks of a snapshot are requested at the same time. Use it with
+    the FleetPoller with max_per_host of at least the number of unit ids,
+    since the gateway connection is shared, e.g.
+
+        gateway = GatewayClient('192.168.178.30')
+        poller = FleetPoller([gateway.device(unit_id) for unit_id in range(3, 43)], max_per_host=40)
+    """
+    def __init__(self, gateway, device_unit_id = 3, health = None):
+        """Constructor of device behind a gateway
+
+        Keyword arguments:
+
+        gateway -- GatewayClient
+
+        device_unit_id -- UnitID (default 3)
+
+        health -- DeviceHealth of the unit, a unit not answering is skipped (default None)
+
+        """
+        self._gateway = gateway
+        self._client = None
+        self._health = health
+        self._ip = gateway.ip
+        self._port = gateway.port
+        self._device_unit_id = device_unit_id
+
+    @property
+    def connected(self) -> bool:
+        """True if the gateway is connected"""
+        return self._gateway.connected
+
+    async def connect(self) -> bool:
+        """Establish the connection of the gateway, if not connected"""
+        return await self._gateway.connect()
+
+    def close(self):
+        """Close the connection of the gateway, for all devices
+        """
+        self._gateway.close()
+        return None
+
+    async def read_device_unit_id(self):
+        """Read the device unit id, see SmaModbus.read_device_unit_id"""
+        registers = await self._gateway.read_register_block(42109, 4, 1)
+        if registers is False:
+            return False
+        return registers[3]
+
+    async def _request(self, register_address, count, timeout):
+        """Read a block of raw holding registers over the gateway connection"""
+        return await self._gateway.request_register_block(register_address, count, self._device_unit_id, timeout)
+
+    async def read_plan_registers(self, plans) -> list:
+        """Read the raw registers of the blocks of a decode plan, all blocks at the same time"""
+        return list(await asyncio.gather(*(self.read_register_block(plan.start, plan.count) \
+                                           for plan in plans)))
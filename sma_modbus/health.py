@@ -0,0 +1,154 @@
+"""module to adapt the timeouts of a device and to stop polling unresponsive devices"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import math
+import threading
+import time
+from .instrumentation import OK, EXCEPTION_RESPONSE
+
+# states of the circuit breaker
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class DeviceHealth:
+    """Adaptive request timeout and circuit breaker of one device
+
+    The timeout is derived from the round trip times of the last answered
+    requests: multiplier * p99, within min_timeout and max_timeout. Until
+    enough requests are answered max_timeout is used.
+
+    After failure_threshold failed requests in a row (timeout, no
+    connection, library error) the circuit opens: requests fail at once
+    without touching the network. After probe_interval seconds one probe
+    is let through (half open), all other requests fail at once until
+    the probe is answered and the circuit closes, otherwise it opens
+    again with twice the interval, up to max_probe_interval. A probe
+    without outcome (e.g. a cancelled task) is replaced after the
+    interval. A modbus exception response counts as answer, the
+    device is alive. So a sleeping inverter costs a few timeouts when it
+    goes to sleep and one probe per interval during the night.
+    """
+    __slots__ = ('min_timeout', 'max_timeout', 'multiplier', 'failure_threshold', 'probe_interval', \
+                 'max_probe_interval', 'state', 'failures_in_row', 'opened', 'rejected', \
+                 '_rtts', '_timeout', '_interval', '_probe_at', '_clock', '_lock')
+
+    def __init__(self, min_timeout = 0.2, max_timeout = 3.0, multiplier = 4.0, window = 64, \
+                 failure_threshold = 3, probe_interval = 30.0, max_probe_interval = 900.0, \
+                 clock = time.monotonic):
+        """Constructor of device health
+
+        Keyword arguments:
+
+        min_timeout -- lowest adaptive timeout in s (default 0.2)
+
+        max_timeout -- highest timeout in s, used until RTTs are known (default 3)
+
+        multiplier -- timeout as multiple of the p99 round trip time (default 4)
+
+        window -- number of recent round trip times kept (default 64)
+
+        failure_threshold -- failed requests in a row opening the circuit (default 3)
+
+        probe_interval -- seconds until the first probe of an open circuit (default 30)
+
+        max_probe_interval -- max seconds between two probes (default 900)
+
+        clock -- monotonic time function (default time.monotonic)
+
+        """
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.multiplier = multiplier
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.state = CLOSED
+        self.failures_in_row = 0
+        self.opened = 0
+        self.rejected = 0
+        self._rtts = collections.deque(maxlen=window)
+        self._timeout = max_timeout
+        self._interval = probe_interval
+        # next probe while open, replacement of a lost probe while half open
+        self._probe_at = 0.0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> float:
+        """timeout of the next request in s"""
+        return self._timeout
+
+    def allow(self) -> bool:
+        """Return True if a request may be sent, False while the circuit is open
+
+        The first call after probe_interval takes the probe, the others
+        return False until the outcome of the probe is recorded.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = self._clock()
+            if now < self._probe_at:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_at = now + self._interval
+            return True
+
+    def ready(self) -> bool:
+        """Return True if allow would let a request through, without taking the probe
+
+        For checks before a poll or a connect, whose requests call allow
+        themselves. A failure recorded after such a check when the probe
+        is due counts as failed probe.
+        """
+        return self.state == CLOSED or self._clock() >= self._probe_at
+
+    def record(self, duration, outcome):
+        """Record the round trip time and the outcome of a request
+
+        Keyword arguments:
+
+        duration -- round trip time in s
+
+        outcome -- outcome of the request, see instrumentation
+
+        """
+        with self._lock:
+            self._record(duration, outcome)
+
+    def _record(self, duration, outcome):
+        if outcome in (OK, EXCEPTION_RESPONSE):
+            self._rtts.append(duration)
+            if len(self._rtts) >= min(10, self._rtts.maxlen):
+                ordered = sorted(self._rtts)
+                p99 = ordered[min(len(ordered) - 1, math.ceil(0.99 * len(ordered)) - 1)]
+                self._timeout = min(self.max_timeout, max(self.min_timeout, self.multiplier * p99))
+            self.failures_in_row = 0
+            self._interval = self.probe_interval
+            self.state = CLOSED
+            return
+        self.failures_in_row += 1
+        if self.state == HALF_OPEN or (self.state == OPEN and self._clock() >= self._probe_at):
+            self._interval = min(self.max_probe_interval, self._interval * 2)
+            self._open()
+        elif self.state == CLOSED and self.failures_in_row >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened += 1
+        self._probe_at = self._clock() + self._interval
+        # the device may answer slower after waking up
+        self._timeout = self.max_timeout
+        self._rtts.clear()
+
+    def stats(self) -> dict:
+        """Return state, timeout and counters"""
+        return {'state': self.state, 'timeout': round(self._timeout, 4), \
+                'failures_in_row': self.failures_in_row, 'opened': self.opened, 'rejected': self.rejected}
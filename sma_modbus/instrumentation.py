@@ -0,0 +1,179 @@
+"""module to instrument the modbus requests of SmaModbus"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import threading
+
+# outcomes of a request passed to the after_request hooks
+OK = 'ok'
+TIMEOUT = 'timeout'
+EXCEPTION_RESPONSE = 'exception_response'
+ERROR = 'error'
+NO_CONNECTION = 'no_connection'
+CIRCUIT_OPEN = 'circuit_open'
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations with fixed memory, like a HDR histogram
+
+    Every power of two between the lowest and the highest trackable value
+    is split into sub_buckets linear buckets, so every recorded value is
+    off by less than 1 / sub_buckets of itself. Values outside the range
+    are counted in the first or last bucket, max and min stay exact.
+    """
+    __slots__ = ('lowest', 'sub_buckets', 'counts', 'count', 'sum', 'min', 'max', '_octaves')
+
+    def __init__(self, lowest = 1e-6, highest = 100.0, sub_buckets = 16):
+        """Constructor of latency histogram
+
+        Keyword arguments:
+
+        lowest -- lowest trackable duration in s (default 1 us)
+
+        highest -- highest trackable duration in s (default 100 s)
+
+        sub_buckets -- linear buckets per power of two, the relative precision (default 16)
+
+        """
+        self.lowest = lowest
+        self.sub_buckets = sub_buckets
+        self._octaves = max(1, math.ceil(math.log2(highest / lowest)))
+        self.counts = [0] * (self._octaves * sub_buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value) -> int:
+        if value <= self.lowest:
+            return 0
+        mantissa, exponent = math.frexp(value / self.lowest)
+        # value / lowest = mantissa * 2 ** exponent with 0.5 <= mantissa < 1
+        index = (exponent - 1) * self.sub_buckets + int((mantissa * 2 - 1) * self.sub_buckets)
+        return min(index, len(self.counts) - 1)
+
+    def _value(self, index) -> float:
+        """Upper bound of a bucket"""
+        octave, sub = divmod(index, self.sub_buckets)
+        return self.lowest * 2 ** octave * (1 + (sub + 1) / self.sub_buckets)
+
+    def record(self, value):
+        """Record a duration in s"""
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent) -> float:
+        """Return the duration below which percent of the recorded durations are
+
+        Keyword arguments:
+
+        percent -- 0 to 100
+
+        -----
+        Returns:
+            duration in s, 0 if nothing is recorded
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(percent / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        """Add the counts of another histogram with the same layout"""
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def summary(self) -> dict:
+        """Return count, sum, mean and percentiles in s"""
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else 0.0, \
+                'p50': self.percentile(50), 'p90': self.percentile(90), \
+                'p99': self.percentile(99), 'max': self.max}
+
+
+class Instrumentation:
+    """Hooks, latency histograms and counters of the modbus requests
+
+    Pass one object to any number of SmaModbus objects (instrumentation=).
+    Without it the request path only checks for None. Latencies are kept
+    per device, per register address and per function code, the time of
+    the round trip (incl. pymodbus framing) and of the decoding are kept
+    apart. Hooks are called with
+
+        before_request(device, function_code, address, count)
+        after_request(device, function_code, address, count, duration, outcome)
+
+    device is (ip, port, device_unit_id), outcome one of OK, TIMEOUT,
+    EXCEPTION_RESPONSE, ERROR, NO_CONNECTION or CIRCUIT_OPEN (not sent,
+    see health.DeviceHealth).
+    """
+    def __init__(self, lowest = 1e-6, highest = 100.0, sub_buckets = 16):
+        """Constructor of instrumentation, see LatencyHistogram for the arguments"""
+        self._layout = (lowest, highest, sub_buckets)
+        self._lock = threading.Lock()
+        self.before_request = []
+        self.after_request = []
+        self.by_device = {}
+        self.by_address = {}
+        self.by_function_code = {}
+        self.decode = LatencyHistogram(*self._layout)
+        self.counters = {OK: 0, TIMEOUT: 0, EXCEPTION_RESPONSE: 0, ERROR: 0, NO_CONNECTION: 0, CIRCUIT_OPEN: 0, \
+                         'decode_failures': 0}
+
+    def add_hooks(self, before = None, after = None):
+        """Register functions called before and after every request"""
+        if before is not None:
+            self.before_request.append(before)
+        if after is not None:
+            self.after_request.append(after)
+
+    def request_started(self, device, function_code, address, count):
+        """Call the before_request hooks"""
+        for hook in self.before_request:
+            hook(device, function_code, address, count)
+
+    def request_finished(self, device, function_code, address, count, duration, outcome):
+        """Record the duration of a request and call the after_request hooks"""
+        with self._lock:
+            self.counters[outcome] += 1
+            if outcome not in (NO_CONNECTION, CIRCUIT_OPEN):
+                for table, key in ((self.by_device, device), (self.by_address, address), \
+                                   (self.by_function_code, function_code)):
+                    histogram = table.get(key)
+                    if histogram is None:
+                        histogram = table[key] = LatencyHistogram(*self._layout)
+                    histogram.record(duration)
+        for hook in self.after_request:
+            hook(device, function_code, address, count, duration, outcome)
+
+    def decode_finished(self, duration, ok = True):
+        """Record the duration of a decoding, ok is False if it failed"""
+        with self._lock:
+            self.decode.record(duration)
+            if not ok:
+                self.counters['decode_failures'] += 1
+
+    def stats(self) -> dict:
+        """Return the counters and the latency summaries in s"""
+        with self._lock:
+            return {'counters': dict(self.counters), \
+                    'function_code': {f'0x{code:02x}': histogram.summary() \
+                                      for code, histogram in self.by_function_code.items()}, \
+                    'address': {address: histogram.summary() for address, histogram in self.by_address.items()}, \
+                    'device': {'{}:{}/{}'.format(*device): histogram.summary() \
+                               for device, histogram in self.by_device.items()}, \
+                    'decode': self.decode.summary()}
@@ -0,0 +1,46 @@
+"""module to frame and parse modbus tcp requests of the clients without pymodbus"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import struct
+from .instrumentation import EXCEPTION_RESPONSE, ERROR
+
+# MBAP header: transaction id, protocol id (0), length of unit id and pdu, unit id
+MBAP = struct.Struct('>HHHB')
+READ_REQUEST = struct.Struct('>BHH')
+READ_HOLDING_REGISTERS = 0x03
+
+
+def frame(tid, unit_id, pdu) -> bytes:
+    """Return the MBAP header and the pdu of a request"""
+    return MBAP.pack(tid, 0, len(pdu) + 1, unit_id) + pdu
+
+
+def read_request(register_address, count) -> bytes:
+    """Return the pdu reading count holding registers from register_address"""
+    return READ_REQUEST.pack(READ_HOLDING_REGISTERS, register_address, count)
+
+
+def decode_read_response(pdu, count):
+    """Decode the response pdu of read_request
+
+    Keyword arguments:
+
+    pdu -- function code and data of the response
+
+    count -- number of registers (16 bit words) requested
+
+    -----
+    Returns:
+        list of register values if successful, EXCEPTION_RESPONSE for an
+        exception response (code in pdu[1]), ERROR for a malformed response
+    """
+    if len(pdu) < 2:
+        # every response has a function code and a byte count or exception code
+        return ERROR
+    if pdu[0] & 0x80:
+        # THIS IS NOT A PYTHON EXCEPTION, but a valid modbus message
+        return EXCEPTION_RESPONSE
+    if pdu[0] != READ_HOLDING_REGISTERS or len(pdu) < 2 + 2 * count or pdu[1] != 2 * count:
+        return ERROR
+    return list(struct.unpack(f'>{count}H', pdu[2:2 + 2 * count]))
@@ -8,6 +8,15 @@ class ModbusConstants:
     TYPE_TO_LENGTH = {'U16': 1, 'U32': 2, 'U64': 4, \
                       'S16': 1, 'S32': 2, 'S64': 4}
 
+    TYPE_TO_STRUCT = {'U16': 'H', 'U32': 'I', 'U64': 'Q', \
+                      'S16': 'h', 'S32': 'i', 'S64': 'q'}
+
+    # raw values sent by SMA devices if no value is available
+    NAN_VALUE      = {'U16': 0xFFFF, 'U32': 0xFFFFFFFF, 'U64': 0xFFFFFFFFFFFFFFFF, \
+                      'S16': -0x8000, 'S32': -0x80000000, 'S64': -0x8000000000000000}
+
+    ENUM_NAN       = 0xFFFFFD
+
     DEVICE_CLASS   = {8000: 'Alle Geräte', \
                       8001: 'Solar-Wechselrichter', \
                       8002: 'Wind-Wechselrichter', \
@@ -42,3 +51,8 @@ class ModbusConstants:
     DERATING_STATE  = { 557: 'Temperature derating', \
                        884: 'not active', \
                   16777213: 'information not available'}
+
+    POWER_LIMIT_MODE = { 303: 'Off', \
+                        1077: 'Active power limitation P in W', \
+                        1078: 'Active power limitation P in %', \
+                        1079: 'Limitation P via PV system control'}
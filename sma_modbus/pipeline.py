@@ -0,0 +1,257 @@
+"""module to decouple polling from storage by bounded queues"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import deque
+
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'spill')
+
+
+class BoundedQueue:
+    """Thread safe FIFO queue with a configurable overflow policy
+
+    Overflow policies if the queue is full:
+        block       -- put waits until a consumer makes room
+        drop-oldest -- the oldest record is dropped
+        spill       -- the new record is handed to the spill function
+    """
+    def __init__(self, maxsize = 10000, overflow = 'drop-oldest', spill = None):
+        """Constructor of bounded queue
+
+        Keyword arguments:
+
+        maxsize -- max number of queued records (default 10000)
+
+        overflow -- 'block', 'drop-oldest' or 'spill' (default 'drop-oldest')
+
+        spill -- function called with records that do not fit, required for 'spill'
+
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, not {overflow!r}")
+        if overflow == 'spill' and spill is None:
+            raise ValueError("overflow 'spill' needs a spill function")
+        self._items = deque()
+        self._maxsize = maxsize
+        self._overflow = overflow
+        self._spill = spill
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, record) -> bool:
+        """Queue a record
+
+        Keyword arguments:
+
+        record -- record to queue
+
+        -----
+        Returns:
+            True if queued, False if dropped, spilled or the queue is closed
+        """
+        spill = False
+        with self._lock:
+            if self._closed:
+                return False
+            if len(self._items) >= self._maxsize:
+                if self._overflow == 'block':
+                    while len(self._items) >= self._maxsize and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        return False
+                elif self._overflow == 'drop-oldest':
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    self.spilled += 1
+                    spill = True
+            if not spill:
+                self._items.append(record)
+                self.put_count += 1
+                self.max_depth = max(self.max_depth, len(self._items))
+                self._not_empty.notify()
+        if spill:
+            # outside of the lock, spilling may do slow i/o
+            self._spill(record)
+            return False
+        return True
+
+    def get_batch(self, max_items = 500, timeout = None) -> list:
+        """Take up to max_items records, wait for the first one
+
+        Keyword arguments:
+
+        max_items -- max number of records to return (default 500)
+
+        timeout -- max seconds to wait for a record (default None, forever)
+
+        -----
+        Returns:
+            list of records, empty on timeout or if closed and empty
+        """
+        with self._lock:
+            if not self._items and not self._closed:
+                self._not_empty.wait(timeout)
+            batch = []
+            while self._items and len(batch) < max_items:
+                batch.append(self._items.popleft())
+            if batch:
+                self._not_full.notify_all()
+            return batch
+
+    def close(self):
+        """Refuse new records and wake up all waiting threads
+        """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        """True if the queue is closed"""
+        return self._closed
+
+    def stats(self) -> dict:
+        """Return depth and counters of the queue"""
+        return {'depth': len(self._items), 'max_depth': self.max_depth, \
+                'queued': self.put_count, 'dropped': self.dropped, 'spilled': self.spilled}
+
+
+class SinkStage:
+    """Consumer thread writing the records of its queue to a sink
+
+    A sink is an object with the methods write(records) and close().
+    """
+    def __init__(self, name, sink, queue, batch_size = 500, idle_interval = 1.0):
+        """Constructor of sink stage
+
+        Keyword arguments:
+
+        name -- name of the stage, used in stats
+
+        sink -- object with write(records) and close()
+
+        queue -- BoundedQueue to consume
+
+        batch_size -- max records per write call (default 500)
+
+        idle_interval -- seconds after which an idle sink gets write([]) to flush timers (default 1)
+
+        """
+        self.name = name
+        self.sink = sink
+        self.queue = queue
+        self._batch_size = batch_size
+        self._idle_interval = idle_interval
+        self._thread = threading.Thread(target=self._run, name=f'sink-{name}', daemon=True)
+        self.written = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the consumer thread"""
+        self._thread.start()
+
+    def join(self, timeout = None):
+        """Wait for the consumer thread to drain the queue and end"""
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = self.queue.get_batch(self._batch_size, self._idle_interval)
+            if not batch and self.queue.closed:
+                break
+            try:
+                self.sink.write(batch)
+                self.written += len(batch)
+            except Exception as exc:
+                self.errors += 1
+                print(f"ERROR: sink {self.name} failed with {exc!r}")
+        try:
+            self.sink.close()
+        except Exception as exc:
+            print(f"ERROR: closing sink {self.name} failed with {exc!r}")
+
+    def stats(self) -> dict:
+        """Return queue and write counters of the stage"""
+        stats = self.queue.stats()
+        stats.update({'written': self.written, 'errors': self.errors})
+        return stats
+
+
+class Pipeline:
+    """Fan out records of a producer to several sinks
+
+    Every sink has its own bounded queue and consumer thread, so a slow
+    sink never delays the producer (unless its overflow policy is 'block')
+    nor the other sinks. Pass Pipeline.emit as emit function to the
+    producer, e.g. PollDaemon(config, emit=pipeline.emit).
+    """
+    def __init__(self, sinks, maxsize = 10000, overflow = 'drop-oldest', spill = None, \
+                 batch_size = 500):
+        """Constructor of pipeline
+
+        Keyword arguments:
+
+        sinks -- dict of name and sink object with write(records) and close()
+
+        maxsize -- max number of queued records per sink (default 10000)
+
+        overflow -- 'block', 'drop-oldest' or 'spill' (default 'drop-oldest')
+
+        spill -- function called with records that do not fit, required for 'spill'
+
+        batch_size -- max records per write call (default 500)
+
+        """
+        self._stages = [SinkStage(name, sink, BoundedQueue(maxsize, overflow, spill), batch_size) \
+                        for name, sink in sinks.items()]
+        self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start the consumer threads"""
+        if not self._started:
+            for stage in self._stages:
+                stage.start()
+            self._started = True
+
+    def emit(self, record):
+        """Hand a record to all sinks"""
+        for stage in self._stages:
+            stage.queue.put(record)
+
+    def stop(self, timeout = None):
+        """Close the queues, let the sinks drain them and wait for the threads
+
+        Keyword arguments:
+
+        timeout -- max seconds to wait for every consumer thread (default None, forever)
+
+        """
+        for stage in self._stages:
+            stage.queue.close()
+        if self._started:
+            for stage in self._stages:
+                stage.join(timeout)
+            self._started = False
+
+    def stats(self) -> dict:
+        """Return the statistics of all sink stages"""
+        return {stage.name: stage.stats() for stage in self._stages}
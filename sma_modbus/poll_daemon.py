@@ -0,0 +1,353 @@
+"""module to poll SMA devices continuously by register groups"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import time
+from .connection_pool import ConnectionPool
+from .daylight import DaylightSchedule
+from .health import DeviceHealth
+from .register_map import REGISTER_GROUPS, DEFAULT_INTERVALS
+from .scheduler import Scheduler
+from .sma_modbus import SunnyBoy
+
+
+def load_config(path) -> dict:
+    """Load the json configuration of the poll daemon
+
+    Example:
+        {"devices": [{"ip": "192.168.178.29", "port": 502, "device_unit_id": 3}],
+         "intervals": {"live": 1, "status": 10, "counters": 300, "identity": 0},
+         "stats_interval": 60}
+        "inventory": "inventory.json" adds the devices of an inventory file,
+        relative to the configuration file
+        "capability_cache": "capabilities.json" keeps the supported registers of
+        the devices by serial number, relative to the configuration file
+
+    Keyword arguments:
+
+    path -- path of the json file
+
+    -----
+    Returns:
+        dict of configuration
+    """
+    with open(path, encoding='utf-8') as file:
+        config = json.load(file)
+    if config.get('inventory'):
+        # devices of an inventory file written by 'python -m sma_modbus discover'
+        from .discovery import load_inventory
+        inventory = os.path.join(os.path.dirname(path), config['inventory'])
+        config['devices'] = list(config.get('devices', [])) + load_inventory(inventory)
+    if config.get('capability_cache'):
+        config['capability_cache'] = os.path.join(os.path.dirname(path), config['capability_cache'])
+    if not config.get('devices'):
+        raise ValueError(f'{path}: no devices configured')
+    intervals = dict(DEFAULT_INTERVALS)
+    intervals.update(config.get('intervals', {}))
+    unknown = set(intervals) - set(REGISTER_GROUPS)
+    if unknown:
+        raise ValueError(f'{path}: unknown register groups {sorted(unknown)}')
+    config['intervals'] = intervals
+    return config
+
+
+def build_sink(sink_config):
+    """Create a sink of the pipeline from its configuration
+
+    Keyword arguments:
+
+    sink_config -- dict with 'type' "file" and 'path' or
+                   'type' "mariadb", 'config' (connection) and optional 'max_rows', 'max_delay',
+                   'spool_dir' (keeps rows on disk while the database is unavailable),
+                   'dead_letter' (file of the rows the database rejects), 'max_failures' or
+                   'type' "parquet", 'directory' and optional 'partition' ("hour", "day"),
+                   'batch_size', 'compression', 'grace'
+
+    """
+    from .sinks import FileSink, MariaDBSink, ParquetSink
+    if sink_config['type'] == 'file':
+        return FileSink(sink_config['path'])
+    if sink_config['type'] == 'parquet':
+        return ParquetSink(sink_config['directory'], partition=sink_config.get('partition', 'hour'), \
+                           batch_size=sink_config.get('batch_size', 10000), \
+                           compression=sink_config.get('compression', 'zstd'), \
+                           grace=sink_config.get('grace', 300.0))
+    if sink_config['type'] == 'mariadb':
+        from maria_db_mysql import MariaDBMysql, BatchedWriter, Spool
+        spool = Spool(sink_config['spool_dir']) if sink_config.get('spool_dir') else None
+        writer = BatchedWriter(MariaDBMysql(sink_config['config']), \
+                               max_rows=sink_config.get('max_rows', 1000), \
+                               max_delay=sink_config.get('max_delay', 5.0), spool=spool, \
+                               dead_letter=sink_config.get('dead_letter'), \
+                               max_failures=sink_config.get('max_failures', 3))
+        return MariaDBSink(writer, table=sink_config.get('table'))
+    raise ValueError(f"unknown sink type {sink_config['type']!r}")
+
+
+def build_pipeline(config):
+    """Create the pipeline of the configured sinks
+
+    Example:
+        "queue": {"maxsize": 10000, "overflow": "drop-oldest", "spill_path": "spill.jsonl"},
+        "sinks": {"db": {"type": "mariadb", "config": {...}},
+                  "archive": {"type": "file", "path": "sma.jsonl"}}
+
+    Keyword arguments:
+
+    config -- configuration, see load_config
+
+    -----
+    Returns:
+        Pipeline or None if no sinks are configured
+    """
+    from .pipeline import Pipeline
+    from .sinks import FileSink
+    if not config.get('sinks'):
+        return None
+    queue_config = config.get('queue', {})
+    spill = None
+    if queue_config.get('spill_path'):
+        spill_sink = FileSink(queue_config['spill_path'])
+        spill = lambda record: spill_sink.write([record])
+    sinks = {name: build_sink(sink_config) for name, sink_config in config['sinks'].items()}
+    return Pipeline(sinks, maxsize=queue_config.get('maxsize', 10000), \
+                    overflow=queue_config.get('overflow', 'drop-oldest'), spill=spill)
+
+
+def build_filter(config, forward):
+    """Put the configured deadband filter in front of forward
+
+    Example:
+        "deadband": {"default": 0, "max_silence": 300,
+                     "fields": {"active_power": {"absolute": 0.01, "relative": 0.02},
+                                "dc_voltage_in": 2.0, "operating_time": null}}
+
+    Keyword arguments:
+
+    config -- configuration, see load_config
+
+    forward -- function called with the forwarded records
+
+    -----
+    Returns:
+        DeadbandFilter or forward if no deadband is configured
+    """
+    from .deadband import DeadbandFilter
+    deadband_config = config.get('deadband')
+    if not deadband_config:
+        return forward
+    return DeadbandFilter(forward, deadband_config.get('fields'), deadband_config.get('default', 0.0), \
+                          deadband_config.get('max_silence', 300.0))
+
+
+def build_aggregator(config, forward):
+    """Put the configured aggregation in front of forward
+
+    Example:
+        "aggregate": {"windows": [60, 900], "groups": ["live"], "max_gap": 10, "raw": false}
+
+    Keyword arguments:
+
+    config -- configuration, see load_config
+
+    forward -- function called with the window records and the other records
+
+    -----
+    Returns:
+        Aggregator or forward if no aggregation is configured
+    """
+    from .aggregation import Aggregator
+    aggregate_config = config.get('aggregate')
+    if not aggregate_config:
+        return forward
+    return Aggregator(forward, windows=aggregate_config.get('windows', (60, 900)), \
+                      groups=aggregate_config.get('groups', ('live',)), \
+                      power_field=aggregate_config.get('power_field', 'active_power'), \
+                      max_gap=aggregate_config.get('max_gap', 10.0), raw=aggregate_config.get('raw', False), \
+                      tolerance=aggregate_config.get('tolerance', 0.05))
+
+
+def device_name(device_config) -> str:
+    """Return the name of a device used in the records"""
+    return device_config.get('name') or \
+        f"{device_config['ip']}:{device_config.get('port', 502)}/{device_config.get('device_unit_id', 3)}"
+
+
+def print_record(record):
+    """Write a record as json line to stdout"""
+    print(json.dumps(record), flush=True)
+
+
+class PollDaemon:
+    """Poll register groups of several devices with their own intervals
+
+    Every group of every device is a job of the drift-free scheduler,
+    each poll emits one record dict with 'timestamp', 'device', 'group'
+    and the values of the group.
+
+    Every device has a DeviceHealth (configuration "health", false disables
+    it): the request timeout adapts to the round trip times and a device
+    not answering is skipped until the next probe, so sleeping inverters
+    do not delay the polls of the others. Polls skipped by an open circuit
+    emit no record. A group with interval 0 (e.g. identity) is read again
+    every retry_interval seconds until at least one field is read. With
+    "daylight" the configured groups are not polled at night:
+        "health": {"min_timeout": 0.2, "failure_threshold": 3,
+                   "probe_interval": 30, "max_probe_interval": 900},
+        "daylight": {"latitude": 52.5, "longitude": 13.4, "min_elevation": -5,
+                     "groups": ["live"]}
+    """
+    def __init__(self, config, emit = print_record, stats = None, observe = None, instrumentation = None, \
+                 report = None):
+        """Constructor of poll daemon
+
+        Keyword arguments:
+
+        config -- configuration, see load_config
+
+        emit -- function called with every record (default print as json line)
+
+        stats -- function returning a dict of further statistics to report (default None)
+
+        observe -- function called with (device, group, duration in s, ok) after every poll,
+                   ok is False if no field could be read (default None)
+
+        instrumentation -- Instrumentation of the modbus requests of all devices (default None)
+
+        report -- function called with the statistics every stats_interval (default None, write to stderr)
+
+        """
+        self._emit = emit
+        self._extra_stats = stats
+        self._report = report
+        self._observe = observe
+        timeout = config.get('timeout', 3)
+        self._pool = ConnectionPool(timeout=timeout, retries=config.get('retries', 3))
+        self._scheduler = Scheduler()
+        self._devices = []
+        self._health = {}
+        health_config = config.get('health', {})
+        daylight_config = config.get('daylight')
+        self._daylight = None
+        self._night_groups = ()
+        if daylight_config:
+            self._daylight = DaylightSchedule(daylight_config['latitude'], daylight_config['longitude'], \
+                                              daylight_config.get('min_elevation', -5.0))
+            self._night_groups = tuple(daylight_config.get('groups', ('live',)))
+        self.skipped = {'circuit_open': 0, 'night': 0}
+        retry_interval = config.get('retry_interval', 30)
+        self._capability_cache = None
+        if config.get('capability_cache'):
+            from .profiles import CapabilityCache
+            self._capability_cache = CapabilityCache(config['capability_cache'])
+        for index, device_config in enumerate(config['devices']):
+            name = device_name(device_config)
+            health = None
+            if health_config is not False:
+                health = self._health[name] = DeviceHealth(max_timeout=timeout, **health_config)
+            device = SunnyBoy(device_config['ip'], device_config.get('port', 502), \
+                              device_config.get('device_unit_id', 3), pool=self._pool, \
+                              instrumentation=instrumentation, health=health)
+            self._devices.append(device)
+            for group, interval in config['intervals'].items():
+                if interval is None or interval < 0:
+                    continue
+                # spread the first polls of the devices to smooth the load
+                delay = (index * 0.01) % interval if interval else 0.0
+                poll = self._make_poll(device, name, group, health)
+                if not interval:
+                    poll = self._make_retry(f'{name}/{group}', poll, retry_interval)
+                self._scheduler.add(f'{name}/{group}', interval, poll, delay)
+        stats_interval = config.get('stats_interval', 60)
+        if stats_interval:
+            self._scheduler.add('stats', stats_interval, self.report_stats, stats_interval)
+
+    def _make_poll(self, device, name, group, health = None):
+        fields = REGISTER_GROUPS[group]
+        daylight = self._daylight if group in self._night_groups else None
+
+        def poll():
+            if daylight is not None and not daylight.is_daylight():
+                self.skipped['night'] += 1
+                return False
+            if health is not None and not health.ready():
+                self.skipped['circuit_open'] += 1
+                return False
+            if self._capability_cache is not None and device.capabilities is None:
+                # retried with every poll until the device answered the probe once
+                device.detect_capabilities(self._capability_cache)
+            tic = time.perf_counter()
+            snapshot = device.read_snapshot(fields)
+            ok = any(getattr(snapshot, field) is not None for field in fields)
+            if self._observe is not None:
+                self._observe(name, group, time.perf_counter() - tic, ok)
+            record = {'timestamp': snapshot.timestamp, 'device': name, 'group': group}
+            for field in fields:
+                record[field] = getattr(snapshot, field)
+            self._emit(record)
+            return ok
+        return poll
+
+    def _make_retry(self, job_name, poll, retry_interval):
+        """Wrap the poll of a group read once, so it is scheduled again until it succeeds"""
+        def retry():
+            if not poll():
+                self._scheduler.add(job_name, 0, retry, retry_interval)
+        return retry
+
+    def report_stats(self):
+        """Write scheduling lag and connection statistics to stderr or pass them to report
+        """
+        stats = self.collect_stats()
+        if self._report is not None:
+            self._report(stats)
+            return
+        print(json.dumps(stats), file=sys.stderr, flush=True)
+
+    def collect_stats(self) -> dict:
+        """Return the scheduling lag, connection, health and further statistics"""
+        stats = {'scheduler': self._scheduler.stats(), 'pool': self._pool.stats(), \
+                 'health': self.health_stats()}
+        if self._extra_stats is not None:
+            stats.update(self._extra_stats())
+        return stats
+
+    def run(self):
+        """Run the poll loop until stop() is called
+        """
+        try:
+            self._scheduler.run()
+        finally:
+            self.close()
+
+    def stop(self):
+        """Stop the poll loop, can be called from another thread
+        """
+        self._scheduler.stop()
+
+    def stats(self) -> dict:
+        """Return the statistics of the scheduler jobs"""
+        return self._scheduler.stats()
+
+    def health_stats(self) -> dict:
+        """Return the skipped polls, the devices with open circuit and the timeouts"""
+        states = {name: health.stats() for name, health in self._health.items()}
+        timeouts = sorted(state['timeout'] for state in states.values())
+        return {'skipped': dict(self.skipped), \
+                'open': sorted(name for name, state in states.items() if state['state'] != 'closed'), \
+                'timeout_median': timeouts[len(timeouts) // 2] if timeouts else None}
+
+    @property
+    def pool(self):
+        """ConnectionPool of the devices"""
+        return self._pool
+
+    def close(self):
+        """Close all connections
+        """
+        for device in self._devices:
+            device.close()
+        self._pool.close()
@@ -0,0 +1,211 @@
+"""module to control the active power limitation of a SMA device against a grid meter"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from .instrumentation import LatencyHistogram
+from .scheduler import Scheduler
+
+LIMIT_MODE = 'Active power limitation P in W'
+
+
+class PowerLimitController:
+    """Closed loop active power limitation, e.g. for zero export
+
+    Every interval the active power of the device and the grid power of
+    the meter are read and the limit is set to the power the device may
+    produce to hold the grid power at target:
+
+        limit = active power + grid power - target
+
+    clamped to min_limit..max_limit and to max_step from the last written
+    limit, or from the active power before the first write (rate limit).
+    Writes are coalesced: a limit differing less than min_change W from
+    the last written one is not written, except after refresh seconds,
+    so the device does not fall back to its fallback limit. After
+    failure_threshold cycles in a row without meter value or device
+    reading the fallback_limit is written, if given.
+
+    The device must be a SunnyBoy: the AsyncSunnyBoy client stays
+    read-only and has no write_value.
+
+    The cycles run on the drift-free Scheduler, a cycle overrunning the
+    interval skips the missed cycles. The durations of the reads, the
+    writes and whole cycles are recorded in latency histograms.
+
+    Example:
+        controller = PowerLimitController(SunnyBoy('192.168.178.29'), meter.read_grid_power, \\
+                                          max_limit=3680, max_step=500)
+        controller.run()
+    """
+    def __init__(self, device, meter, target = 0.0, interval = 0.5, min_limit = 0.0, max_limit = 3600.0, \
+                 max_step = None, min_change = 1.0, refresh = 60.0, fallback_limit = None, \
+                 failure_threshold = 3, name = None, emit = None, clock = time.monotonic):
+        """Constructor of power limit controller
+
+        Keyword arguments:
+
+        device -- connected SunnyBoy
+
+        meter -- function returning the grid power in W, positive for import,
+                 negative for export, None if not available
+
+        target -- grid power to hold in W, e.g. -600 allows 600 W export (default 0)
+
+        interval -- seconds between two control cycles (default 0.5)
+
+        min_limit -- lowest limit written in W (default 0)
+
+        max_limit -- highest limit written in W, the nominal power of the device (default 3600)
+
+        max_step -- max change of the limit per cycle in W (default None, unlimited)
+
+        min_change -- smallest change of the limit which is written in W (default 1)
+
+        refresh -- seconds after which an unchanged limit is written again (default 60)
+
+        fallback_limit -- limit written after failure_threshold failed cycles (default None)
+
+        failure_threshold -- failed cycles in a row before the fallback limit is written (default 3)
+
+        name -- device name of the records (default None)
+
+        emit -- function called with a record of every cycle (default None)
+
+        clock -- monotonic time function (default time.monotonic)
+
+        """
+        self._device = device
+        self._meter = meter
+        self._target = target
+        self._interval = interval
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._max_step = max_step
+        self._min_change = min_change
+        self._refresh = refresh
+        self._fallback_limit = fallback_limit
+        self._failure_threshold = failure_threshold
+        self._name = name
+        self._emit = emit
+        self._clock = clock
+        self._scheduler = None
+        self.limit = None
+        self._written_at = None
+        self.cycles = 0
+        self.writes = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.write_failures = 0
+        self.failures_in_row = 0
+        self.read_latency = LatencyHistogram()
+        self.write_latency = LatencyHistogram()
+        self.cycle_latency = LatencyHistogram()
+
+    def _setpoint(self, active_power, grid_power) -> int:
+        setpoint = min(self._max_limit, max(self._min_limit, active_power + grid_power - self._target))
+        if self._max_step is not None:
+            last = active_power if self.limit is None else self.limit
+            setpoint = min(last + self._max_step, max(last - self._max_step, setpoint))
+        return int(round(setpoint))
+
+    def _write(self, limit) -> bool:
+        """Write a limit unless it is coalesced, return True if written"""
+        now = self._clock()
+        if self.limit is not None and abs(limit - self.limit) < self._min_change \
+                and now - self._written_at < self._refresh:
+            self.coalesced += 1
+            return False
+        tic = time.perf_counter()
+        written = self._device.write_value('active_power_limit', limit)
+        self.write_latency.record(time.perf_counter() - tic)
+        if not written:
+            self.write_failures += 1
+            return False
+        self.writes += 1
+        self.limit = limit
+        self._written_at = now
+        return True
+
+    def prepare(self) -> bool:
+        """Set the operating mode of the active power limitation to P in W
+
+        -----
+        Returns:
+            True if successful, False otherwise
+        """
+        return self._device.write_value('active_power_limit_mode', LIMIT_MODE)
+
+    def step(self) -> dict:
+        """Run one control cycle
+
+        -----
+        Returns:
+            record of the cycle with timestamp, active_power and grid_power in W,
+            limit in W, written and cycle_time in s
+        """
+        tic = time.perf_counter()
+        self.cycles += 1
+        active_power = self._device.read_value('active_power')
+        self.read_latency.record(time.perf_counter() - tic)
+        grid_power = self._meter()
+        if active_power is False or grid_power is None:
+            self.failures += 1
+            self.failures_in_row += 1
+            active_power = None
+            written = False
+            if self._fallback_limit is not None and self.failures_in_row >= self._failure_threshold:
+                written = self._write(self._fallback_limit)
+        else:
+            self.failures_in_row = 0
+            # the total of the phases in kW, None (NaN) while the device sleeps
+            active_power = (active_power[0] or 0.0) * 1000
+            written = self._write(self._setpoint(active_power, grid_power))
+        cycle_time = time.perf_counter() - tic
+        self.cycle_latency.record(cycle_time)
+        record = {'timestamp': time.time(), 'device': self._name, 'group': 'control', \
+                  'active_power': active_power, 'grid_power': grid_power, 'limit': self.limit, \
+                  'written': written, 'cycle_time': round(cycle_time, 6)}
+        if self._emit is not None:
+            self._emit(record)
+        return record
+
+    def run(self, prepare = True):
+        """Run the control cycles every interval until stop() is called
+
+        Keyword arguments:
+
+        prepare -- set the operating mode first, see prepare (default True)
+
+        """
+        if prepare and not self.prepare():
+            print("ERROR: cannot set the operating mode of the active power limitation")
+            return False
+        self._scheduler = Scheduler(self._clock)
+        self._scheduler.add('control', self._interval, self.step)
+        self._scheduler.run()
+        return True
+
+    def stop(self):
+        """Stop the control loop, can be called from another thread
+        """
+        if self._scheduler is not None:
+            self._scheduler.stop()
+
+    def release(self) -> bool:
+        """Write max_limit, e.g. when the control ends and export is allowed again"""
+        self.limit = None
+        return self._write(self._max_limit)
+
+    def stats(self) -> dict:
+        """Return the counters and the latency summaries in s"""
+        result = {'cycles': self.cycles, 'writes': self.writes, 'coalesced': self.coalesced, \
+                  'failures': self.failures, 'write_failures': self.write_failures, 'limit': self.limit, \
+                  'read': self.read_latency.summary(), 'write': self.write_latency.summary(), \
+                  'cycle': self.cycle_latency.summary()}
+        if self._scheduler is not None:
+            job = self._scheduler.stats().get('control')
+            if job is not None:
+                result['skipped'] = job['skipped']
+                result['max_lag'] = job['max_lag']
+        return result
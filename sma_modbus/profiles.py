@@ -0,0 +1,311 @@
+"""module to detect the device profile and the supported registers of SMA devices"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+from .instrumentation import EXCEPTION_RESPONSE
+from .read_planner import DEFAULT_MAX_GAP
+from .register_map import REGISTER_MAP, REGISTER_GROUPS, compile_plan
+
+
+# exception code of a register the device does not support; the other codes
+# (slave busy, device failure, gateway errors) are transient and retried
+ILLEGAL_DATA_ADDRESS = 0x02
+PROBE_RETRIES = 3
+PROBE_RETRY_DELAY = 0.2
+# outcome of _probe for a register answered with an illegal data address
+UNSUPPORTED = 'unsupported'
+
+
+class DeviceProfile:
+    """Known properties of a family of SMA devices
+
+    The profile limits the probe of the supported registers to the
+    fields the family has and adds the addresses it is known not to
+    read as barriers, so they are never requested. A field of the
+    profile the device does not support is reported, e.g. a wrong
+    UnitID or a firmware without the register.
+    """
+    __slots__ = ('name', 'prefixes', 'fields', 'barriers')
+
+    def __init__(self, name, prefixes, fields = None, barriers = ()):
+        """Constructor of device profile
+
+        Keyword arguments:
+
+        name -- name of the profile
+
+        prefixes -- tuple of device type name prefixes of the family, e.g. ('STP ',)
+
+        fields -- fields of REGISTER_MAP the family has (default None, all)
+
+        barriers -- register addresses the family cannot read, never bridged (default ())
+
+        """
+        self.name = name
+        self.prefixes = prefixes
+        self.fields = frozenset(REGISTER_MAP if fields is None else fields)
+        self.barriers = tuple(barriers)
+
+    def __repr__(self):
+        return f'DeviceProfile({self.name!r})'
+
+
+# the pv inputs of the inverters, battery inverters have none
+PV_FIELDS = ('dc_current_in', 'dc_voltage_in', 'dc_power_in')
+
+# the first matching profile is used, see select_profile
+PROFILES = (DeviceProfile('sunny_tripower', ('STP',)),
+            DeviceProfile('sunny_boy_storage', ('SBS',), fields=set(REGISTER_MAP) - set(PV_FIELDS), \
+                          barriers=(REGISTER_MAP['dc_current_in'].address,)),
+            DeviceProfile('sunny_boy', ('SB',)))
+
+GENERIC_PROFILE = DeviceProfile('generic', ())
+
+
+def select_profile(device_type) -> DeviceProfile:
+    """Return the profile of a device type
+
+    Keyword arguments:
+
+    device_type -- device type name, e.g. 'SB 3600TL-21', or the raw code of an unknown type
+
+    """
+    if isinstance(device_type, str):
+        for profile in PROFILES:
+            if device_type.startswith(profile.prefixes):
+                return profile
+    return GENERIC_PROFILE
+
+
+class Capabilities:
+    """Identity, profile and readable registers of one device
+
+    fields are the fields of REGISTER_MAP the device answers, barriers
+    register addresses between them it cannot read, so the read planner
+    never bridges them (see read_planner.plan_reads). complete is False
+    if the device was still busy for some registers after the retries;
+    such capabilities are used, but not cached.
+    """
+    __slots__ = ('serial_number', 'device_class', 'device_type', 'software_packet', 'profile', \
+                 'fields', 'barriers', 'created', 'complete')
+
+    def __init__(self, serial_number, device_class, device_type, software_packet, profile, \
+                 fields, barriers = (), created = None, complete = True):
+        self.serial_number = serial_number
+        self.device_class = device_class
+        self.device_type = device_type
+        self.software_packet = software_packet
+        self.profile = profile
+        self.fields = frozenset(fields)
+        self.barriers = tuple(sorted(barriers))
+        self.created = created or time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        self.complete = complete
+
+    def plan(self, names, max_gap = DEFAULT_MAX_GAP) -> tuple:
+        """Compile the decode plan of the supported fields of names, see register_map.compile_plan"""
+        return compile_plan(frozenset(names) & self.fields, max_gap, self.barriers)
+
+    def as_dict(self) -> dict:
+        """Return the capabilities as json serializable dict"""
+        return {'serial_number': self.serial_number, 'device_class': self.device_class, \
+                'device_type': self.device_type, 'software_packet': self.software_packet, \
+                'profile': self.profile, 'fields': sorted(self.fields), \
+                'barriers': list(self.barriers), 'created': self.created}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create the capabilities from a dict of as_dict, unknown fields are ignored"""
+        return cls(data['serial_number'], data.get('device_class'), data.get('device_type'), \
+                   data.get('software_packet'), data.get('profile'), \
+                   [name for name in data['fields'] if name in REGISTER_MAP], \
+                   data.get('barriers', ()), data.get('created'))
+
+    def __repr__(self):
+        return f'Capabilities(serial_number={self.serial_number}, device_type={self.device_type!r}, ' \
+               f'profile={self.profile!r}, fields={len(self.fields)}, barriers={self.barriers})'
+
+
+class CapabilityCache:
+    """Capabilities of many devices in a json file, keyed by serial number
+
+    The file is merged with the entries of other processes and rewritten
+    atomically after every change, so it can be shared by the worker
+    processes of the sharded poller.
+    """
+    def __init__(self, path):
+        """Constructor of capability cache
+
+        Keyword arguments:
+
+        path -- path of the json file, created on the first put
+
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self._path):
+            return {}
+        with open(self._path, encoding='utf-8') as file:
+            return json.load(file).get('devices', {})
+
+    def get(self, serial_number):
+        """Return the cached Capabilities of a serial number or None"""
+        with self._lock:
+            data = self._entries.get(str(serial_number))
+        return None if data is None else Capabilities.from_dict(data)
+
+    def put(self, capabilities):
+        """Store the Capabilities of a device and write the file"""
+        with self._lock:
+            self._entries.update(self._load())
+            self._entries[str(capabilities.serial_number)] = capabilities.as_dict()
+            temporary = f'{self._path}.{os.getpid()}.tmp'
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump({'devices': self._entries}, file, indent=2, ensure_ascii=False)
+            os.replace(temporary, self._path)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _probe(device, address, count, retries = PROBE_RETRIES, delay = PROBE_RETRY_DELAY):
+    """Read a block, the transient exception responses are retried
+
+    -----
+    Returns:
+        list of register values if readable, UNSUPPORTED if the device does
+        not support a register, EXCEPTION_RESPONSE if it was still busy after
+        the retries, the outcome of the request if it does not answer
+    """
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(delay * attempt)
+        registers = device.request_register_block(address, count)
+        if registers != EXCEPTION_RESPONSE:
+            return registers
+        if device.exception_code == ILLEGAL_DATA_ADDRESS:
+            return UNSUPPORTED
+    return EXCEPTION_RESPONSE
+
+
+def probe_capabilities(device, max_gap = DEFAULT_MAX_GAP):
+    """Probe the identity and the supported registers of a device
+
+    The identity fields are read first, the device type selects the
+    profile. Every field of the profile is read alone, a field answered
+    with an illegal data address is not supported; the fields not in the
+    profile are not requested. Then every merged read of the supported
+    fields is tried, it never bridges the barriers of the profile; if it
+    fails, the gaps it bridges are read alone and the unreadable ones
+    become barriers. Reads answered busy are retried; if the device is
+    still busy, the field is left out (or the gap becomes a barrier) and
+    the result is not complete.
+
+    Keyword arguments:
+
+    device -- connected SunnyBoy
+
+    max_gap -- max number of unused registers read between two fields (default 16)
+
+    -----
+    Returns:
+        Capabilities, None if the device did not answer
+    """
+    fields = set()
+    values = {}
+    complete = True
+    identity = REGISTER_GROUPS['identity']
+    profile = None
+    for name in identity + tuple(name for name in REGISTER_MAP if name not in identity):
+        if name not in identity:
+            if profile is None:
+                profile = select_profile(values.get('device_type'))
+            if name not in profile.fields:
+                continue
+        plan, = compile_plan(frozenset((name,)), 0)
+        registers = _probe(device, plan.start, plan.count)
+        if isinstance(registers, list):
+            fields.add(name)
+            device.decode_block(plan, registers, values)
+        elif registers == EXCEPTION_RESPONSE:
+            complete = False
+        elif registers != UNSUPPORTED:
+            return None
+    missing = profile.fields - fields - set(identity)
+    if complete and missing:
+        print(f"WARNING: {values.get('device_type')} does not support {sorted(missing)} of profile {profile.name}")
+    barriers = set(profile.barriers)
+    for plan in compile_plan(frozenset(fields), max_gap, profile.barriers):
+        if len(plan.fields) < 2:
+            continue
+        registers = _probe(device, plan.start, plan.count)
+        if isinstance(registers, list):
+            continue
+        if registers not in (UNSUPPORTED, EXCEPTION_RESPONSE):
+            return None
+        gaps = [(left.address + left.length, right.address) \
+                for left, right in zip(plan.fields, plan.fields[1:]) \
+                if right.address > left.address + left.length]
+        if registers == EXCEPTION_RESPONSE:
+            # still busy: read the fields alone until the next probe
+            complete = False
+            barriers.update(start for start, _ in gaps)
+            continue
+        found = False
+        for start, end in gaps:
+            registers = _probe(device, start, end - start)
+            if isinstance(registers, list):
+                continue
+            if registers not in (UNSUPPORTED, EXCEPTION_RESPONSE):
+                return None
+            complete = complete and registers == UNSUPPORTED
+            barriers.add(start)
+            found = True
+        if not found:
+            # every gap is readable alone, but not together: read the fields alone
+            barriers.update(start for start, _ in gaps)
+    return Capabilities(values.get('serial_number'), values.get('device_class'), values.get('device_type'), \
+                        values.get('software_packet'), profile.name, fields, barriers, complete=complete)
+
+
+def detect_capabilities(device, cache = None, max_gap = DEFAULT_MAX_GAP):
+    """Return the capabilities of a device, from the cache if its firmware did not change
+
+    The serial number and the software packet are read with one request;
+    the device is probed only if it is not in the cache or got a new
+    software packet, and a complete result is added to the cache.
+
+    Keyword arguments:
+
+    device -- connected SunnyBoy
+
+    cache -- CapabilityCache (default None)
+
+    max_gap -- max number of unused registers read between two fields (default 16)
+
+    -----
+    Returns:
+        Capabilities, None if the device did not answer
+    """
+    if cache is not None:
+        plan, = compile_plan(frozenset(('serial_number', 'software_packet')), max_gap)
+        registers = _probe(device, plan.start, plan.count)
+        if not isinstance(registers, list) and registers not in (UNSUPPORTED, EXCEPTION_RESPONSE):
+            return None
+        if isinstance(registers, list):
+            identity = device.decode_block(plan, registers)
+            if identity:
+                capabilities = cache.get(identity['serial_number'])
+                if capabilities is not None and capabilities.software_packet == identity['software_packet']:
+                    return capabilities
+    capabilities = probe_capabilities(device, max_gap)
+    if capabilities is not None and cache is not None and capabilities.serial_number is not None \
+            and capabilities.complete:
+        cache.put(capabilities)
+    return capabilities
@@ -0,0 +1,77 @@
+"""module to plan coalesced modbus register reads"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+
+# Modbus limits a single read holding register request (0x03) to 125 registers
+MAX_REGISTERS_PER_READ = 125
+
+# registers in a gap between two requested ranges are read and discarded,
+# which is much cheaper than another round trip to the inverter
+DEFAULT_MAX_GAP = 16
+
+
+class ReadBlock:
+    """Contiguous block of registers fetched with one modbus request
+    """
+    __slots__ = ('start', 'count')
+
+    def __init__(self, start, count):
+        """Constructor of read block
+
+        Keyword arguments:
+
+        start -- first register address of the block
+
+        count -- number of registers in the block
+
+        """
+        self.start = start
+        self.count = count
+
+    @property
+    def end(self):
+        """First register address behind the block"""
+        return self.start + self.count
+
+    def contains(self, register_address, length):
+        """Check if the register range is completely inside the block"""
+        return self.start <= register_address and register_address + length <= self.end
+
+    def __repr__(self):
+        return f'ReadBlock(start={self.start}, count={self.count})'
+
+
+def plan_reads(spans, max_gap = DEFAULT_MAX_GAP, max_count = MAX_REGISTERS_PER_READ, barriers = ()) -> list:
+    """Merge register spans into as few read blocks as possible
+
+    Keyword arguments:
+
+    spans -- iterable of (register_address, length) tuples
+
+    max_gap -- max number of unused registers bridged between two spans (default 16)
+
+    max_count -- max number of registers per read (default 125)
+
+    barriers -- register addresses a device cannot read, never bridged (default ())
+
+    -----
+    Returns:
+        list of ReadBlock sorted by start address
+    """
+    barriers = sorted(barriers)
+    blocks = []
+    for address, length in sorted(spans):
+        if length > max_count:
+            raise ValueError(f'span at {address} with {length} registers exceeds {max_count}')
+        if blocks:
+            last = blocks[-1]
+            end = max(last.end, address + length)
+            # a barrier in the gap [last.end, address) would make the merged read fail
+            blocked = bisect.bisect_left(barriers, last.end) < bisect.bisect_left(barriers, address)
+            if address - last.end <= max_gap and end - last.start <= max_count and not blocked:
+                last.count = end - last.start
+                continue
+        blocks.append(ReadBlock(address, length))
+    return blocks
@@ -0,0 +1,272 @@
+"""module to provide the declarative SMA register map and its decode plans"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import struct
+from functools import lru_cache
+from .modbus_constants import ModbusConstants as CONSTS
+from .read_planner import plan_reads, DEFAULT_MAX_GAP
+
+
+class Register:
+    """Declaration of one SMA value, which can span several registers
+    """
+    __slots__ = ('name', 'address', 'datatype', 'count', 'scale', 'ndigits', \
+                 'unit', 'enum', 'clamp', 'nan')
+
+    def __init__(self, name, address, datatype, count = 1, scale = 1, ndigits = None, \
+                 unit = '-', enum = None, clamp = False, nan = None):
+        """Constructor of register declaration
+
+        Keyword arguments:
+
+        name -- field name, used for getters and snapshots
+
+        address -- register address of the first value
+
+        datatype -- U16, U32, U64, S16, S32, S64
+
+        count -- number of consecutive values of datatype (default 1)
+
+        scale -- the raw value is divided by scale (default 1)
+
+        ndigits -- round scaled values to ndigits (default None, no rounding)
+
+        unit -- unit of the scaled value (default '-')
+
+        enum -- dict mapping raw values to text (default None)
+
+        clamp -- clamp negative values to zero (default False)
+
+        nan -- raw value SMA sends for "no value" (default NaN of datatype or enum)
+
+        """
+        self.name = name
+        self.address = address
+        self.datatype = datatype
+        self.count = count
+        self.scale = scale
+        self.ndigits = ndigits
+        self.unit = unit
+        self.enum = enum
+        self.clamp = clamp
+        if nan is None:
+            nan = CONSTS.ENUM_NAN if enum is not None else CONSTS.NAN_VALUE[datatype]
+        self.nan = nan
+
+    @property
+    def length(self):
+        """Number of 16 bit registers of the value"""
+        return CONSTS.TYPE_TO_LENGTH[self.datatype] * self.count
+
+    def __repr__(self):
+        return f'Register({self.name!r}, {self.address}, {self.datatype!r}, count={self.count})'
+
+
+# Register description --> see docs/SMA/SMA_Modbus-TI-de-15.pdf
+REGISTERS = (
+    Register('device_class',      30051, 'U32', enum=CONSTS.DEVICE_CLASS),
+    Register('device_type',       30053, 'U32', enum=CONSTS.DEVICE_TYPE),
+    Register('serial_number',     30057, 'U32'),
+    Register('software_packet',   30059, 'U32'),
+    Register('status_of_device',  30201, 'U32', enum=CONSTS.DEVICE_STATUS),
+    Register('grid_relay_status', 30217, 'U32', enum=CONSTS.RELAY_STATE),
+    Register('derating',          30219, 'U32', enum=CONSTS.DERATING_STATE),
+    Register('total_yield',       30513, 'U64', unit='Wh'),
+    Register('daily_yield',       30517, 'U64', unit='Wh'),
+    Register('operating_time',    30521, 'U64', unit='s'),
+    Register('feed_in_time',      30525, 'U64', unit='s'),
+    Register('dc_current_in',     30769, 'S32', scale=1000, unit='A', clamp=True),
+    Register('dc_voltage_in',     30771, 'S32', scale=100, unit='V', clamp=True),
+    Register('dc_power_in',       30773, 'S32', unit='W', clamp=True),
+    Register('active_power',      30775, 'S32', count=4, scale=1000, ndigits=3, unit='kW', clamp=True),
+    Register('ac_current',        30977, 'S32', count=3, scale=1000, ndigits=3, unit='A', clamp=True),
+)
+
+REGISTER_MAP = {register.name: register for register in REGISTERS}
+
+# writable control registers, not part of snapshots --> see docs/SMA/SMA_Modbus-TI-de-15.pdf
+CONTROL_REGISTERS = (
+    Register('active_power_limit_mode', 40210, 'U32', enum=CONSTS.POWER_LIMIT_MODE),
+    Register('active_power_limit',      40212, 'U32', unit='W'),
+    Register('active_power_limit_pct',  40214, 'U32', unit='%'),
+)
+
+CONTROL_MAP = {register.name: register for register in CONTROL_REGISTERS}
+
+# groups of registers changing at a similar rate, polled with their own interval
+REGISTER_GROUPS = {'identity': ('device_class', 'device_type', 'serial_number', 'software_packet'),
+                   'status':   ('status_of_device', 'grid_relay_status', 'derating'),
+                   'counters': ('total_yield', 'daily_yield', 'operating_time', 'feed_in_time'),
+                   'live':     ('dc_current_in', 'dc_voltage_in', 'dc_power_in', \
+                                'active_power', 'ac_current')}
+
+# poll interval of the groups in seconds, 0 reads the group only once
+DEFAULT_INTERVALS = {'identity': 0, 'status': 10, 'counters': 300, 'live': 1}
+
+
+def _compile_converter(register):
+    """Return a function converting the raw value(s) of a register
+
+    The NaN sentinel of the register gives None, unknown enum codes
+    are returned as raw int instead of raising KeyError.
+    """
+    enum, scale, ndigits, clamp, nan = register.enum, register.scale, register.ndigits, \
+                                       register.clamp, register.nan
+    if enum is not None:
+        def convert(value):
+            text = enum.get(value)
+            if text is None:
+                return None if value == nan else value
+            return text
+    elif scale == 1 and ndigits is None:
+        def convert(value):
+            if value == nan:
+                return None
+            return value if not clamp or value >= 0 else 0
+    elif ndigits is None:
+        def convert(value):
+            if value == nan:
+                return None
+            value = value / scale
+            return value if not clamp or value >= 0 else 0
+    else:
+        def convert(value):
+            if value == nan:
+                return None
+            value = round(value / scale, ndigits)
+            return value if not clamp or value >= 0 else 0
+    if register.count == 1:
+        return convert
+    return lambda values: tuple(convert(value) for value in values)
+
+
+def encode_value(register, value) -> list:
+    """Encode a value of a register declaration into raw registers
+
+    Keyword arguments:
+
+    register -- Register declaration
+
+    value -- value in the unit of the register, a tuple for count > 1,
+             None for the NaN sentinel, text or raw code for enums
+
+    -----
+    Returns:
+        list of 16 bit register values
+    """
+    values = value if register.count > 1 else (value,)
+    raws = []
+    for item in values:
+        if item is None:
+            raws.append(register.nan)
+        elif register.enum is not None:
+            if isinstance(item, str):
+                codes = [code for code, text in register.enum.items() if text == item]
+                if not codes:
+                    raise ValueError(f'{item!r} is no value of {register.name}')
+                item = codes[0]
+            raws.append(item)
+        else:
+            raws.append(int(round(item * register.scale)))
+    data = struct.pack('>' + CONSTS.TYPE_TO_STRUCT[register.datatype] * register.count, *raws)
+    return list(struct.unpack(f'>{len(data) // 2}H', data))
+
+
+class BlockPlan:
+    """Precompiled decoding of one read block
+
+    The raw registers of the block are decoded with one struct call,
+    registers in gaps between the fields are skipped as pad bytes.
+    """
+    __slots__ = ('start', 'count', 'fields', '_pack', '_unpack', '_converters')
+
+    def __init__(self, block, registers):
+        """Constructor of block plan
+
+        Keyword arguments:
+
+        block -- ReadBlock to decode
+
+        registers -- Register declarations inside the block
+
+        """
+        self.start = block.start
+        self.count = block.count
+        self.fields = tuple(sorted(registers, key=lambda reg: reg.address))
+        fmt = '>'
+        position = block.start
+        index = 0
+        converters = []
+        for register in self.fields:
+            if register.address < position:
+                raise ValueError(f'register {register.name} overlaps another register')
+            fmt += 'x' * (2 * (register.address - position))
+            fmt += CONSTS.TYPE_TO_STRUCT[register.datatype] * register.count
+            position = register.address + register.length
+            converters.append((register.name, index, register.count, _compile_converter(register)))
+            index += register.count
+        fmt += 'x' * (2 * (block.end - position))
+        self._pack = struct.Struct(f'>{block.count}H')
+        self._unpack = struct.Struct(fmt)
+        self._converters = tuple(converters)
+
+    def unpack(self, registers) -> tuple:
+        """Unpack the raw registers of the block into a flat tuple of raw values"""
+        return self._unpack.unpack_from(self._pack.pack(*registers))
+
+    def decode(self, registers, values = None) -> dict:
+        """Decode the raw registers of the block
+
+        Keyword arguments:
+
+        registers -- list of raw register values of the block
+
+        values -- dict to add the decoded fields to (default new dict)
+
+        -----
+        Returns:
+            dict of field name and converted value
+        """
+        if values is None:
+            values = {}
+        raw = self.unpack(registers)
+        for name, index, count, convert in self._converters:
+            values[name] = convert(raw[index] if count == 1 else raw[index:index + count])
+        return values
+
+    def __repr__(self):
+        names = ', '.join(register.name for register in self.fields)
+        return f'BlockPlan(start={self.start}, count={self.count}, fields=({names}))'
+
+
+@lru_cache(maxsize=256)
+def compile_plan(names, max_gap = DEFAULT_MAX_GAP, barriers = ()) -> tuple:
+    """Compile the decode plan for a set of fields
+
+    Keyword arguments:
+
+    names -- frozenset of field names of REGISTER_MAP or CONTROL_MAP
+
+    max_gap -- max number of unused registers read between two fields (default 16)
+
+    barriers -- tuple of register addresses which are never read, see read_planner.plan_reads (default ())
+
+    -----
+    Returns:
+        tuple of BlockPlan, one per modbus read
+    """
+    registers = [REGISTER_MAP[name] if name in REGISTER_MAP else CONTROL_MAP[name] for name in names]
+    blocks = plan_reads({(reg.address, reg.length) for reg in registers}, max_gap=max_gap, barriers=barriers)
+    plans = []
+    for block in blocks:
+        inside = [reg for reg in registers if block.contains(reg.address, reg.length)]
+        plans.append(BlockPlan(block, inside))
+    return tuple(plans)
+
+
+# plans for the full snapshot and the single getters are compiled once at import
+SNAPSHOT_PLAN = compile_plan(frozenset(REGISTER_MAP), DEFAULT_MAX_GAP)
+for _name in REGISTER_MAP:
+    compile_plan(frozenset((_name,)), 0)
+del _name
@@ -0,0 +1,127 @@
+"""module to cache register reads of static and slow-changing registers"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from .register_map import REGISTER_GROUPS, REGISTER_MAP
+
+# time to live of cached reads of the register groups in seconds, None never expires
+DEFAULT_TTLS = {'identity': None, 'status': 1.0, 'counters': 10.0, 'live': 0.0}
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of raw register blocks with per-register TTL
+
+    The TTL of a block is the shortest TTL of the registers it covers,
+    blocks with a TTL of 0 or with unknown registers are not cached.
+    One cache can be shared by several devices, entries are keyed by
+    ip, port, unit id, address and count. After a reconnect the entries
+    of the device are invalidated, the device may have been restarted
+    or replaced.
+    """
+    def __init__(self, maxsize = 1024, ttls = None, clock = time.monotonic):
+        """Constructor of response cache
+
+        Keyword arguments:
+
+        maxsize -- max number of cached blocks, the least recently used are evicted (default 1024)
+
+        ttls -- dict of field name or register group and TTL in seconds, None never
+                expires, overrides DEFAULT_TTLS (default None)
+
+        clock -- function returning the current time in seconds (default time.monotonic)
+
+        """
+        self._maxsize = maxsize
+        self._clock = clock
+        ttl_by_name = {}
+        for group, ttl in {**DEFAULT_TTLS, **(ttls or {})}.items():
+            for name in REGISTER_GROUPS.get(group, ()):
+                ttl_by_name[name] = ttl
+        for name, ttl in (ttls or {}).items():
+            if name in REGISTER_MAP:
+                ttl_by_name[name] = ttl
+        self._ttl_by_name = ttl_by_name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.ttl = lru_cache(maxsize=256)(self._block_ttl)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _block_ttl(self, address, count):
+        """TTL of a block: shortest TTL of the covered registers, 0 for unknown registers"""
+        covered = [register for register in REGISTER_MAP.values() \
+                   if register.address < address + count and address < register.address + register.length]
+        if not covered:
+            return 0.0
+        ttls = [self._ttl_by_name.get(register.name, 0.0) for register in covered]
+        if all(ttl is None for ttl in ttls):
+            return None
+        return min(ttl for ttl in ttls if ttl is not None)
+
+    def get(self, key):
+        """Return the cached registers of key, None if missing or expired
+
+        Keyword arguments:
+
+        key -- (ip, port, device_unit_id, address, count)
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                registers, expires = entry
+                if expires is None or self._clock() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return registers
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, registers):
+        """Cache the registers of key if the TTL of the block allows it
+
+        Keyword arguments:
+
+        key -- (ip, port, device_unit_id, address, count)
+
+        registers -- raw register values
+
+        """
+        ttl = self.ttl(key[3], key[4])
+        if ttl is not None and ttl <= 0:
+            return
+        expires = None if ttl is None else self._clock() + ttl
+        with self._lock:
+            self._entries[key] = (tuple(registers), expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, ip, port, device_unit_id):
+        """Drop all entries of a device, e.g. after a reconnect
+
+        The signature fits ConnectionPool.add_reconnect_callback.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[:3] == (ip, port, device_unit_id)]:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def clear(self):
+        """Drop all entries
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return the counters of the cache"""
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, \
+                'evictions': self.evictions, 'invalidations': self.invalidations}
@@ -0,0 +1,130 @@
+"""module to provide a drift-free periodic scheduler"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class Job:
+    """Periodic job of the scheduler
+    """
+    __slots__ = ('name', 'interval', 'callback', 'next_run', 'runs', 'skipped', \
+                 'last_lag', 'max_lag', 'last_duration')
+
+    def __init__(self, name, interval, callback, first_run):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.next_run = first_run
+        self.runs = 0
+        self.skipped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_duration = 0.0
+
+    def stats(self) -> dict:
+        """Return the statistics of the job"""
+        return {'interval': self.interval, 'runs': self.runs, 'skipped': self.skipped, \
+                'last_lag': self.last_lag, 'max_lag': self.max_lag, \
+                'last_duration': self.last_duration}
+
+
+class Scheduler:
+    """Run jobs periodically on the monotonic clock
+
+    The run times are computed as first_run + n * interval, so the
+    schedule never drifts. If a job overruns and misses run times,
+    these are skipped instead of being run in a burst afterwards.
+    Jobs with interval 0 run only once.
+    """
+    def __init__(self, clock = time.monotonic):
+        """Constructor of scheduler
+
+        Keyword arguments:
+
+        clock -- monotonic clock in seconds (default time.monotonic)
+
+        """
+        self._clock = clock
+        self._jobs = []
+        self._stop = threading.Event()
+
+    def add(self, name, interval, callback, delay = 0.0) -> Job:
+        """Add a job
+
+        Keyword arguments:
+
+        name -- name of the job, used in stats
+
+        interval -- interval in seconds, 0 runs the job only once
+
+        callback -- function without arguments to run
+
+        delay -- delay of the first run in seconds (default 0)
+
+        -----
+        Returns:
+            the Job
+        """
+        job = Job(name, interval, callback, self._clock() + delay)
+        self._jobs.append(job)
+        return job
+
+    def run_pending(self) -> float:
+        """Run all due jobs
+
+        -----
+        Returns:
+            seconds until the next job is due, None if no job is left
+        """
+        for job in list(self._jobs):
+            now = self._clock()
+            if now < job.next_run:
+                continue
+            lag = now - job.next_run
+            job.last_lag = lag
+            job.max_lag = max(job.max_lag, lag)
+            try:
+                job.callback()
+            except Exception as exc:
+                print(f"ERROR: job {job.name} failed with {exc!r}")
+            finished = self._clock()
+            job.runs += 1
+            job.last_duration = finished - now
+            if job.interval <= 0:
+                self._jobs.remove(job)
+                continue
+            job.next_run += job.interval
+            if finished >= job.next_run:
+                # overrun: skip the missed run times instead of piling them up
+                missed = int((finished - job.next_run) // job.interval) + 1
+                job.next_run += missed * job.interval
+                job.skipped += missed
+        if not self._jobs:
+            return None
+        return max(0.0, min(job.next_run for job in self._jobs) - self._clock())
+
+    def run(self):
+        """Run the jobs until stop() is called or no job is left
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            wait = self.run_pending()
+            if wait is None:
+                break
+            self._stop.wait(wait)
+
+    def stop(self):
+        """Stop the run loop, can be called from another thread
+        """
+        self._stop.set()
+
+    def stats(self) -> dict:
+        """Return the statistics of all jobs
+
+        -----
+        Returns:
+            dict of job name and its statistics
+        """
+        return {job.name: job.stats() for job in self._jobs}
@@ -0,0 +1,322 @@
+"""module to poll very large fleets with several worker processes"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import multiprocessing
+import sys
+import threading
+import time
+import zlib
+from multiprocessing.connection import wait
+from .poll_daemon import PollDaemon, device_name, print_record
+
+# records are sent in batches of up to this number over the pipe
+_BATCH_SIZE = 100
+
+
+def shard_devices(devices, workers) -> list:
+    """Split the devices into shards, a device keeps its shard as long as workers is unchanged
+
+    Keyword arguments:
+
+    devices -- list of device configurations
+
+    workers -- number of shards
+
+    -----
+    Returns:
+        list of device lists, one per worker
+    """
+    shards = [[] for _ in range(workers)]
+    for device in devices:
+        shards[zlib.crc32(device_name(device).encode('utf-8')) % workers].append(device)
+    return shards
+
+
+def merge_stats(shard_stats) -> dict:
+    """Merge the statistics of the poll daemons of the shards
+
+    The scheduler jobs are named by device, the pool counters and the
+    skipped polls are summed, the timeout median is the median of the
+    medians of the shards.
+
+    Keyword arguments:
+
+    shard_stats -- iterable of PollDaemon.collect_stats dicts
+
+    """
+    merged = {'scheduler': {}, 'pool': {}, 'health': {'skipped': {}, 'open': [], 'timeout_median': None}}
+    medians = []
+    for stats in shard_stats:
+        merged['scheduler'].update(stats.get('scheduler', {}))
+        for name, value in stats.get('pool', {}).items():
+            merged['pool'][name] = merged['pool'].get(name, 0) + value
+        health = stats.get('health', {})
+        for name, value in health.get('skipped', {}).items():
+            merged['health']['skipped'][name] = merged['health']['skipped'].get(name, 0) + value
+        merged['health']['open'].extend(health.get('open', ()))
+        if health.get('timeout_median') is not None:
+            medians.append(health['timeout_median'])
+    merged['health']['open'].sort()
+    if medians:
+        merged['health']['timeout_median'] = sorted(medians)[len(medians) // 2]
+    return merged
+
+
+def _worker_main(config, connection):
+    """Poll the devices of one shard and send the records in batches and the statistics"""
+    batch = []
+    lock = threading.Lock()
+
+    def flush():
+        with lock:
+            if batch:
+                connection.send(('records', list(batch)))
+                batch.clear()
+
+    def emit(record):
+        with lock:
+            batch.append(record)
+            full = len(batch) >= _BATCH_SIZE
+        if full:
+            flush()
+
+    def report(stats):
+        with lock:
+            connection.send(('stats', stats))
+
+    daemon = PollDaemon(config, emit=emit, report=report)
+
+    def watch():
+        # flush the batch regularly, stop on a message or when the supervisor is gone
+        while not connection.poll(0.1):
+            flush()
+        daemon.stop()
+
+    watcher = threading.Thread(target=watch, name='sma-shard-watch', daemon=True)
+    watcher.start()
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            flush()
+        except OSError:
+            pass
+        connection.close()
+
+
+class _Worker:
+    """Process and connection of one shard"""
+    __slots__ = ('index', 'devices', 'process', 'connection', 'restarts', 'stats')
+
+    def __init__(self, index, devices):
+        self.index = index
+        self.devices = devices
+        self.process = None
+        self.connection = None
+        self.restarts = []
+        # last statistics sent by the poll daemon of the worker
+        self.stats = {}
+
+
+class ShardedPoller:
+    """Supervisor polling the devices of a configuration with several processes
+
+    The devices are split into shards, every shard is polled by a
+    PollDaemon in its own worker process, so decoding and scheduling of
+    hundreds of devices are not limited by one GIL. The workers send
+    their records in batches over their own pipe to the supervisor
+    process, which feeds the sinks; a killed worker cannot block the
+    others. A dead worker is restarted after the records left in its pipe
+    are read; if it dies more than max_restarts times within restart_window
+    seconds its devices are moved to the remaining workers. The workers
+    send their statistics every stats_interval of the configuration, the
+    supervisor writes them merged to stderr.
+    """
+    def __init__(self, config, workers = 4, emit = print_record, max_restarts = 3, \
+                 restart_window = 300.0, start_method = None, stats = None):
+        """Constructor of sharded poller
+
+        Keyword arguments:
+
+        config -- configuration, see poll_daemon.load_config
+
+        workers -- number of worker processes (default 4)
+
+        emit -- function called in the supervisor with every record (default print as json line)
+
+        max_restarts -- restarts of a worker within restart_window before resharding (default 3)
+
+        restart_window -- seconds in which restarts are counted (default 300)
+
+        start_method -- multiprocessing start method, e.g. 'spawn' (default None, platform default)
+
+        stats -- function returning a dict of further statistics to report (default None)
+
+        """
+        self._config = config
+        self._emit = emit
+        self._max_restarts = max_restarts
+        self._restart_window = restart_window
+        self._extra_stats = stats
+        self._stats_interval = config.get('stats_interval', 60)
+        self._context = multiprocessing.get_context(start_method)
+        self._stop = threading.Event()
+        self._workers = min(workers, len(config['devices'])) or 1
+        self._shards = []
+        self.records = 0
+        self.restarts = 0
+        self.reshards = 0
+
+    def _start_worker(self, worker):
+        connection, child_connection = self._context.Pipe()
+        config = dict(self._config, devices=worker.devices)
+        worker.process = self._context.Process(target=_worker_main, args=(config, child_connection), \
+                                               name=f'sma-shard-{worker.index}', daemon=True)
+        worker.process.start()
+        child_connection.close()
+        worker.connection = connection
+
+    def start(self):
+        """Shard the devices and start the worker processes"""
+        shards = [shard for shard in shard_devices(self._config['devices'], self._workers) if shard]
+        self._shards = [_Worker(index, shard) for index, shard in enumerate(shards)]
+        for worker in self._shards:
+            self._start_worker(worker)
+
+    def _stop_workers(self, workers = None, timeout = 5.0):
+        workers = self._shards if workers is None else workers
+        for worker in workers:
+            try:
+                worker.connection.send('stop')
+            except OSError:
+                pass
+        # read the last records until every worker closed its pipe
+        deadline = time.monotonic() + timeout
+        while any(not worker.connection.closed for worker in workers) and time.monotonic() < deadline:
+            self._drain(0.05)
+        for worker in workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            self._drain_worker(worker)
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for worker in self._shards:
+            if worker.process.is_alive():
+                continue
+            worker.restarts = [tic for tic in worker.restarts if now - tic < self._restart_window] + [now]
+            # the records the worker sent before it died are still in the pipe
+            self._drain_worker(worker)
+            if len(worker.restarts) > self._max_restarts and len(self._shards) > 1:
+                print(f"ERROR: worker {worker.process.name} died {len(worker.restarts)} times, "
+                      f"moving its devices to the other {len(self._shards) - 1} workers")
+                self._move_devices(worker)
+                return
+            print(f"ERROR: worker {worker.process.name} died (exit code {worker.process.exitcode}), restarting")
+            self.restarts += 1
+            self._start_worker(worker)
+
+    def _move_devices(self, dead):
+        """Remove a worker and restart the others it gives devices to with them"""
+        self._shards.remove(dead)
+        self._workers = len(self._shards)
+        self.reshards += 1
+        targets = {}
+        for index, devices in enumerate(shard_devices(dead.devices, len(self._shards))):
+            if devices:
+                targets[index] = devices
+        moved = [self._shards[index] for index in targets]
+        self._stop_workers(moved)
+        for index, devices in targets.items():
+            worker = self._shards[index]
+            worker.devices = worker.devices + devices
+            self._start_worker(worker)
+
+    def _drain_worker(self, worker):
+        """Receive the messages left in the pipe of an ended worker and close it"""
+        connection = worker.connection
+        try:
+            while not connection.closed and connection.poll(0):
+                self._receive(worker, connection.recv())
+        except (EOFError, OSError):
+            pass
+        connection.close()
+
+    def _receive(self, worker, message):
+        kind, data = message
+        if kind == 'stats':
+            worker.stats = data
+            return
+        for record in data:
+            self._emit(record)
+        self.records += len(data)
+
+    def _drain(self, timeout) -> bool:
+        workers = {worker.connection: worker for worker in self._shards if not worker.connection.closed}
+        if not workers:
+            time.sleep(timeout)
+            return False
+        ready = wait(list(workers), timeout)
+        for connection in ready:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                # the worker ended, it is restarted by _check_workers
+                connection.close()
+                continue
+            self._receive(workers[connection], message)
+        return bool(ready)
+
+    def run(self, check_interval = 1.0):
+        """Run the workers and feed the records to emit until stop() is called
+
+        Keyword arguments:
+
+        check_interval -- seconds between the checks of the workers (default 1)
+
+        """
+        if not self._shards:
+            self.start()
+        next_check = time.monotonic() + check_interval
+        next_report = time.monotonic() + self._stats_interval if self._stats_interval else None
+        try:
+            while not self._stop.is_set():
+                self._drain(0.1)
+                if time.monotonic() >= next_check:
+                    self._check_workers()
+                    next_check = time.monotonic() + check_interval
+                if next_report is not None and time.monotonic() >= next_report:
+                    self.report_stats()
+                    next_report += self._stats_interval
+        finally:
+            self._stop_workers()
+
+    def stop(self):
+        """Stop the workers, can be called from another thread
+        """
+        self._stop.set()
+
+    def stats(self) -> dict:
+        """Return the statistics of the supervisor"""
+        return {'workers': len(self._shards), \
+                'alive': sum(worker.process.is_alive() for worker in self._shards), \
+                'records': self.records, 'restarts': self.restarts, 'reshards': self.reshards}
+
+    def collect_stats(self) -> dict:
+        """Return the merged statistics of the workers, see PollDaemon.collect_stats"""
+        stats = merge_stats(worker.stats for worker in self._shards)
+        stats['supervisor'] = self.stats()
+        if self._extra_stats is not None:
+            stats.update(self._extra_stats())
+        return stats
+
+    def report_stats(self):
+        """Write the merged statistics of the workers to stderr
+        """
+        print(json.dumps(self.collect_stats()), file=sys.stderr, flush=True)
@@ -0,0 +1,425 @@
+"""module to simulate SMA SunnyBoy devices as modbus tcp servers"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import math
+import random
+import struct
+import threading
+import time
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseSlaveContext
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.server import ModbusTcpServer
+from pymodbus.server.requesthandler import ServerRequestHandler
+from .modbus_constants import ModbusConstants as CONSTS
+from .register_map import REGISTER_MAP, CONTROL_MAP, encode_value
+
+# registers without a value in the simulation answer with this word, like SMA NaN
+_UNSET_REGISTER = 0xFFFF
+_ADDRESS_RANGE = range(30000, 45000)
+
+
+class SimulatorSettings:
+    """Behaviour of the simulated devices
+    """
+    __slots__ = ('latency', 'jitter', 'drop_rate', 'exception_rate', 'exception_code', \
+                 'peak_power', 'phases', 'day_seconds', 'device_type', 'unsupported')
+
+    def __init__(self, latency = 0.0, jitter = 0.0, drop_rate = 0.0, exception_rate = 0.0, \
+                 exception_code = ExceptionResponse.SLAVE_BUSY, peak_power = 3600.0, \
+                 phases = 1, day_seconds = 86400.0, device_type = 9165, unsupported = ()):
+        """Constructor of simulator settings
+
+        Keyword arguments:
+
+        latency -- delay of every response in seconds (default 0)
+
+        jitter -- max additional random delay in seconds (default 0)
+
+        drop_rate -- probability of closing the connection instead of answering (default 0)
+
+        exception_rate -- probability of a modbus exception response (default 0)
+
+        exception_code -- code of these exception responses (default 0x06 slave busy)
+
+        peak_power -- ac power at noon in W (default 3600)
+
+        phases -- 1 or 3, unused phases report NaN (default 1)
+
+        day_seconds -- length of a simulated day in seconds (default 86400, real time)
+
+        device_type -- device type code of register 30053 (default 9165, SB 3600TL-21)
+
+        unsupported -- field names or register addresses the device does not support,
+                       reads including them get an illegal address exception (default ())
+
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.exception_rate = exception_rate
+        self.exception_code = exception_code
+        self.peak_power = peak_power
+        self.phases = phases
+        self.day_seconds = day_seconds
+        self.device_type = device_type
+        self.unsupported = frozenset(address for item in unsupported for address in \
+                                     (range(REGISTER_MAP[item].address, REGISTER_MAP[item].address + \
+                                            REGISTER_MAP[item].length) if item in REGISTER_MAP else (item,)))
+
+
+class SunnyBoySimulatorContext(ModbusBaseSlaveContext):
+    """Slave context answering like a SunnyBoy with time-varying values
+
+    The ac power follows a sine over the (simulated) day, during the
+    night the dc values are NaN, and the counters grow with the power.
+    The control registers of the active power limitation are writable
+    (function code 0x10, whole registers) and limit the ac power.
+    """
+    def __init__(self, settings, device_unit_id = 3, serial_number = 3000000000, seed = None):
+        """Constructor of simulator context
+
+        Keyword arguments:
+
+        settings -- SimulatorSettings
+
+        device_unit_id -- UnitID of the device (default 3)
+
+        serial_number -- serial number of the device (default 3000000000)
+
+        seed -- seed of the random noise (default None)
+
+        """
+        self.settings = settings
+        self.device_unit_id = device_unit_id
+        self.serial_number = serial_number
+        self._random = random.Random(seed)
+        self._started = time.monotonic()
+        self._last_update = self._started
+        self._daily_yield = 0.0
+        self._total_yield = 1_000_000.0
+        self._feed_in_time = 0.0
+        self._phase = self._random.uniform(0, 0.05)
+        # raw values of the control registers
+        self.control = {'active_power_limit_mode': 303, \
+                        'active_power_limit': int(settings.peak_power), \
+                        'active_power_limit_pct': 100}
+        self.requests = 0
+        self.writes = 0
+
+    def reset(self):
+        """Reset the counters"""
+        self._daily_yield = 0.0
+        self._feed_in_time = 0.0
+
+    def _power(self, now) -> float:
+        day_position = ((now - self._started) / self.settings.day_seconds + 0.5 + self._phase) % 1.0
+        # daylight from 6 to 18 o'clock of the simulated day
+        daylight = math.sin(math.pi * (day_position - 0.25) / 0.5) if 0.25 < day_position < 0.75 else 0.0
+        power = self.settings.peak_power * daylight * self._random.uniform(0.9, 1.0)
+        power = max(0.0, power)
+        mode = self.control['active_power_limit_mode']
+        if mode == 1077:
+            power = min(power, self.control['active_power_limit'])
+        elif mode == 1078:
+            power = min(power, self.settings.peak_power * self.control['active_power_limit_pct'] / 100)
+        return power
+
+    def values(self, now = None) -> dict:
+        """Compute the current values of the register map
+
+        -----
+        Returns:
+            dict of field name and value, None for NaN
+        """
+        now = time.monotonic() if now is None else now
+        power = self._power(now)
+        elapsed = now - self._last_update
+        self._last_update = now
+        # energy in Wh, time scaled to the simulated day
+        scaled = elapsed * 86400.0 / self.settings.day_seconds
+        self._daily_yield += power * scaled / 3600.0
+        self._total_yield += power * scaled / 3600.0
+        if power > 0:
+            self._feed_in_time += scaled
+        producing = power > 0
+        phases = self.settings.phases
+        per_phase = power / phases / 1000
+        phase_power = tuple(per_phase if index < phases else None for index in range(3))
+        phase_current = tuple(per_phase * 1000 / 230 if index < phases else None for index in range(3))
+        dc_power = power / 0.97 if producing else None
+        dc_voltage = self._random.uniform(300, 380) if producing else None
+        return {'device_class': 8001, \
+                'device_type': self.settings.device_type, \
+                'serial_number': self.serial_number, \
+                'software_packet': 50665988, \
+                'status_of_device': 307, \
+                'grid_relay_status': 51 if producing else 311, \
+                'derating': 884, \
+                'total_yield': int(self._total_yield), \
+                'daily_yield': int(self._daily_yield), \
+                'operating_time': int((now - self._started) * 86400.0 / self.settings.day_seconds), \
+                'feed_in_time': int(self._feed_in_time), \
+                'dc_current_in': dc_power / dc_voltage if producing else None, \
+                'dc_voltage_in': dc_voltage, \
+                'dc_power_in': dc_power, \
+                'active_power': (power / 1000,) + phase_power, \
+                'ac_current': phase_current}
+
+    def registers(self, now = None) -> dict:
+        """Encode the current values into a dict of register address and word"""
+        words = {}
+        for name, value in self.values(now).items():
+            register = REGISTER_MAP.get(name)
+            if register is None:
+                continue
+            for offset, word in enumerate(encode_value(register, value)):
+                words[register.address + offset] = word
+        for name, value in self.control.items():
+            register = CONTROL_MAP[name]
+            for offset, word in enumerate(encode_value(register, value)):
+                words[register.address + offset] = word
+        # device unit id register: physical serial number, SusyID, unit id
+        for offset, word in enumerate(struct.unpack('>4H', struct.pack('>IHH', \
+                self.serial_number, 130, self.device_unit_id))):
+            words[42109 + offset] = word
+        return words
+
+    async def async_getValues(self, fc_as_hex, address, count = 1):
+        """Answer a read request after the configured latency"""
+        self.requests += 1
+        settings = self.settings
+        delay = settings.latency + (self._random.uniform(0, settings.jitter) if settings.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if settings.exception_rate and self._random.random() < settings.exception_rate:
+            return settings.exception_code
+        return self.getValues(fc_as_hex, address, count)
+
+    def getValues(self, fc_as_hex, address, count = 1):
+        """Read registers; returns an exception code for addresses outside the SMA range"""
+        if address not in _ADDRESS_RANGE or address + count - 1 not in _ADDRESS_RANGE:
+            return ExceptionResponse.ILLEGAL_ADDRESS
+        unsupported = self.settings.unsupported
+        if unsupported and any(register in unsupported for register in range(address, address + count)):
+            return ExceptionResponse.ILLEGAL_ADDRESS
+        words = self.registers()
+        return [words.get(register, _UNSET_REGISTER) for register in range(address, address + count)]
+
+    async def async_setValues(self, fc_as_hex, address, values):
+        """Answer a write request after the configured latency"""
+        self.requests += 1
+        settings = self.settings
+        delay = settings.latency + (self._random.uniform(0, settings.jitter) if settings.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if settings.exception_rate and self._random.random() < settings.exception_rate:
+            return settings.exception_code
+        return self.setValues(fc_as_hex, address, values)
+
+    def setValues(self, fc_as_hex, address, values):
+        """Write whole control registers, all other registers are read only"""
+        written = {}
+        end = address + len(values)
+        covered = 0
+        for name, register in CONTROL_MAP.items():
+            if address <= register.address and register.address + register.length <= end:
+                offset = register.address - address
+                words = values[offset:offset + register.length]
+                raw, = struct.unpack('>' + CONSTS.TYPE_TO_STRUCT[register.datatype], \
+                                     struct.pack(f'>{register.length}H', *words))
+                if register.enum is not None and raw not in register.enum:
+                    return ExceptionResponse.ILLEGAL_VALUE
+                written[name] = raw
+                covered += register.length
+        if covered != len(values):
+            # partial registers or registers without write access
+            return ExceptionResponse.ILLEGAL_ADDRESS
+        self.control.update(written)
+        self.writes += 1
+        return None
+
+
+class _FlakyRequestHandler(ServerRequestHandler):
+    """Request handler answering pipelined requests, drops the connection with the configured rate
+
+    The pymodbus handler answers one request per received packet. A client
+    may send several requests without waiting (see gateway.GatewayClient),
+    so every complete request of a packet is answered concurrently, each
+    after the configured latency, like the devices behind a gateway.
+    """
+
+    def callback_data(self, data, addr = None) -> int:
+        used = 0
+        while used < len(data):
+            try:
+                length, pdu = self.framer.processIncomingFrame(data[used:])
+            except ModbusIOException:
+                self.server_send(ExceptionResponse(40, exception_code=ExceptionResponse.ILLEGAL_FUNCTION), 0)
+                return len(data)
+            if not length:
+                # incomplete request, waits for the next packet
+                break
+            used += length
+            if pdu:
+                asyncio.ensure_future(self._handle(pdu, addr))
+        return used
+
+    def send(self, data, addr = None):
+        # the base class drops a received part of the next request
+        buffer = self.recv_buffer
+        super().send(data, addr)
+        self.recv_buffer = buffer
+
+    async def _handle(self, pdu, addr):
+        settings = self.server.settings
+        if settings.drop_rate and random.random() < settings.drop_rate:
+            self.close()
+            return
+        if pdu.dev_id not in self.server.context:
+            # like a SMA gateway: exception response of the requested function code
+            response = ExceptionResponse(pdu.function_code, ExceptionResponse.GATEWAY_NO_RESPONSE)
+        else:
+            try:
+                response = await pdu.update_datastore(self.server.context[pdu.dev_id])
+            except Exception:  # pylint: disable=broad-except
+                response = ExceptionResponse(pdu.function_code, ExceptionResponse.SLAVE_FAILURE)
+        response.transaction_id = pdu.transaction_id
+        response.dev_id = pdu.dev_id
+        if self.transport is not None:
+            self.server_send(response, addr)
+
+
+class SunnyBoySimulator(ModbusTcpServer):
+    """Modbus tcp server of one or more simulated SunnyBoy unit ids
+    """
+    def __init__(self, host = '127.0.0.1', port = 5020, unit_ids = (3,), settings = None, seed = None):
+        """Constructor of simulator
+
+        Keyword arguments:
+
+        host -- interface to listen on (default '127.0.0.1')
+
+        port -- tcp port to listen on (default 5020)
+
+        unit_ids -- UnitIDs served on this port (default (3,))
+
+        settings -- SimulatorSettings (default SimulatorSettings())
+
+        seed -- seed of the random noise (default None)
+
+        """
+        self.settings = settings or SimulatorSettings()
+        self.devices = {}
+        for unit_id in unit_ids:
+            self.devices[unit_id] = SunnyBoySimulatorContext(self.settings, unit_id, \
+                serial_number=3000000000 + port * 1000 + unit_id, seed=seed)
+        slaves = dict(self.devices)
+        # like SMA devices unit id 1 answers the device unit id register
+        slaves.setdefault(1, self.devices[unit_ids[0]])
+        super().__init__(ModbusServerContext(slaves=slaves, single=False), address=(host, port))
+
+    def callback_new_connection(self):
+        """Handle incoming connect with the flaky request handler"""
+        return _FlakyRequestHandler(self, self.trace_packet, self.trace_pdu, self.trace_connect)
+
+
+async def serve_fleet(host = '127.0.0.1', port = 5020, devices = 1, unit_ids = (3,), \
+                      settings = None, seed = None) -> list:
+    """Start simulators on consecutive ports
+
+    Keyword arguments:
+
+    host -- interface to listen on (default '127.0.0.1')
+
+    port -- first tcp port (default 5020)
+
+    devices -- number of ports, i.e. simulated hosts (default 1)
+
+    unit_ids -- UnitIDs served on every port (default (3,))
+
+    settings -- SimulatorSettings shared by all devices (default SimulatorSettings())
+
+    seed -- seed of the random noise (default None)
+
+    -----
+    Returns:
+        list of listening SunnyBoySimulator
+    """
+    servers = []
+    for index in range(devices):
+        server = SunnyBoySimulator(host, port + index, tuple(unit_ids), settings, seed)
+        await server.serve_forever(background=True)
+        if server.transport is None:
+            for started in servers:
+                await started.shutdown()
+            raise OSError(f"cannot listen on {host}:{port + index}")
+        servers.append(server)
+    return servers
+
+
+class SimulatorThread:
+    """Run simulators in a background thread, e.g. for benchmarks and tests
+
+    Usage:
+        with SimulatorThread(port=5020, devices=10) as simulator:
+            sunny_obj = SunnyBoy('127.0.0.1', 5020)
+    """
+    def __init__(self, host = '127.0.0.1', port = 5020, devices = 1, unit_ids = (3,), \
+                 settings = None, seed = None):
+        """Constructor, see serve_fleet for the arguments"""
+        self._arguments = (host, port, devices, tuple(unit_ids), settings, seed)
+        self._loop = None
+        self._thread = None
+        self.servers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start the simulators and wait until they listen"""
+        ready = threading.Event()
+        errors = []
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self.servers = self._loop.run_until_complete(serve_fleet(*self._arguments))
+            except OSError as err:
+                errors.append(err)
+                return
+            finally:
+                ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='sma-simulator', daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            raise errors[0]
+
+    def stop(self):
+        """Shut the simulators down and end the thread"""
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            for server in self.servers:
+                await server.shutdown()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
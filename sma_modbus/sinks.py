@@ -0,0 +1,327 @@
+"""module to provide sinks for the records of the pipeline"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import time
+from .register_map import REGISTER_MAP, REGISTER_GROUPS
+
+
+def flatten_record(record) -> dict:
+    """Flatten tuple values of a record to single columns
+
+    e.g. {'active_power': (1.5, 0.5, 0.5, 0.5)} gives
+    {'active_power_0': 1.5, 'active_power_1': 0.5, ...}
+    """
+    flat = {}
+    for name, value in record.items():
+        if isinstance(value, (tuple, list)):
+            for index, item in enumerate(value):
+                flat[f'{name}_{index}'] = item
+        else:
+            flat[name] = value
+    return flat
+
+
+class FileSink:
+    """Append records as json lines to a file
+    """
+    def __init__(self, path, flush_every = 1):
+        """Constructor of file sink
+
+        Keyword arguments:
+
+        path -- path of the file, records are appended
+
+        flush_every -- flush the file after every n-th write call (default 1)
+
+        """
+        self._file = open(path, 'a', encoding='utf-8')
+        self._flush_every = flush_every
+        self._writes = 0
+
+    def write(self, records):
+        """Write records to the file"""
+        if not records:
+            return
+        self._file.write(''.join(json.dumps(record) + '\n' for record in records))
+        self._writes += 1
+        if self._writes % self._flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        """Flush and close the file"""
+        self._file.close()
+
+
+class MariaDBSink:
+    """Insert records into MariaDB by a maria_db_mysql.BatchedWriter
+
+    Every record is flattened and inserted as one row into the table of
+    its register group, e.g. table 'live' for group 'live'.
+    """
+    def __init__(self, writer, table = None, exclude = ('group',)):
+        """Constructor of mariaDB sink
+
+        Keyword arguments:
+
+        writer -- maria_db_mysql.BatchedWriter
+
+        table -- table name for all records (default None, the group of the record)
+
+        exclude -- record keys not written as columns (default ('group',))
+
+        """
+        self._writer = writer
+        self._table = table
+        self._exclude = exclude
+
+    def write(self, records):
+        """Buffer the records in the writer, which flushes on its thresholds"""
+        for record in records:
+            table = self._table or record['group']
+            row = {name: value for name, value in flatten_record(record).items() \
+                   if name not in self._exclude}
+            self._writer.add(table, tuple(row), tuple(row.values()))
+        self._writer.flush_if_due()
+
+    def close(self):
+        """Flush the remaining rows"""
+        self._writer.close()
+
+
+# flattened names of multi value fields, e.g. active_power_1
+_ELEMENT_NAME = re.compile(r'^(.*)_(\d+)$')
+
+# window records of the aggregator: group name with the window size, e.g. live_60s
+_WINDOW_GROUP = re.compile(r'^(.*)_(\d+)s$')
+_WINDOW_SIZES = {'hour': 3600, 'day': 86400}
+
+
+class ParquetSink:
+    """Write records as compressed, time-partitioned Parquet files (requires pyarrow)
+
+    Records are appended to the columns of the current time window of
+    their register group and written as one row group of batch_size rows.
+    Every group and time window gets its own file, hive-style partitioned
+    for vectorized readers, e.g.
+
+        directory/group=live/date=2026-10-17/13-0.parquet
+
+    The columns of the register groups and of their aggregated windows
+    (e.g. live_60s) are declared by the types of the register map, the
+    columns of other groups are taken from the first batch. Keys not in
+    the columns of a file are dropped with a warning.
+
+    A record of a later window rolls the current window over: its columns
+    are written and its file stays open for grace seconds after the window
+    end (by the timestamps of the records), so late records still go to
+    it. At most the current and the previous window of a group are open,
+    a record arriving even later and a restart open a new file number.
+    """
+    def __init__(self, directory, partition = 'hour', batch_size = 10000, compression = 'zstd', grace = 300.0):
+        """Constructor of parquet sink
+
+        Keyword arguments:
+
+        directory -- base directory of the partitions, created if missing
+
+        partition -- 'hour' or 'day', time window of a file in UTC (default 'hour')
+
+        batch_size -- rows per row group (default 10000)
+
+        compression -- parquet compression codec, e.g. 'zstd', 'snappy', 'gzip' (default 'zstd')
+
+        grace -- seconds after the end of a window before its file is closed (default 300)
+
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as exc:
+            raise ImportError("ParquetSink requires pyarrow, install it with 'pip install pyarrow'") from exc
+        if partition not in _WINDOW_SIZES:
+            raise ValueError(f"partition must be 'hour' or 'day', not {partition!r}")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._directory = directory
+        self._window_format = '%Y-%m-%d/%H' if partition == 'hour' else '%Y-%m-%d/day'
+        self._window_size = _WINDOW_SIZES[partition]
+        self._batch_size = batch_size
+        self._compression = compression
+        self._grace = grace
+        self._groups = {}
+        self.rows_written = 0
+        self.files = 0
+        # (group, key) of the dropped keys, each is warned once
+        self.dropped = set()
+
+    def _register_type(self, register):
+        if register.enum is not None:
+            return self._pa.string()
+        if register.scale != 1:
+            return self._pa.float64()
+        return self._pa.int64()
+
+    def _declared_schema(self, group):
+        """Return the schema of a register group or its aggregated windows, None for other groups"""
+        pa = self._pa
+        match = _WINDOW_GROUP.match(group)
+        if group in REGISTER_GROUPS:
+            names, suffixes = REGISTER_GROUPS[group], None
+        elif match and match.group(1) in REGISTER_GROUPS:
+            names, suffixes = REGISTER_GROUPS[match.group(1)], ('min', 'max', 'mean', 'last')
+        else:
+            return None
+        fields = [pa.field('timestamp', pa.timestamp('us', tz='UTC')), pa.field('device', pa.string())]
+        if suffixes is not None:
+            fields.append(pa.field('samples', pa.int64()))
+        for name in names:
+            register = REGISTER_MAP[name]
+            columns = [(name, self._register_type(register))]
+            if suffixes is not None:
+                # enums have only the last value, the mean of integers is a float
+                columns = [(f'{name}_{suffix}', pa.float64() if suffix == 'mean' else columns[0][1]) \
+                           for suffix in suffixes if register.enum is None or suffix == 'last']
+            for column, arrow_type in columns:
+                if register.count == 1:
+                    fields.append(pa.field(column, arrow_type))
+                else:
+                    fields.extend(pa.field(f'{column}_{index}', arrow_type) for index in range(register.count))
+        if suffixes is not None:
+            fields.append(pa.field('energy', pa.float64()))
+        return pa.schema(fields)
+
+    def write(self, records):
+        """Append the records to the columns of their window, write full batches and roll over windows"""
+        for record in records:
+            group = record.get('group', 'records')
+            timestamp = record.get('timestamp') or time.time()
+            state = self._groups.get(group)
+            if state is None:
+                state = self._groups[group] = {'schema': self._declared_schema(group), 'current': None, \
+                                               'previous': None, 'latest': timestamp}
+            state['latest'] = max(state['latest'], timestamp)
+            window = self._window(group, state, timestamp - timestamp % self._window_size)
+            row = flatten_record(record)
+            row.pop('group', None)
+            row['timestamp'] = timestamp
+            self._append(group, state, window, row)
+            if window['rows'] >= self._batch_size:
+                self._flush(group, state, window)
+            previous = state['previous']
+            if previous is not None and previous['start'] + self._window_size + self._grace <= state['latest']:
+                self._close_window(group, state, previous)
+                state['previous'] = None
+
+    def _window(self, group, state, start):
+        """Return the window of start, a later window rolls the current one over to previous"""
+        current, previous = state['current'], state['previous']
+        if current is not None and current['start'] == start:
+            return current
+        if previous is not None and previous['start'] == start:
+            return previous
+        window = {'start': start, 'columns': {}, 'rows': 0, 'writer': None}
+        if current is None:
+            state['current'] = window
+            return window
+        # the window given up is written and closed, a late one gets a new file number
+        if previous is not None:
+            self._close_window(group, state, previous)
+        if start > current['start']:
+            self._flush(group, state, current)
+            state['current'], state['previous'] = window, current
+        else:
+            state['previous'] = window
+        return window
+
+    def _append(self, group, state, window, row):
+        columns = window['columns']
+        schema = state['schema']
+        if schema is None:
+            # the columns of the first batch, a new key is None in the rows before
+            for name in row.keys() - columns.keys():
+                columns[name] = [None] * window['rows']
+            for name, values in columns.items():
+                values.append(row.get(name))
+        else:
+            for name in schema.names:
+                columns.setdefault(name, []).append(row.get(name))
+            for name in sorted(row.keys() - set(schema.names)):
+                if (group, name) not in self.dropped:
+                    self.dropped.add((group, name))
+                    print(f"WARNING: ParquetSink drops {name!r} of group {group!r}, it is no column of the files")
+        window['rows'] += 1
+
+    def _schema(self, columns):
+        pa = self._pa
+        fields = [pa.field('timestamp', pa.timestamp('us', tz='UTC'))]
+        for name, values in columns.items():
+            if name == 'timestamp':
+                continue
+            arrow_type = self._arrow_type(name)
+            if arrow_type is None:
+                arrow_type = pa.array(values).type
+                if arrow_type == pa.null():
+                    arrow_type = pa.string()
+            fields.append(pa.field(name, arrow_type))
+        return pa.schema(fields)
+
+    def _arrow_type(self, name):
+        match = _ELEMENT_NAME.match(name)
+        register = REGISTER_MAP.get(name) or (REGISTER_MAP.get(match.group(1)) if match else None)
+        if register is None:
+            return None
+        return self._register_type(register)
+
+    def _flush(self, group, state, window):
+        if not window['rows']:
+            return
+        pa = self._pa
+        columns = window['columns']
+        if state['schema'] is None:
+            state['schema'] = self._schema(columns)
+        schema = state['schema']
+        arrays = []
+        for field in schema:
+            values = columns.get(field.name) or [None] * window['rows']
+            if field.name == 'timestamp':
+                values = [int(value * 1_000_000) for value in values]
+            elif pa.types.is_string(field.type):
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        if window['writer'] is None:
+            name = time.strftime(self._window_format, time.gmtime(window['start']))
+            window['writer'] = self._pq.ParquetWriter(self._file_name(group, name), schema, \
+                                                      compression=self._compression)
+            self.files += 1
+        window['writer'].write_batch(batch)
+        self.rows_written += window['rows']
+        window['columns'] = {}
+        window['rows'] = 0
+
+    def _file_name(self, group, window):
+        day, hour = window.split('/')
+        directory = os.path.join(self._directory, f'group={group}', f'date={day}')
+        os.makedirs(directory, exist_ok=True)
+        number = 0
+        while os.path.exists(os.path.join(directory, f'{hour}-{number}.parquet')):
+            number += 1
+        return os.path.join(directory, f'{hour}-{number}.parquet')
+
+    def _close_window(self, group, state, window):
+        self._flush(group, state, window)
+        if window['writer'] is not None:
+            window['writer'].close()
+            window['writer'] = None
+
+    def close(self):
+        """Write the buffered rows and close all files"""
+        for group, state in self._groups.items():
+            for key in ('previous', 'current'):
+                if state[key] is not None:
+                    self._close_window(group, state, state[key])
+                    state[key] = None
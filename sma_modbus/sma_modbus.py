@@ -2,15 +2,51 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import struct
+import time
 from pymodbus.client import ModbusTcpClient as ModBusClient
 from pymodbus import (FramerType, ExceptionResponse, ModbusException)
+from pymodbus.exceptions import ModbusIOException, ConnectionException
+from .instrumentation import OK, TIMEOUT, EXCEPTION_RESPONSE, ERROR, NO_CONNECTION, CIRCUIT_OPEN
 from .modbus_constants import ModbusConstants as CONSTS
+from .read_planner import DEFAULT_MAX_GAP
+from .register_map import REGISTER_MAP, CONTROL_MAP, compile_plan, encode_value
+
+
+def exception_outcome(exc) -> str:
+    """Return the outcome of a request which raised a pymodbus exception
+
+    pymodbus raises ModbusIOException when no response was received (also
+    after all retries) and when the response is of another unit, and
+    ConnectionException when the client cannot connect.
+    """
+    if isinstance(exc, ConnectionException):
+        return NO_CONNECTION
+    if isinstance(exc, ModbusIOException) and 'No response' in str(exc):
+        return TIMEOUT
+    return ERROR
+
+
+def decode_block(plan, registers, values = None):
+    """Decode the raw registers of a read block, see SmaModbus.decode_block
+
+    -----
+    Returns:
+        dict of field name and converted value if successful, False if the
+        registers do not fit the plan (e.g. a truncated response)
+    """
+    try:
+        return plan.decode(registers, values)
+    except struct.error as exc:
+        print(f">>> decode_block: {len(registers)} registers do not fit {plan} ({exc})")
+        return False
 
 
 class SmaModbus:
     """Base class for SMA Modbeus with TCP
     """
-    def __init__(self, ip, port = 502, device_unit_id = 3):
+    def __init__(self, ip, port = 502, device_unit_id = 3, pool = None, cache = None, instrumentation = None, \
+                 health = None):
         """Constructor of modbus object
         
         Keyword arguments:
@@ -21,13 +57,35 @@ class SmaModbus:
 
         device_unit_id -- UnitID (default 3)
 
+        pool -- ConnectionPool to reuse connections from (default None, own connection)
+
+        cache -- ResponseCache for static and slow-changing registers (default None, no cache)
+
+        instrumentation -- Instrumentation for hooks and latency histograms (default None)
+
+        health -- DeviceHealth for adaptive timeouts and circuit breaker (default None)
+
         """
-        self._client = ModBusClient(ip, port=port, framer=FramerType.SOCKET)
+        self._pool = pool
+        self._health = health
+        self._released = False
+        self._cache = cache
+        self._instrumentation = instrumentation
+        # code of the last exception response, e.g. to tell an illegal address from a busy device
+        self.exception_code = None
+        self._cache_key = (ip, port, device_unit_id)
+        if cache is not None and pool is not None:
+            pool.add_reconnect_callback(cache.invalidate)
+        if pool is None:
+            self._client = ModBusClient(ip, port=port, framer=FramerType.SOCKET)
+        else:
+            self._client = pool.acquire(ip, port, device_unit_id)
         # read the device unit id if not sure
         #self.read_device_unit_id()
         self._device_unit_id = device_unit_id
         #print("Device Unit: ", self._device_unit_id)
-        self.connect()
+        if pool is None:
+            self.connect()
 
     def __del__(self):
         self.close()
@@ -44,63 +102,306 @@ class SmaModbus:
         ---
         Register: 42109; U32, U16, U16
         """
-        readings = self._client.read_holding_registers(42109, count=4, slave=1)
+        try:
+            readings = self._client.read_holding_registers(42109, count=4, slave=1)
+        except ModbusException as exc:
+            print(f">>> read_device_unit_id: Received ModbusException({exc}) from library")
+            return False
+        if readings.isError():
+            print(f">>> read_device_unit_id: Received Modbus library error({readings})")
+            return False
         unit_id = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.UINT16)[3]
         #print(f'UnitID       : {unit_id}')
         return unit_id
 
-    def connect(self):
+    def connect(self) -> bool:
         """Establish connection of client
+
+        -----
+        Returns:
+            True if connected, False otherwise
         """
+        if self._pool is not None:
+            return self._pool.ensure_connected(self._client)
+        if self._cache is not None:
+            self._cache.invalidate(*self._cache_key)
         try:
             if not self._client.connect():
                 print("ERROR: client cannot connect to ModBus-Server!")
-            else:
-                #print("INFO: client connected successfully to Modbus-Server!")
-                pass
+                return False
+            #print("INFO: client connected successfully to Modbus-Server!")
         except Exception as exc:
             print(f"ERROR: received an exception {exc}! Probably an Syntax Error!")
-        finally:
-            pass
+            return False
+        return True
 
     def close(self):
         """Close connection of client
+
+        A pooled connection is given back to the pool and stays open.
         """
-        if self._client.is_socket_open():
+        if self._pool is not None:
+            if not self._released:
+                self._pool.release(self._client)
+                self._released = True
+        elif self._client.is_socket_open():
             self._client.close()
             #print("INFO: Connection closed!")
         return None
 
-    def read_holding_register(self, register_address, datatype, count = 1):
-        """Read the holding register from SMA device
+    def read_register_block(self, register_address, count):
+        """Read a block of raw holding registers from SMA device
 
         Keyword arguments:
 
-        register_address -- number of register address
+        register_address -- number of first register address
 
-        datatype -- U8, U16, U32, etc...
+        count -- number of registers (16 bit words) to read
 
-        count -- number of datatypes to read (default 1)
-        
+        With a ResponseCache blocks of static and slow-changing
+        registers are answered from the cache within their TTL.
+
+        -----
+        Returns:
+            list of register values if successful, False otherwise
         --
         Function code : 0x03
         """
-        length = CONSTS.TYPE_TO_LENGTH[datatype] * count
-        #print(f'length : {length}')
+        if self._cache is not None:
+            key = self._cache_key + (register_address, count)
+            registers = self._cache.get(key)
+            if registers is not None:
+                return list(registers)
+            registers = self._read_register_block(register_address, count)
+            if registers is not False:
+                self._cache.put(key, registers)
+            return registers
+        return self._read_register_block(register_address, count)
+
+    def _read_register_block(self, register_address, count):
+        registers = self.request_register_block(register_address, count)
+        return registers if isinstance(registers, list) else False
+
+    def request_register_block(self, register_address, count):
+        """Read a block of raw holding registers, without cache
+
+        Like read_register_block, but a failed read returns its outcome,
+        e.g. to tell a not supported register (exception response) from
+        a device not answering.
+
+        -----
+        Returns:
+            list of register values if successful, the outcome otherwise,
+            see instrumentation (e.g. EXCEPTION_RESPONSE, TIMEOUT)
+        """
+        if self._instrumentation is None and self._health is None:
+            return self._request(register_address, count)
+        return self._instrumented(0x03, register_address, count, self._request)
+
+    def _instrumented(self, function_code, register_address, count, request, *args):
+        """Send a request through the circuit breaker, record its duration and outcome
+
+        request is called with register_address, count and args and returns
+        the registers (reads), OK (writes) or the outcome of a failed request.
+        """
+        instrumentation = self._instrumentation
+        health = self._health
+        if health is not None and not health.allow():
+            # the device did not answer the last requests, wait for the next probe
+            if instrumentation is not None:
+                instrumentation.request_finished(self._cache_key, function_code, register_address, count, \
+                                                 0.0, CIRCUIT_OPEN)
+            return CIRCUIT_OPEN
+        if instrumentation is not None:
+            instrumentation.request_started(self._cache_key, function_code, register_address, count)
+        tic = time.perf_counter()
+        result = request(register_address, count, *args)
+        duration = time.perf_counter() - tic
+        outcome = OK if isinstance(result, list) else result
+        if health is not None:
+            health.record(duration, outcome)
+        if instrumentation is not None:
+            instrumentation.request_finished(self._cache_key, function_code, register_address, count, \
+                                             duration, outcome)
+        return result
+
+    def _apply_health(self):
+        """Use the adaptive timeout of the health for the next request"""
+        # pymodbus reads the timeout of every request from the parameters of the client
+        self._client.comm_params.timeout_connect = self._health.timeout
+        # a retry sends the request again, the replies of the other copies would
+        # be taken as answers of the next requests; the health decides instead
+        self._client.transaction.retries = 0
+
+    def _drop_connection(self):
+        """Close the socket after a timeout, so a late reply is not taken as answer of the next request"""
+        if self._pool is not None:
+            self._pool.invalidate(self._client)
+        else:
+            self._client.close()
+
+    def _is_late_reply(self, result) -> bool:
+        """True if the reply belongs to an earlier request, the connection is dropped then"""
+        if result.transaction_id == self._client.transaction.request_transaction_id:
+            return False
+        print(f">>> {self._cache_key}: Received the late reply of an earlier request, closing connection")
+        self._drop_connection()
+        return True
+
+    def _request(self, register_address, count):
+        """Send a read request, return the registers or the outcome of a failed request"""
+        if self._pool is None:
+            return self._read(register_address, count)
+        # the pooled client is shared by the objects of the device in all threads
+        with self._pool.lease(self._client) as connected:
+            if not connected:
+                print(">>> read_holding_register: no connection to Modbus-Server")
+                return NO_CONNECTION
+            return self._read(register_address, count)
+
+    def _read(self, register_address, count):
+        if self._health is not None:
+            self._apply_health()
         try:
             result = self._client.read_holding_registers(register_address, \
-                count=length, slave=self._device_unit_id)
+                count=count, slave=self._device_unit_id)
             #print(result, type(result))
         except ModbusException as exc:
             print(f">>> read_holding_register: Received ModbusException({exc}) from library")
+            self._drop_connection()
+            return exception_outcome(exc)
+        if self._is_late_reply(result):
+            return TIMEOUT
+        if isinstance(result, ExceptionResponse):
+            print(f">>> read_holding_register: Received Modbus library exception ({result})")
+            # THIS IS NOT A PYTHON EXCEPTION, but a valid modbus message
+            self.exception_code = result.exception_code
+            return EXCEPTION_RESPONSE
         if result.isError():
             print(f">>> read_holding_register: Received Modbus library error({result})")
+            return ERROR
+        return result.registers
+
+    def write_registers(self, register_address, registers) -> bool:
+        """Write a block of raw holding registers to SMA device
+
+        SMA devices accept only writes of whole values (e.g. both
+        registers of an U32) with function code 0x10.
+
+        Keyword arguments:
+
+        register_address -- number of first register address
+
+        registers -- list of register values (16 bit words) to write
+
+        -----
+        Returns:
+            True if successful, False otherwise
+        --
+        Function code : 0x10
+        """
+        registers = list(registers)
+        if self._instrumentation is None and self._health is None:
+            outcome = self._write(register_address, len(registers), registers)
+        else:
+            outcome = self._instrumented(0x10, register_address, len(registers), self._write, registers)
+        if outcome != OK:
+            return False
+        if self._cache is not None:
+            # cached blocks may contain the written registers
+            self._cache.invalidate(*self._cache_key)
+        return True
+
+    def _write(self, register_address, count, registers):
+        """Send a write request, return OK or the outcome of a failed request"""
+        if self._pool is None:
+            return self._send_write(register_address, count, registers)
+        with self._pool.lease(self._client) as connected:
+            if not connected:
+                print(">>> write_registers: no connection to Modbus-Server")
+                return NO_CONNECTION
+            return self._send_write(register_address, count, registers)
+
+    def _send_write(self, register_address, count, registers):
+        if self._health is not None:
+            self._apply_health()
+        try:
+            result = self._client.write_registers(register_address, registers, slave=self._device_unit_id)
+        except ModbusException as exc:
+            print(f">>> write_registers: Received ModbusException({exc}) from library")
+            self._drop_connection()
+            return exception_outcome(exc)
+        if self._is_late_reply(result):
+            return TIMEOUT
         if isinstance(result, ExceptionResponse):
-            print(f">>> read_holding_register: Received Modbus library exception ({result})")
             # THIS IS NOT A PYTHON EXCEPTION, but a valid modbus message
+            print(f">>> write_registers: Received Modbus library exception ({result}) for {count} registers")
+            self.exception_code = result.exception_code
+            return EXCEPTION_RESPONSE
+        if result.isError():
+            print(f">>> write_registers: Received Modbus library error({result})")
+            return ERROR
+        return OK
+
+    def write_register(self, register_address, value, datatype) -> bool:
+        """Write a typed value to the holding registers of SMA device
+
+        Keyword arguments:
+
+        register_address -- number of register address
+
+        value -- int or list of ints to encode
+
+        datatype -- U16, U32, U64, S16, S32, S64
+
+        --
+        Function code : 0x10
+        """
+        return self.write_registers(register_address, self.encode_registers(value, datatype))
+
+    def decode_block(self, plan, registers, values = None):
+        """Decode the raw registers of a read block
+
+        Keyword arguments:
+
+        plan -- BlockPlan of the block
+
+        registers -- list of raw register values
+
+        values -- dict to add the decoded fields to (default new dict)
+
+        -----
+        Returns:
+            dict of field name and converted value if successful, False otherwise
+        """
+        instrumentation = self._instrumentation
+        tic = time.perf_counter() if instrumentation is not None else 0.0
+        values = decode_block(plan, registers, values)
+        if instrumentation is not None:
+            instrumentation.decode_finished(time.perf_counter() - tic, values is not False)
+        return values
+
+    def read_holding_register(self, register_address, datatype, count = 1):
+        """Read the holding register from SMA device
+
+        Keyword arguments:
+
+        register_address -- number of register address
+
+        datatype -- U8, U16, U32, etc...
+
+        count -- number of datatypes to read (default 1)
+        
+        --
+        Function code : 0x03
+        """
+        length = CONSTS.TYPE_TO_LENGTH[datatype] * count
+        #print(f'length : {length}')
+        registers = self.read_register_block(register_address, length)
+        if registers is False:
             return False
-        #print(type(result.registers), ": ", result.registers)
-        data = self.decode_register_readings(result, datatype, count)
+        #print(type(registers), ": ", registers)
+        data = self.convert_registers(registers, datatype)
         return data
 
     def decode_register_readings(self, readings, datatype, count):
@@ -113,23 +414,120 @@ class SmaModbus:
         datatype -- U8, U16, U32, etc...
 
         count -- number of datatypes to decode
-        
+
+        -----
+        Returns:
+            value for count 1, list of count values otherwise, False if the
+            readings are too short
         --
         """
-        data = []
-        if datatype == 'U16':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.UINT16)
-        elif datatype == 'U32':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.UINT32)
-        elif datatype == 'U64':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.UINT64)
-        elif datatype == 'S16':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.INT16)
-        elif datatype == 'S32':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.INT32)
-        elif datatype == 'S64':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.INT64)
-        return data
+        length = CONSTS.TYPE_TO_LENGTH[datatype] * count
+        if len(readings.registers) < length:
+            print(f">>> decode_register_readings: {len(readings.registers)} registers are too few " \
+                  f"for {count} x {datatype}")
+            return False
+        return self.convert_registers(readings.registers[:length], datatype)
+
+    @staticmethod
+    def convert_registers(registers, datatype):
+        """Convert a list of raw registers depend on datatype
+
+        Keyword arguments:
+
+        registers -- list of raw register values
+
+        datatype -- U8, U16, U32, etc...
+
+        --
+        """
+        number = len(registers) // CONSTS.TYPE_TO_LENGTH[datatype]
+        data = struct.unpack(f'>{number}{CONSTS.TYPE_TO_STRUCT[datatype]}', \
+                             struct.pack(f'>{len(registers)}H', *registers))
+        return list(data) if number != 1 else data[0]
+
+    @staticmethod
+    def encode_registers(values, datatype):
+        """Encode an int or a list of ints into raw registers depend on datatype, see convert_registers
+
+        Keyword arguments:
+
+        values -- int or list of ints
+
+        datatype -- U16, U32, U64, S16, S32, S64
+
+        --
+        """
+        values = list(values) if isinstance(values, (list, tuple)) else [values]
+        data = struct.pack(f'>{len(values)}{CONSTS.TYPE_TO_STRUCT[datatype]}', *values)
+        return list(struct.unpack(f'>{len(data) // 2}H', data))
+
+
+class SunnyBoySnapshot:
+    """Result of SunnyBoy.read_snapshot
+
+    A fixed-layout record with one slot per field of the register map
+    and the time of the read. Every field not requested, not readable
+    or reported as NaN by the device is None, in tuples of multi value
+    fields too, e.g. active_power (1.2, 1.2, None, None) of one phase.
+    """
+    __slots__ = ('timestamp',) + tuple(REGISTER_MAP)
+
+    FIELDS = tuple(REGISTER_MAP)
+
+    UNITS = {name: register.unit for name, register in REGISTER_MAP.items()}
+
+    def __init__(self, timestamp = None, **values):
+        """Constructor of snapshot
+
+        Keyword arguments:
+
+        timestamp -- unix time of the read (default None)
+
+        values -- field name and converted value, missing fields are None
+
+        """
+        self.timestamp = timestamp
+        for name in self.FIELDS:
+            setattr(self, name, values.get(name))
+
+    def as_dict(self) -> dict:
+        """Return the fields of the snapshot as dictionary"""
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def as_tuple(self) -> tuple:
+        """Return the fields of the snapshot in order of FIELDS, e.g. as row of a sink"""
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    @classmethod
+    def field_names(cls, fields = None) -> frozenset:
+        """Return the names of the fields to read into a snapshot
+
+        Keyword arguments:
+
+        fields -- iterable of field names, see register_map.REGISTER_MAP (default all)
+
+        -----
+        Returns:
+            frozenset of field names, raises ValueError for names without slot,
+            e.g. the settings of register_map.CONTROL_MAP
+        """
+        if fields is None:
+            return frozenset(cls.FIELDS)
+        names = frozenset(fields)
+        unknown = names - frozenset(cls.FIELDS)
+        if unknown:
+            control = sorted(unknown & frozenset(CONTROL_MAP))
+            hint = f', read the settings {control} by read_value' if control else ''
+            raise ValueError(f'no snapshot fields: {sorted(unknown)}{hint}')
+        return names
+
+    def missing(self) -> tuple:
+        """Return the names of the fields without value"""
+        return tuple(name for name in self.FIELDS if getattr(self, name) is None)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'SunnyBoySnapshot({fields})'
 
 
 class SunnyBoy(SmaModbus):
@@ -139,6 +537,103 @@ class SunnyBoy(SmaModbus):
     Please check if the TCP port in the sma device is activated!
     Check Register description --> see specific documentation of manufacturer 
     """
+    # Capabilities of the device, see detect_capabilities
+    capabilities = None
+
+    def detect_capabilities(self, cache = None):
+        """Identify the device and find the registers it supports
+
+        The capabilities are taken from the cache if the serial number
+        and the software packet match, otherwise the registers are
+        probed and the result is stored in the cache. Afterwards
+        read_snapshot reads only supported fields and never bridges
+        registers the device cannot read.
+
+        Keyword arguments:
+
+        cache -- profiles.CapabilityCache (default None, always probe)
+
+        -----
+        Returns:
+            profiles.Capabilities if successful, False otherwise
+        """
+        from .profiles import detect_capabilities
+        capabilities = detect_capabilities(self, cache)
+        if capabilities is None:
+            return False
+        self.capabilities = capabilities
+        return capabilities
+
+    def read_value(self, name):
+        """Read a single value of the register map
+
+        Keyword arguments:
+
+        name -- field name, see register_map.REGISTER_MAP
+
+        -----
+        Returns:
+            converted value if successful, None for NaN, False otherwise
+        """
+        plan, = compile_plan(frozenset((name,)), 0)
+        registers = self.read_register_block(plan.start, plan.count)
+        if registers is False:
+            return False
+        values = self.decode_block(plan, registers)
+        if values is False:
+            return False
+        return values[name]
+
+    def write_value(self, name, value) -> bool:
+        """Write a single value of the register map
+
+        Keyword arguments:
+
+        name -- field name, see register_map.CONTROL_MAP
+
+        value -- value in the unit of the register, text or code for enums
+
+        -----
+        Returns:
+            True if successful, False otherwise
+        """
+        register = CONTROL_MAP.get(name) or REGISTER_MAP[name]
+        try:
+            registers = encode_value(register, value)
+        except (ValueError, struct.error) as exc:
+            print(f">>> write_value: cannot encode {value!r} as {name} ({exc})")
+            return False
+        return self.write_registers(register.address, registers)
+
+    def read_snapshot(self, fields = None, max_gap = DEFAULT_MAX_GAP) -> SunnyBoySnapshot:
+        """Read several values with a minimal number of modbus requests
+
+        The register ranges of the requested fields are merged into
+        as few reads as possible and decoded from the read buffers.
+
+        Keyword arguments:
+
+        fields -- iterable of field names, see register_map.REGISTER_MAP (default all)
+
+        max_gap -- max number of unused registers read between two fields (default 16)
+
+        -----
+        Returns:
+            SunnyBoySnapshot, fields of failed reads and NaN values are None;
+            raises ValueError for fields without slot in the snapshot, see
+            SunnyBoySnapshot.field_names
+        """
+        names = SunnyBoySnapshot.field_names(fields)
+        values = {}
+        if self.capabilities is not None:
+            plans = self.capabilities.plan(names, max_gap)
+        else:
+            plans = compile_plan(names, max_gap)
+        for plan in plans:
+            registers = self.read_register_block(plan.start, plan.count)
+            if registers is not False:
+                self.decode_block(plan, registers, values)
+        return SunnyBoySnapshot(time.time(), **values)
 
     def get_device_class(self) -> str:
         """Read the device class
@@ -151,10 +646,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: -
         """
-        data = self.read_holding_register(30051, 'U32')
-        class_of_device = CONSTS.DEVICE_CLASS[data]
-        #print(class_of_device)
-        return class_of_device
+        return self.read_value('device_class')
 
     def get_device_type(self) -> str:
         """Read the device type
@@ -167,12 +659,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: -
         """
-
-        # read device type of default unit id = 3
-        data = self.read_holding_register(30053, 'U32')
-        device = CONSTS.DEVICE_TYPE[data]
-        #print("Device Type: ", Device_Type)
-        return device
+        return self.read_value('device_type')
 
     def get_serial_number(self) -> int :
         """Read the serial number
@@ -185,10 +672,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: -
         """
-        # read serial number of default unit id = 3
-        data = self.read_holding_register(30057, 'U32')
-        #print("Serial#: ", data)
-        return data
+        return self.read_value('serial_number')
 
     def get_software_packet(self) -> int :
         """Read the software packet information
@@ -201,8 +685,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: -
         """
-        data = self.read_holding_register(30059, 'U32')
-        return data
+        return self.read_value('software_packet')
 
     def get_status_of_device(self) -> str:
         """Read the device status
@@ -215,10 +698,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: -
         """
-        data = self.read_holding_register(30201, 'U32')
-        status = CONSTS.DEVICE_STATUS[data]
-        #print('Status: ', Status)
-        return status
+        return self.read_value('status_of_device')
 
     def get_grid_relay_status(self) -> str:
         """Read the status of the grid relay/contact
@@ -232,9 +712,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: -
         """
-        data = self.read_holding_register(30217, 'U32')
-        #print(data)
-        return CONSTS.RELAY_STATE[data]
+        return self.read_value('grid_relay_status')
 
     def get_derating(self) -> str:
         """Read the derating state of the device 
@@ -248,9 +726,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: -
         """
-        data = self.read_holding_register(30219, 'U32')
-        #print(data)
-        return CONSTS.DERATING_STATE[data]
+        return self.read_value('derating')
 
     def get_total_yield(self) -> int:
         """Read the total yield
@@ -264,9 +740,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: Wh
         """
-        data = self.read_holding_register(30513, 'U64')
-        #print(data)
-        return data
+        return self.read_value('total_yield')
 
     def get_daily_yield(self) -> int:
         """Read the daily yield
@@ -280,9 +754,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: Wh
         """
-        data = self.read_holding_register(30517, 'U64')
-        #print(data)
-        return data
+        return self.read_value('daily_yield')
 
     def get_operating_time(self) -> int:
         """Read the operating time
@@ -296,9 +768,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: s
         """
-        time = self.read_holding_register(30521, 'U64')
-        #print(time)
-        return time
+        return self.read_value('operating_time')
 
     def get_feed_in_time(self) -> int:
         """Read the feed-in time
@@ -312,9 +782,7 @@ class SunnyBoy(SmaModbus):
         Function-Code: 0x04
         Unit: s
         """
-        time = self.read_holding_register(30525, 'U64')
-        #print(time)
-        return time
+        return self.read_value('feed_in_time')
 
     def get_dc_current_in(self) -> float:
         """Read the incoming dc current
@@ -322,17 +790,13 @@ class SunnyBoy(SmaModbus):
         get DC current incoming
         -----
         Returns:
-            dc current if successful, False otherwise
+            dc current if successful, None if not available (NaN), False otherwise
         -----
         Register address: 30769; S32
         Function-Code: 0x04
         Unit: A
         """
-        dc_current = self.read_holding_register(30769, 'S32')/1000
-        #print(dc_current)
-        if dc_current < 0:
-            dc_current = 0
-        return dc_current
+        return self.read_value('dc_current_in')
 
     def get_dc_voltage_in(self) -> float:
         """Read the incoming dc voltage
@@ -340,17 +804,13 @@ class SunnyBoy(SmaModbus):
         get DC voltage incoming
         -----
         Returns:
-            DC voltage if successful, False otherwise
+            DC voltage if successful, None if not available (NaN), False otherwise
         -----
         Register address: 30771; S32
         Function-Code: 0x04
         Unit: V
         """
-        dc_voltage = self.read_holding_register(30771, 'S32')/100
-        #print(dc_voltage)
-        if dc_voltage < 0:
-            dc_voltage = 0
-        return dc_voltage
+        return self.read_value('dc_voltage_in')
 
     def get_dc_power_in(self):
         """Read the incoming dc power
@@ -358,17 +818,13 @@ class SunnyBoy(SmaModbus):
         get the DC power incoming
         -----
         Returns:
-            dc power if successful, False otherwise
+            dc power if successful, None if not available (NaN), False otherwise
         -----
         Register address: 30773; S32
         Function-Code: 0x04
         Unit: W
         """
-        dc_power = self.read_holding_register(30773, 'S32')
-        #print(dc_power)
-        if dc_power < 0:
-            dc_power = 0
-        return dc_power
+        return self.read_value('dc_power_in')
 
     def get_active_power(self) -> tuple:
         """Read the active power of phases L1, L2, L3
@@ -387,25 +843,7 @@ class SunnyBoy(SmaModbus):
         ----
         Unit: kW
         """
-        data = self.read_holding_register(30775, 'S32', 4)
-        #print(type(result.registers), ": ", result.registers)
-        p_sum = round(data[0] / 1000, 3)
-        if p_sum < 0:
-            p_sum = 0
-        p1 = round(data[1]  / 1000, 3)
-        if p1 < 0:
-            p1 = 0
-        p2 = round(data[2]  / 1000, 3)
-        if p2 < 0:
-            p2 = 0
-        p3 = round(data[3]  / 1000, 3)
-        if p3 < 0:
-            p3 = 0
-        #print('Aktive Wirkleistung Summe: ', p_sum, " kW")
-        #print('Aktive Wirkleistung L1:\t\t', p1, " kW")
-        #print('Aktive Wirkleistung L2:\t\t', p2, " kW")
-        #print('Aktive Wirkleistung L3:\t\t', p3, " kW")
-        return (p_sum, p1, p2, p3)
+        return self.read_value('active_power')
 
     def get_ac_current(self) -> tuple:
         """Read the actual current of phases i1, i2, i3
@@ -421,18 +859,37 @@ class SunnyBoy(SmaModbus):
         ----
         Unit: A
         """
-        # read_holding_registers(Startwert, Anzahl Register, slave=self._device_unit_id)
-        data = self.read_holding_register(30977, 'S32', 3)
-        i1_ac = round(data[0] / 1000, 3)
-        if i1_ac < 0:
-            i1_ac = 0
-        i2_ac = round(data[1] / 1000, 3)
-        if i2_ac < 0:
-            i2_ac = 0
-        i3_ac = round(data[2] / 1000, 3)
-        if i3_ac < 0:
-            i3_ac = 0
-        #print('AC Strom  L1:\t\t{0:.3f} A'.format(i_ac_L1))
-        #print('AC Strom  L2:\t\t{0:.3f} A'.format(i_ac_L2))
-        #print('AC Strom  L3:\t\t{0:.3f} A'.format(i_ac_L3))
-        return (i1_ac, i2_ac, i3_ac)
+        return self.read_value('ac_current')
+
+    def get_active_power_limit(self) -> int:
+        """Read the active power limitation P
+
+        -----
+        Returns:
+            limit in W if successful, False otherwise
+        -----
+        Register address: 40212; U32
+        Unit: W
+        """
+        return self.read_value('active_power_limit')
+
+    def set_active_power_limit(self, power, mode = True) -> bool:
+        """Limit the active power of the device
+
+        Keyword arguments:
+
+        power -- limit in W
+
+        mode -- write the operating mode 'Active power limitation P in W' first (default True)
+
+        -----
+        Returns:
+            True if successful, False otherwise
+        -----
+        Register address: 40210; U32 (mode), 40212; U32
+        Function-Code: 0x10
+        Unit: W
+        """
+        if mode and not self.write_value('active_power_limit_mode', 'Active power limitation P in W'):
+            return False
+        return self.write_value('active_power_limit', power)
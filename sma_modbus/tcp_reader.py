@@ -0,0 +1,174 @@
+"""module to read SMA devices with a minimal modbus tcp client for one-shot commands"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import socket
+import time
+from .instrumentation import TIMEOUT, EXCEPTION_RESPONSE, ERROR, NO_CONNECTION
+from .mbap import MBAP, frame, read_request, decode_read_response
+from .read_planner import DEFAULT_MAX_GAP
+from .register_map import REGISTER_MAP, compile_plan
+
+
+class TcpReader:
+    """Blocking modbus tcp client reading holding registers, without pymodbus
+
+    Importing pymodbus takes longer than reading a few registers, so the
+    one-shot commands of the command line (get, snapshot, watch) use this
+    client with the decode plans of the register map. It only reads; use
+    SunnyBoy for everything else.
+
+    Example:
+        with TcpReader('192.168.178.29') as reader:
+            print(reader.read_values(['total_yield', 'active_power']))
+    """
+    def __init__(self, ip, port = 502, device_unit_id = 3, timeout = 3.0):
+        """Constructor of tcp reader, the connection is established on the first read
+
+        Keyword arguments:
+
+        ip -- ip address of device
+
+        port -- port of device (default 502)
+
+        device_unit_id -- UnitID (default 3)
+
+        timeout -- timeout of connect and requests in s (default 3)
+
+        """
+        self._ip = ip
+        self._port = port
+        self._device_unit_id = device_unit_id
+        self._timeout = timeout
+        self._socket = None
+        self._next_tid = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._ip!r}, port={self._port}, device_unit_id={self._device_unit_id})'
+
+    @property
+    def connected(self) -> bool:
+        """True if the socket is open"""
+        return self._socket is not None
+
+    def connect(self) -> bool:
+        """Establish connection of client
+
+        -----
+        Returns:
+            True if connected, False otherwise
+        """
+        if self._socket is not None:
+            return True
+        try:
+            self._socket = socket.create_connection((self._ip, self._port), self._timeout)
+        except OSError as exc:
+            print(f"ERROR: client cannot connect to ModBus-Server {self._ip}:{self._port}! ({exc!r})")
+            return False
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return True
+
+    def close(self):
+        """Close connection of client
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        return None
+
+    def _receive(self, size) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('connection closed by the device')
+            data += chunk
+        return data
+
+    def request_register_block(self, register_address, count):
+        """Read a block of raw holding registers
+
+        Keyword arguments:
+
+        register_address -- number of first register address
+
+        count -- number of registers (16 bit words) to read
+
+        -----
+        Returns:
+            list of register values if successful, the outcome otherwise,
+            see instrumentation (e.g. EXCEPTION_RESPONSE, TIMEOUT)
+        --
+        Function code : 0x03
+        """
+        if not self.connect():
+            return NO_CONNECTION
+        self._next_tid = self._next_tid % 0xFFFF + 1
+        tid = self._next_tid
+        try:
+            self._socket.sendall(frame(tid, self._device_unit_id, read_request(register_address, count)))
+            while True:
+                response_tid, _, length, unit_id = MBAP.unpack(self._receive(MBAP.size))
+                response = self._receive(length - 1)
+                # a late response of a timed out request is skipped
+                if response_tid == tid and unit_id == self._device_unit_id:
+                    break
+        except socket.timeout:
+            print(f">>> read_holding_register: no response from {self._ip}:{self._port}")
+            self.close()
+            return TIMEOUT
+        except OSError as exc:
+            print(f">>> read_holding_register: connection to {self._ip}:{self._port} lost ({exc!r})")
+            self.close()
+            return NO_CONNECTION
+        registers = decode_read_response(response, count)
+        if registers == EXCEPTION_RESPONSE:
+            print(f">>> read_holding_register: Received Modbus exception code {response[1]}")
+        elif registers == ERROR:
+            print(">>> read_holding_register: Received malformed response")
+        return registers
+
+    def read_register_block(self, register_address, count):
+        """Read a block of raw holding registers, see request_register_block
+
+        -----
+        Returns:
+            list of register values if successful, False otherwise
+        """
+        registers = self.request_register_block(register_address, count)
+        return registers if isinstance(registers, list) else False
+
+    def read_values(self, names = None, max_gap = DEFAULT_MAX_GAP):
+        """Read and decode fields of the register map
+
+        Keyword arguments:
+
+        names -- field names, see register_map.REGISTER_MAP (default all)
+
+        max_gap -- max number of unused registers read between two fields (default 16)
+
+        -----
+        Returns:
+            dict of 'timestamp' and the fields in order of names, fields not
+            readable are None; False if the device does not answer
+        """
+        names = tuple(REGISTER_MAP if names is None else names)
+        values = {}
+        timestamp = time.time()
+        for plan in compile_plan(frozenset(names), max_gap):
+            registers = self.request_register_block(plan.start, plan.count)
+            if isinstance(registers, list):
+                plan.decode(registers, values)
+            elif registers != EXCEPTION_RESPONSE:
+                return False
+        record = {'timestamp': timestamp}
+        for name in names:
+            record[name] = values.get(name)
+        return record
+
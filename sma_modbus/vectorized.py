@@ -0,0 +1,126 @@
+"""module to decode the raw registers of many reads at once with numpy (optional)"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from .modbus_constants import ModbusConstants as CONSTS
+from .register_map import SNAPSHOT_PLAN
+
+TYPE_TO_NUMPY = {'U16': '>u2', 'U32': '>u4', 'U64': '>u8', \
+                 'S16': '>i2', 'S32': '>i4', 'S64': '>i8'}
+
+
+class VectorDecoder:
+    """Decode the raw registers of many devices or many reads in a few array operations
+
+    The words of one read block of all devices form a 2D array, which is
+    reinterpreted big-endian by a structured dtype with the field offsets
+    of the block, like the struct of BlockPlan. Scaling, rounding,
+    clamping and NaN-sentinel masking are done per column.
+
+    The result is a structured array with one row per device: scaled
+    fields are float64 with NaN for "no value", unscaled integer fields
+    are uint64 or int64 (exact for counters above 2**53) and keep the
+    NaN sentinel of the register (register.nan), enum fields keep their
+    raw uint32 code (register.enum maps them to text), fields with
+    count > 1 are subarrays.
+    """
+    def __init__(self, plans = SNAPSHOT_PLAN):
+        """Constructor of vector decoder
+
+        Keyword arguments:
+
+        plans -- tuple of BlockPlan, e.g. from register_map.compile_plan (default SNAPSHOT_PLAN)
+
+        """
+        if np is None:
+            raise ImportError("VectorDecoder requires numpy, install it with 'pip install numpy'")
+        self.plans = tuple(plans)
+        self._block_dtypes = tuple(self._block_dtype(plan) for plan in self.plans)
+        names, formats = [], []
+        for plan in self.plans:
+            for register in plan.fields:
+                names.append(register.name)
+                base = self._field_type(register)
+                formats.append(base if register.count == 1 else (base, (register.count,)))
+        self.dtype = np.dtype({'names': names, 'formats': formats})
+
+    @staticmethod
+    def _field_type(register):
+        if register.enum is not None:
+            return np.uint32
+        if register.scale != 1:
+            return np.float64
+        return np.uint64 if register.datatype.startswith('U') else np.int64
+
+    @staticmethod
+    def _block_dtype(plan):
+        return np.dtype({'names': [register.name for register in plan.fields], \
+                         'formats': [TYPE_TO_NUMPY[register.datatype] if register.count == 1 else \
+                                     (TYPE_TO_NUMPY[register.datatype], (register.count,)) \
+                                     for register in plan.fields], \
+                         'offsets': [2 * (register.address - plan.start) for register in plan.fields], \
+                         'itemsize': 2 * plan.count})
+
+    def decode(self, blocks, valid = None):
+        """Decode the raw registers of all devices
+
+        Keyword arguments:
+
+        blocks -- one entry per plan: array-like of shape (devices, plan.count) with the
+                  raw register words, e.g. a list of the register lists of every device
+
+        valid -- one entry per plan: bool array-like of shape (devices,), False marks a
+                 failed read, its fields are NaN (enums ENUM_NAN, integers register.nan)
+                 (default None, all valid)
+
+        -----
+        Returns:
+            numpy structured array of dtype self.dtype with one row per device
+        """
+        if len(blocks) != len(self.plans):
+            raise ValueError(f"{len(blocks)} blocks for {len(self.plans)} plans")
+        result = None
+        for index, (plan, block_dtype, words) in enumerate(zip(self.plans, self._block_dtypes, blocks)):
+            words = np.ascontiguousarray(words, dtype='>u2')
+            if words.size == 0:
+                # no devices
+                words = words.reshape(0, plan.count)
+            if words.ndim != 2 or words.shape[1] != plan.count:
+                raise ValueError(f"block {index} needs the shape (devices, {plan.count})")
+            if result is None:
+                result = np.zeros(words.shape[0], dtype=self.dtype)
+            raw = words.view(block_dtype)[:, 0]
+            failed = None if valid is None else ~np.asarray(valid[index], dtype=bool)
+            for register in plan.fields:
+                result[register.name] = self._convert(register, raw[register.name], failed)
+        return result
+
+    @staticmethod
+    def _convert(register, raw, failed):
+        if register.enum is not None:
+            codes = raw.astype(np.uint32)
+            if failed is not None:
+                codes[failed] = CONSTS.ENUM_NAN
+            return codes
+        missing = raw == register.nan
+        if register.scale == 1:
+            values = raw.astype(VectorDecoder._field_type(register))
+            if register.clamp:
+                np.maximum(values, 0, out=values, where=~missing)
+            if failed is not None:
+                values[failed] = register.nan
+            return values
+        values = raw.astype(np.float64)
+        values /= register.scale
+        if register.ndigits is not None:
+            np.round(values, register.ndigits, out=values)
+        if register.clamp:
+            np.maximum(values, 0.0, out=values)
+        values[missing] = np.nan
+        if failed is not None:
+            values[failed] = np.nan
+        return values
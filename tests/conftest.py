@@ -0,0 +1,35 @@
+"""pytest fixtures of the sma_modbus tests"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def free_port() -> int:
+    """Return a tcp port nobody listens on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def simulator():
+    """Start simulated devices, e.g. port = simulator(SimulatorSettings(latency=0.5))"""
+    from sma_modbus.simulator import SimulatorThread
+    threads = []
+
+    def start(settings = None, devices = 1, unit_ids = (3,)):
+        port = free_port()
+        thread = SimulatorThread('127.0.0.1', port, devices, unit_ids, settings=settings, seed=1)
+        thread.start()
+        threads.append(thread)
+        return port
+
+    yield start
+    for thread in threads:
+        thread.stop()
@@ -0,0 +1,64 @@
+"""tests of the window aggregator"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+from sma_modbus.aggregation import Aggregator
+
+
+def _live(timestamp, power, status = 'Ok'):
+    return {'timestamp': timestamp, 'device': 'sb1', 'group': 'live', \
+            'active_power': (power, power, None, None), 'status_of_device': status}
+
+
+def test_windows_are_aligned_and_forwarded_after_their_end():
+    forwarded = []
+    stage = Aggregator(forwarded.append, windows=(60,))
+    for timestamp in range(30, 130, 10):
+        stage(_live(timestamp, 1.0 if timestamp < 60 else 2.0))
+    # the window 60..120 is forwarded with the record of 120
+    assert [record['timestamp'] for record in forwarded] == [0, 60]
+    first, second = forwarded
+    assert first['group'] == 'live_60s' and first['samples'] == 3
+    assert first['active_power_min'] == (1.0, 1.0, None, None)
+    assert second['active_power_mean'] == (2.0, 2.0, None, None)
+    assert second['status_of_device_last'] == 'Ok'
+    stage.flush()
+    assert forwarded[-1]['timestamp'] == 120 and forwarded[-1]['samples'] == 1
+
+
+def test_energy_of_the_windows():
+    """1 kW for 60 s are 1000 / 60 Wh, shared by the windows at their border"""
+    forwarded = []
+    stage = Aggregator(forwarded.append, windows=(30,), max_gap=10)
+    for timestamp in range(0, 70, 5):
+        stage(_live(timestamp, 1.0))
+    assert [record['energy'] for record in forwarded] == [pytest.approx(1000 / 120, abs=1e-3)] * 2
+
+
+def test_gaps_are_not_integrated():
+    forwarded = []
+    stage = Aggregator(forwarded.append, windows=(60,), max_gap=10)
+    stage(_live(0, 1.0))
+    stage(_live(5, 1.0))
+    stage(_live(40, 1.0))
+    stage(_live(45, 1.0))
+    stage.flush()
+    assert stage.gaps == 1
+    assert forwarded[0]['energy'] == pytest.approx(2 * 5 * 1000 / 3600, abs=1e-3)
+
+
+def test_other_groups_and_energy_checks():
+    forwarded = []
+    stage = Aggregator(forwarded.append, windows=(60,))
+    stage({'timestamp': 0, 'device': 'sb1', 'group': 'counters', 'total_yield': 1000})
+    for timestamp in range(0, 365, 5):
+        stage(_live(timestamp, 1.2))
+    stage({'timestamp': 360, 'device': 'sb1', 'group': 'counters', 'total_yield': 1120})
+    groups = [record['group'] for record in forwarded]
+    assert groups.count('counters') == 2 and groups.count('live_60s') == 6
+    # the check is forwarded in front of the counters record
+    check = forwarded[-2]
+    assert check['group'] == 'energy_check' and check['complete']
+    assert check['counter_energy'] == 120 and check['integrated_energy'] == pytest.approx(120, abs=0.01)
+    assert stage.mismatches == 0
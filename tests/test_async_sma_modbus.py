@@ -0,0 +1,41 @@
+"""tests of the asynchronous client"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from sma_modbus import AsyncSunnyBoy
+from sma_modbus.profiles import Capabilities
+
+
+def _device(registers):
+    """AsyncSunnyBoy answering every read with registers, the reads are recorded"""
+    device = AsyncSunnyBoy('127.0.0.1')
+    device.requests = []
+
+    async def read_register_block(register_address, count):
+        device.requests.append((register_address, count))
+        return registers[:count]
+    device.read_register_block = read_register_block
+    return device
+
+
+def test_truncated_responses_fail_like_the_sync_client():
+    async def read():
+        device = _device([0])
+        return await device.read_value('serial_number'), \
+            await device.read_snapshot(['serial_number', 'active_power'])
+
+    value, snapshot = asyncio.run(read())
+    assert value is False
+    assert snapshot.serial_number is None and snapshot.active_power is None
+
+
+def test_read_snapshot_reads_only_supported_fields():
+    async def read():
+        device = _device([0, 7] * 8)
+        device.capabilities = Capabilities(7, None, None, None, 'generic', ('serial_number',))
+        return device.requests, await device.read_snapshot(['serial_number', 'total_yield'])
+
+    requests, snapshot = asyncio.run(read())
+    assert requests == [(30057, 2)]
+    assert snapshot.serial_number == 7 and snapshot.total_yield is None
@@ -0,0 +1,119 @@
+"""tests of the batched writer"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import mysql.connector
+from maria_db_mysql import BatchedWriter, Spool
+
+
+class _Cursor:
+    def __init__(self, connector):
+        self._connector = connector
+
+    def executemany(self, statement, rows):
+        self._connector.calls += 1
+        if self._connector.calls == self._connector.down_at:
+            self._connector.up = False
+        if not self._connector.up:
+            raise mysql.connector.InterfaceError('Lost connection to MySQL server')
+        if '`bad`' in statement:
+            raise mysql.connector.ProgrammingError("Unknown column 'x' in 'field list'", errno=1054)
+        self._connector.pending.extend((statement.split('.')[1].split(' ')[0], row) for row in rows)
+
+    def close(self):
+        pass
+
+
+class _Connector:
+    """In memory connection, rows of table `bad` are rejected"""
+    def __init__(self):
+        self.up = True
+        # number of the executemany call losing the connection
+        self.down_at = None
+        self.calls = 0
+        self.pending = []
+        self.rows = []
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        self.rows.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def is_connected(self):
+        return self.up
+
+
+class _Database:
+    database = 'solar'
+
+    def __init__(self):
+        self.connector = _Connector()
+
+    def reconnect(self):
+        return self.connector
+
+
+def test_the_oldest_rows_are_dropped():
+    database = _Database()
+    database.connector.up = False
+    writer = BatchedWriter(database, max_rows=100, max_delay=3600, max_buffered=3)
+    writer.add('a', ('v',), (1,))
+    for value in range(2, 5):
+        writer.add('b', ('v',), (value,))
+    writer.add('a', ('v',), (5,))
+    assert writer.rows_dropped == 2
+    database.connector.up = True
+    assert writer.flush()
+    assert sorted(database.connector.rows) == [('`a`', (5,)), ('`b`', (3,)), ('`b`', (4,))]
+
+
+def test_rejected_rows_go_to_the_dead_letter_file(tmp_path):
+    database = _Database()
+    dead_letter = str(tmp_path / 'rejected.jsonl')
+    writer = BatchedWriter(database, max_rows=100, max_delay=3600, dead_letter=dead_letter, max_failures=2)
+    writer.add('good', ('v',), (1,))
+    writer.add('bad', ('x',), (2,))
+    assert not writer.flush()
+    assert writer.flush()
+    assert database.connector.rows == [('`good`', (1,))]
+    assert writer.stats()['rows_dead'] == 1 and writer.rows_written == 1
+    with open(dead_letter, encoding='utf-8') as file:
+        assert [json.loads(line) for line in file] == [{'table': 'bad', 'columns': ['x'], 'rows': [[2]]}]
+
+
+def test_outages_are_not_dead_lettered(tmp_path):
+    database = _Database()
+    database.connector.up = False
+    spool = Spool(str(tmp_path / 'spool'))
+    writer = BatchedWriter(database, max_rows=1, spool=spool, max_failures=1)
+    for value in range(3):
+        writer.add('good', ('v',), (value,))
+    writer.add('bad', ('x',), (9,))
+    assert writer.rows_spooled == 4 and writer.rows_dead == 0
+    database.connector.up = True
+    # the spooled rejected rows do not block the replay
+    assert writer.flush()
+    assert database.connector.rows == [('`good`', (0,)), ('`good`', (1,)), ('`good`', (2,))]
+    assert writer.rows_replayed == 3 and writer.rows_dead == 1
+    assert not spool.pending
+
+
+def test_an_outage_while_isolating_rejected_rows_keeps_all_rows():
+    database = _Database()
+    writer = BatchedWriter(database, max_rows=100, max_delay=3600, max_failures=1)
+    writer.add('good', ('v',), (1,))
+    writer.add('bad', ('x',), (2,))
+    # the connection is lost while the bad table is tried alone
+    database.connector.down_at = 4
+    assert not writer.flush()
+    assert database.connector.rows == [] and writer.rows_dead == 0 and writer.buffered == 2
+    database.connector.up = True
+    assert writer.flush()
+    assert database.connector.rows == [('`good`', (1,))]
+    assert writer.rows_dead == 1 and writer.rows_written == 1
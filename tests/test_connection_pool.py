@@ -0,0 +1,40 @@
+"""tests of the connection pool"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from sma_modbus import SunnyBoy, ConnectionPool
+from sma_modbus.health import DeviceHealth
+
+
+def test_threads_sharing_a_client_get_their_own_responses(simulator):
+    """The objects of a device share the pooled client, a request and its response hold it"""
+    port = simulator()
+    serial_number = 3000000000 + port * 1000 + 3
+    results = []
+
+    def poll(pool):
+        sunny_obj = SunnyBoy('127.0.0.1', port, pool=pool, health=DeviceHealth(min_timeout=1.0))
+        for _ in range(30):
+            results.append((sunny_obj.get_serial_number(), sunny_obj.get_device_type()))
+        sunny_obj.close()
+
+    with ConnectionPool(timeout=2) as pool:
+        threads = [threading.Thread(target=poll, args=(pool,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.stats()
+    assert stats['open'] == 1 and stats['reconnects'] == 0
+    assert results == [(serial_number, 'SB 3600TL-21')] * 240
+
+
+def test_closed_pool_gives_no_connection(simulator):
+    port = simulator()
+    pool = ConnectionPool()
+    sunny_obj = SunnyBoy('127.0.0.1', port, pool=pool)
+    assert sunny_obj.get_serial_number() == 3000000000 + port * 1000 + 3
+    pool.close()
+    assert pool.ensure_connected(sunny_obj._client) is False
+    assert sunny_obj.get_serial_number() is False
@@ -0,0 +1,55 @@
+"""tests of the deadband filter"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from sma_modbus.deadband import Deadband, DeadbandFilter
+
+
+def _record(timestamp, power, status = 'Ok', device = 'sb1'):
+    return {'timestamp': timestamp, 'device': device, 'group': 'live', 'active_power': power, 'status': status}
+
+
+def test_deadband_absolute_and_relative():
+    deadband = Deadband(absolute=0.25, relative=0.0625)
+    assert not deadband.changed(1.0, 1.25)
+    assert deadband.changed(1.0, 1.5)
+    assert not deadband.changed(16.0, 17.0)
+    assert deadband.changed(16.0, 17.5)
+    assert deadband.changed(None, 0.0) and deadband.changed(1.0, None)
+    assert deadband.changed((1.0, 1.0), (1.0, 1.5))
+    assert not deadband.changed((1.0, None), (1.125, None))
+
+
+def test_only_significant_records_are_forwarded():
+    forwarded = []
+    stage = DeadbandFilter(forwarded.append, {'active_power': 0.25}, max_silence=None)
+    assert stage(_record(0, 1.0))
+    assert not stage(_record(1, 1.125))
+    # compared with the last forwarded value, not the last received one
+    assert not stage(_record(2, 1.25))
+    assert stage(_record(3, 1.375))
+    # enums and other fields use the default deadband 0, every change
+    assert stage(_record(4, 1.375, 'Warnung'))
+    # devices are filtered apart
+    assert stage(_record(5, 1.375, 'Warnung', device='sb2'))
+    assert [record['timestamp'] for record in forwarded] == [0, 3, 4, 5]
+    assert stage.stats() == {'forwarded': 4, 'suppressed': 2, 'heartbeats': 0}
+
+
+def test_heartbeat_after_max_silence():
+    forwarded = []
+    stage = DeadbandFilter(forwarded.append, {'active_power': 1.0}, max_silence=60)
+    for timestamp in range(0, 130, 10):
+        stage(_record(timestamp, 1.0))
+    assert [record['timestamp'] for record in forwarded] == [0, 60, 120]
+    assert stage.heartbeats == 2
+
+
+def test_ignored_fields_and_new_fields():
+    forwarded = []
+    stage = DeadbandFilter(forwarded.append, {'status': None}, max_silence=None)
+    stage(_record(0, 1.0))
+    assert not stage(_record(1, 1.0, 'Warnung'))
+    record = _record(2, 1.0)
+    record['daily_yield'] = 100
+    assert stage(record)
@@ -0,0 +1,15 @@
+"""tests of the prometheus exporter"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from sma_modbus.exporter import MetricsStore
+from sma_modbus.instrumentation import Instrumentation, OK
+
+
+def test_request_duration_summary_has_sum_and_count():
+    instrumentation = Instrumentation()
+    for duration in (0.25, 0.5, 0.25):
+        instrumentation.request_finished(('10.0.0.1', 502, 3), 3, 30057, 2, duration, OK)
+    lines = MetricsStore(instrumentation=instrumentation).render().splitlines()
+    assert 'sma_request_duration_seconds_sum{device="10.0.0.1:502/3"} 1.0' in lines
+    assert 'sma_request_duration_seconds_count{device="10.0.0.1:502/3"} 3' in lines
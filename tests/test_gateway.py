@@ -0,0 +1,43 @@
+"""tests of the modbus tcp framing and the gateway client"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from sma_modbus import GatewayClient
+from sma_modbus.instrumentation import ERROR, EXCEPTION_RESPONSE, TIMEOUT
+from sma_modbus.mbap import MBAP, frame, decode_read_response
+
+
+def test_short_responses_are_malformed():
+    assert decode_read_response(b'', 2) == ERROR
+    assert decode_read_response(b'\x83', 2) == ERROR
+    assert decode_read_response(b'\x83\x02', 2) == EXCEPTION_RESPONSE
+    assert decode_read_response(b'\x03\x04\x00\x01\x00\x02', 2) == [1, 2]
+
+
+def test_responses_of_another_unit_are_dropped():
+    """A reply with the transaction id of a request, but another unit id, is no answer"""
+    async def handle(reader, writer):
+        while True:
+            try:
+                tid, _, length, unit_id = MBAP.unpack(await reader.readexactly(MBAP.size))
+                await reader.readexactly(length - 1)
+            except asyncio.IncompleteReadError:
+                break
+            # the requests of unit 4 are answered by unit 5
+            writer.write(frame(tid, 5 if unit_id == 4 else unit_id, b'\x03\x04\x00\x01\x00\x02'))
+        writer.close()
+
+    async def read():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with GatewayClient('127.0.0.1', port, timeout=0.3) as gateway:
+            results = [await gateway.request_register_block(30057, 2, unit_id) for unit_id in (3, 4)]
+            mismatches = gateway.mismatches
+        server.close()
+        await server.wait_closed()
+        return results, mismatches
+
+    results, mismatches = asyncio.run(read())
+    assert results == [[1, 2], TIMEOUT]
+    assert mismatches == 1
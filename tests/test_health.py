@@ -0,0 +1,127 @@
+"""tests of the adaptive timeout and the circuit breaker"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from sma_modbus import SunnyBoy, AsyncSunnyBoy, ConnectionPool, GatewayClient
+from sma_modbus.health import DeviceHealth, CLOSED, OPEN, HALF_OPEN
+from sma_modbus.instrumentation import OK, TIMEOUT, EXCEPTION_RESPONSE, CIRCUIT_OPEN, NO_CONNECTION
+from sma_modbus.simulator import SimulatorSettings
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_opens_and_probes():
+    clock = _Clock()
+    health = DeviceHealth(failure_threshold=2, probe_interval=10, clock=clock)
+    health.record(0.01, TIMEOUT)
+    assert health.state == CLOSED
+    health.record(0.01, TIMEOUT)
+    assert health.state == OPEN and not health.allow()
+    clock.now = 10
+    assert health.allow() and health.state == HALF_OPEN
+    health.record(0.01, TIMEOUT)
+    # the next probe waits twice as long
+    clock.now = 29
+    assert not health.allow()
+    clock.now = 30
+    assert health.allow()
+    health.record(0.01, OK)
+    assert health.state == CLOSED
+
+
+def test_half_open_circuit_admits_one_probe():
+    clock = _Clock()
+    health = DeviceHealth(failure_threshold=1, probe_interval=10, clock=clock)
+    health.record(0.01, TIMEOUT)
+    clock.now = 10
+    assert health.ready()
+    # concurrent pollers: the first takes the probe, the others wait for its outcome
+    assert [health.allow() for _ in range(3)] == [True, False, False]
+    assert not health.ready() and health.rejected == 2
+    health.record(0.01, OK)
+    assert health.allow() and health.allow()
+
+
+def test_lost_probes_are_replaced_and_failed_connects_reopen():
+    clock = _Clock()
+    health = DeviceHealth(failure_threshold=1, probe_interval=10, clock=clock)
+    health.record(0.01, TIMEOUT)
+    clock.now = 10
+    assert health.allow()
+    # the probe never records its outcome
+    clock.now = 19
+    assert not health.allow()
+    clock.now = 20
+    assert health.allow() and health.state == HALF_OPEN
+    health.record(0.01, TIMEOUT)
+    assert health.state == OPEN and health.opened == 2
+    # a connect checks ready() only, its failure counts as failed probe
+    clock.now = 40
+    assert health.ready()
+    health.record(0.01, NO_CONNECTION)
+    assert not health.ready() and health.opened == 3
+
+def test_late_replies_are_not_taken_as_answers(simulator):
+    """The device answers slower than the adaptive timeout: reads fail, they never return other values"""
+    port = simulator(SimulatorSettings(latency=0.5))
+    sunny_obj = SunnyBoy('127.0.0.1', port, health=DeviceHealth(max_timeout=0.2, failure_threshold=100))
+    for _ in range(3):
+        assert sunny_obj.get_device_class() in ('Solar-Wechselrichter', False)
+        assert sunny_obj.get_serial_number() in (3000000000 + port * 1000 + 3, False)
+        assert sunny_obj.get_device_type() in ('SB 3600TL-21', False)
+        assert sunny_obj.get_software_packet() in (50665988, False)
+    assert sunny_obj._health.failures_in_row > 0
+    sunny_obj.close()
+
+
+def test_late_replies_of_retries_are_dropped(simulator):
+    """Retries of pymodbus send the request again, the late replies of the copies are dropped"""
+    port = simulator(SimulatorSettings(latency=0.5))
+    with ConnectionPool(timeout=0.2, retries=3) as pool:
+        sunny_obj = SunnyBoy('127.0.0.1', port, pool=pool)
+        for _ in range(3):
+            assert sunny_obj.get_device_class() in ('Solar-Wechselrichter', False)
+            assert sunny_obj.get_serial_number() in (3000000000 + port * 1000 + 3, False)
+            assert sunny_obj.get_device_type() in ('SB 3600TL-21', False)
+            assert sunny_obj.get_software_packet() in (50665988, False)
+        sunny_obj.close()
+
+
+def test_async_exception_responses_keep_the_circuit_closed(simulator):
+    """An exception response is an answer of a living device, not a failure"""
+    port = simulator(SimulatorSettings(exception_rate=1.0))
+    health = DeviceHealth(failure_threshold=2)
+
+    async def poll():
+        sunny_obj = AsyncSunnyBoy('127.0.0.1', port, health=health)
+        await sunny_obj.connect()
+        results = [await sunny_obj.request_register_block(30051, 2) for _ in range(3)]
+        sunny_obj.close()
+        return results
+
+    assert asyncio.run(poll()) == [EXCEPTION_RESPONSE] * 3
+    assert health.state == CLOSED and health.failures_in_row == 0
+
+
+def test_gateway_units_open_the_circuit(simulator):
+    """A unit behind a gateway answering slower than the timeout is skipped after failure_threshold timeouts"""
+    port = simulator(SimulatorSettings(latency=0.5))
+    health = DeviceHealth(max_timeout=0.2, failure_threshold=2)
+
+    async def poll():
+        gateway = GatewayClient('127.0.0.1', port)
+        await gateway.connect()
+        sunny_obj = gateway.device(3, health)
+        results = [await sunny_obj.request_register_block(30051, 2) for _ in range(3)]
+        gateway.close()
+        return results
+
+    assert asyncio.run(poll()) == [TIMEOUT, TIMEOUT, CIRCUIT_OPEN]
+    assert health.state == OPEN
@@ -0,0 +1,29 @@
+"""tests of the request instrumentation"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from conftest import free_port
+from sma_modbus import SunnyBoy, ConnectionPool
+from sma_modbus.instrumentation import Instrumentation, OK, TIMEOUT, NO_CONNECTION
+from sma_modbus.simulator import SimulatorSettings
+
+
+def test_requests_past_the_timeout_count_as_timeouts(simulator):
+    """A device answering slower than the timeout (with retries) is counted as timeout, never as ok"""
+    port = simulator(SimulatorSettings(latency=0.5))
+    instrumentation = Instrumentation()
+    with ConnectionPool(timeout=0.2, retries=1) as pool:
+        sunny_obj = SunnyBoy('127.0.0.1', port, pool=pool, instrumentation=instrumentation)
+        values = [sunny_obj.get_serial_number() for _ in range(4)]
+        sunny_obj.close()
+    counters = instrumentation.stats()['counters']
+    assert counters[TIMEOUT] > 0
+    assert counters[OK] == sum(value is not False for value in values)
+    assert all(value in (3000000000 + port * 1000 + 3, False) for value in values)
+
+
+def test_refused_connections_count_as_no_connection():
+    instrumentation = Instrumentation()
+    sunny_obj = SunnyBoy('127.0.0.1', free_port(), instrumentation=instrumentation)
+    assert sunny_obj.get_serial_number() is False
+    assert instrumentation.stats()['counters'][NO_CONNECTION] == 1
@@ -0,0 +1,35 @@
+"""tests of the poll daemon"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from conftest import free_port
+from sma_modbus.poll_daemon import PollDaemon
+from sma_modbus.simulator import SimulatorThread
+
+
+def test_groups_read_once_are_retried_until_the_device_answers():
+    port = free_port()
+    records = []
+    config = {'devices': [{'ip': '127.0.0.1', 'port': port, 'name': 'roof'}], \
+              'intervals': {'identity': 0}, 'retry_interval': 0.1, 'timeout': 0.5, 'retries': 0, \
+              'health': False, 'stats_interval': 0}
+    daemon = PollDaemon(config, emit=records.append)
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    try:
+        time.sleep(0.35)
+        assert len(records) >= 2 and all(record['serial_number'] is None for record in records)
+        with SimulatorThread('127.0.0.1', port, seed=1):
+            deadline = time.monotonic() + 5
+            while records[-1]['serial_number'] is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+            read = len(records)
+            time.sleep(0.3)
+    finally:
+        daemon.stop()
+        thread.join(5)
+    assert records[-1]['serial_number'] == 3000000000 + port * 1000 + 3
+    # no further reads after the first successful one
+    assert len(records) == read
@@ -0,0 +1,46 @@
+"""tests of the device capabilities"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from sma_modbus import SunnyBoy, profiles
+from sma_modbus.profiles import CapabilityCache
+from sma_modbus.register_map import REGISTER_MAP
+from sma_modbus.simulator import SimulatorSettings
+
+
+def test_busy_answers_are_retried(simulator, tmp_path):
+    """Only an illegal data address makes a field unsupported, a busy device is asked again"""
+    port = simulator(SimulatorSettings(exception_rate=0.2, unsupported=('operating_time',)))
+    cache = CapabilityCache(str(tmp_path / 'capabilities.json'))
+    sunny_obj = SunnyBoy('127.0.0.1', port)
+    capabilities = sunny_obj.detect_capabilities(cache)
+    sunny_obj.close()
+    assert capabilities.complete
+    assert capabilities.fields == set(REGISTER_MAP) - {'operating_time'}
+    assert capabilities.profile == 'sunny_boy'
+    assert len(cache) == 1
+
+
+def test_incomplete_probes_are_not_cached(simulator, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiles.time, 'sleep', lambda seconds: None)
+    port = simulator(SimulatorSettings(exception_rate=0.6))
+    cache = CapabilityCache(str(tmp_path / 'capabilities.json'))
+    sunny_obj = SunnyBoy('127.0.0.1', port)
+    capabilities = sunny_obj.detect_capabilities(cache)
+    sunny_obj.close()
+    assert not capabilities.complete
+    assert len(cache) == 0
+
+
+def test_the_profile_limits_the_probed_fields(simulator, monkeypatch, capsys):
+    """A battery inverter has no pv input, its pv registers are not requested"""
+    monkeypatch.setitem(REGISTER_MAP['device_type'].enum, 9999, 'SBS 2.5-1VL-10')
+    port = simulator(SimulatorSettings(device_type=9999, unsupported=('total_yield',)))
+    sunny_obj = SunnyBoy('127.0.0.1', port)
+    capabilities = sunny_obj.detect_capabilities()
+    sunny_obj.close()
+    assert capabilities.profile == 'sunny_boy_storage'
+    assert capabilities.fields == set(REGISTER_MAP) - set(profiles.PV_FIELDS) - {'total_yield'}
+    assert REGISTER_MAP['dc_current_in'].address in capabilities.barriers
+    # a field of the profile the device does not support is reported
+    assert "['total_yield'] of profile sunny_boy_storage" in capsys.readouterr().out
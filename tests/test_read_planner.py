@@ -0,0 +1,41 @@
+"""tests of the read planner"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+from sma_modbus.read_planner import plan_reads, MAX_REGISTERS_PER_READ
+
+
+def _blocks(spans, **kwargs):
+    return [(block.start, block.count) for block in plan_reads(spans, **kwargs)]
+
+
+def test_small_gaps_are_bridged():
+    assert _blocks([(30775, 8), (30769, 2), (30771, 2)]) == [(30769, 14)]
+    assert _blocks([(100, 2), (118, 2)], max_gap=16) == [(100, 20)]
+
+
+def test_large_gaps_split_the_reads():
+    assert _blocks([(100, 2), (119, 2)], max_gap=16) == [(100, 2), (119, 2)]
+    assert _blocks([(100, 2), (102, 2)], max_gap=0) == [(100, 4)]
+
+
+def test_overlapping_spans_are_merged():
+    assert _blocks([(100, 4), (102, 4), (101, 1)]) == [(100, 6)]
+
+
+def test_barriers_are_never_bridged():
+    assert _blocks([(100, 2), (110, 2)], barriers=(105,)) == [(100, 2), (110, 2)]
+    # a barrier outside of the gap does not matter
+    assert _blocks([(100, 2), (110, 2)], barriers=(99, 112)) == [(100, 12)]
+
+
+def test_reads_are_limited_to_125_registers():
+    spans = [(address, 2) for address in range(1000, 1300, 2)]
+    blocks = _blocks(spans)
+    assert all(count <= MAX_REGISTERS_PER_READ for _, count in blocks)
+    assert blocks[0] == (1000, 124)
+    assert sum(count for _, count in blocks) == 300
+    assert _blocks([(0, 125)]) == [(0, 125)]
+    with pytest.raises(ValueError):
+        plan_reads([(0, 126)])
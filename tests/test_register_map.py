@@ -0,0 +1,68 @@
+"""tests of the register map and its decode plans"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import struct
+from sma_modbus.modbus_constants import ModbusConstants as CONSTS
+from sma_modbus.register_map import REGISTER_MAP, SNAPSHOT_PLAN, compile_plan
+
+
+def _registers(plan, raw):
+    """Return the registers of a block with the raw values of the fields, the gaps are 0"""
+    registers = [0] * plan.count
+    for name, values in raw.items():
+        register = REGISTER_MAP[name]
+        values = values if isinstance(values, tuple) else (values,)
+        data = struct.pack('>' + CONSTS.TYPE_TO_STRUCT[register.datatype] * register.count, *values)
+        offset = register.address - plan.start
+        registers[offset:offset + register.length] = struct.unpack(f'>{register.length}H', data)
+    return registers
+
+
+def test_compile_plan_merges_the_live_fields():
+    plans = compile_plan(frozenset(('dc_current_in', 'dc_voltage_in', 'dc_power_in', 'active_power')))
+    assert len(plans) == 1
+    assert (plans[0].start, plans[0].count) == (30769, 14)
+    assert [register.name for register in plans[0].fields] == \
+        ['dc_current_in', 'dc_voltage_in', 'dc_power_in', 'active_power']
+    # compiled plans are cached
+    assert compile_plan(frozenset(('active_power', 'dc_power_in', 'dc_voltage_in', 'dc_current_in'))) is plans
+
+
+def test_snapshot_plan_covers_the_register_map():
+    names = [register.name for plan in SNAPSHOT_PLAN for register in plan.fields]
+    assert sorted(names) == sorted(REGISTER_MAP)
+    assert all(plan.count <= 125 for plan in SNAPSHOT_PLAN)
+
+
+def test_decode_scales_enums_and_clamps():
+    plan, = compile_plan(frozenset(('device_class', 'device_type', 'serial_number')))
+    values = plan.decode(_registers(plan, {'device_class': 8001, 'device_type': 9165, \
+                                           'serial_number': 3000000003}))
+    assert values == {'device_class': 'Solar-Wechselrichter', 'device_type': 'SB 3600TL-21', \
+                      'serial_number': 3000000003}
+    plan, = compile_plan(frozenset(('dc_current_in', 'active_power')))
+    # a negative dc current is clamped to 0
+    registers = _registers(plan, {'dc_current_in': -5, 'active_power': (1234, 1234, 0, 0)})
+    assert plan.decode(registers) == {'dc_current_in': 0, 'active_power': (1.234, 1.234, 0.0, 0.0)}
+
+
+def test_nan_values_decode_to_none():
+    names = ('status_of_device', 'total_yield', 'dc_power_in', 'ac_current')
+    values = {}
+    for plan in compile_plan(frozenset(names)):
+        plan.decode(_registers(plan, {register.name: (register.nan,) * register.count \
+                                      for register in plan.fields}), values)
+    assert values == {'status_of_device': None, 'total_yield': None, 'dc_power_in': None, \
+                      'ac_current': (None, None, None)}
+
+
+def test_unknown_enum_codes_are_returned_raw():
+    plan, = compile_plan(frozenset(('device_type',)), 0)
+    assert plan.decode([0, 1]) == {'device_type': 1}
+
+
+def test_enums_can_name_the_nan_value():
+    plan, = compile_plan(frozenset(('derating',)), 0)
+    assert plan.decode(_registers(plan, {'derating': CONSTS.ENUM_NAN})) == \
+        {'derating': 'information not available'}
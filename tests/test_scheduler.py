@@ -0,0 +1,76 @@
+"""tests of the drift-free scheduler"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from sma_modbus.scheduler import Scheduler
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_run_times_do_not_drift():
+    """Jobs taking time and late wake ups do not shift the following run times"""
+    clock = _Clock()
+    scheduler = Scheduler(clock)
+    runs = []
+
+    def job():
+        runs.append(clock.now)
+        clock.now += 0.3
+
+    scheduler.add('live', 1.0, job)
+    for _ in range(5):
+        wait = scheduler.run_pending()
+        # wake up a little late every time
+        clock.now += wait + 0.05
+    assert runs == [100.0, 101.05, 102.05, 103.05, 104.05]
+    stats = scheduler.stats()['live']
+    assert stats['runs'] == 5 and stats['skipped'] == 0
+    assert abs(stats['max_lag'] - 0.05) < 1e-9
+
+
+def test_overruns_skip_the_missed_runs():
+    clock = _Clock()
+    scheduler = Scheduler(clock)
+    runs = []
+
+    def job():
+        runs.append(clock.now)
+        clock.now += 2.5 if len(runs) == 1 else 0.0
+
+    scheduler.add('live', 1.0, job)
+    assert scheduler.run_pending() == 0.5
+    clock.now += 0.5
+    scheduler.run_pending()
+    # 101 and 102 are skipped, the run of 103 is not moved
+    assert runs == [100.0, 103.0]
+    assert scheduler.stats()['live']['skipped'] == 2
+
+
+def test_jobs_with_interval_0_run_once():
+    clock = _Clock()
+    scheduler = Scheduler(clock)
+    runs = []
+    scheduler.add('identity', 0, lambda: runs.append('identity'))
+    scheduler.add('status', 10, lambda: runs.append('status'), delay=5)
+    assert scheduler.run_pending() == 5
+    clock.now += 5
+    assert scheduler.run_pending() == 10
+    assert runs == ['identity', 'status']
+    assert list(scheduler.stats()) == ['status']
+
+
+def test_failing_jobs_keep_running(capsys):
+    clock = _Clock()
+    scheduler = Scheduler(clock)
+    scheduler.add('broken', 1.0, lambda: 1 / 0)
+    scheduler.run_pending()
+    clock.now += 1
+    scheduler.run_pending()
+    assert scheduler.stats()['broken']['runs'] == 2
+    assert 'ZeroDivisionError' in capsys.readouterr().out
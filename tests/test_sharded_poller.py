@@ -0,0 +1,65 @@
+"""tests of the sharded poller"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import threading
+import time
+from sma_modbus.sharded_poller import ShardedPoller, merge_stats, _Worker
+
+
+def _config(port, devices):
+    return {'devices': [{'ip': '127.0.0.1', 'port': port + index} for index in range(devices)], \
+            'intervals': {'live': 0.2}, 'stats_interval': 0.5, 'timeout': 1}
+
+
+def _run(poller, seconds):
+    thread = threading.Thread(target=poller.run, kwargs={'check_interval': 0.1})
+    thread.start()
+    time.sleep(seconds)
+    return thread
+
+
+def test_records_of_a_dead_worker_are_read_before_restart():
+    records = []
+    poller = ShardedPoller(_config(5020, 1), workers=1, emit=records.append)
+    worker = _Worker(0, [])
+    worker.connection, child_connection = multiprocessing.Pipe()
+    child_connection.send(('records', [{'device': 'a'}, {'device': 'b'}]))
+    child_connection.send(('stats', {'pool': {'open': 1}}))
+    child_connection.close()
+    poller._drain_worker(worker)
+    assert records == [{'device': 'a'}, {'device': 'b'}]
+    assert worker.stats == {'pool': {'open': 1}} and worker.connection.closed
+
+
+def test_devices_of_a_failing_worker_move_to_the_others(simulator):
+    port = simulator(devices=4)
+    records = []
+    poller = ShardedPoller(_config(port, 4), workers=2, emit=records.append, max_restarts=0)
+    poller.start()
+    thread = _run(poller, 1.5)
+    dead = poller._shards[0]
+    dead.process.kill()
+    time.sleep(2.5)
+    after = len(records)
+    time.sleep(1.0)
+    stats = poller.collect_stats()
+    poller.stop()
+    thread.join()
+    assert poller.reshards == 1 and len(poller._shards) == 1
+    assert len(poller._shards[0].devices) == 4
+    names = {record['device'] for record in records[after:]}
+    assert names == {f'127.0.0.1:{port + index}/3' for index in range(4)}
+    assert len([name for name in stats['scheduler'] if name.endswith('/live')]) == 4
+    assert stats['supervisor']['reshards'] == 1
+
+
+def test_merge_stats():
+    merged = merge_stats([{'scheduler': {'a/live': {}}, 'pool': {'open': 2, 'failures': 1}, \
+                           'health': {'skipped': {'night': 3}, 'open': ['a'], 'timeout_median': 0.2}}, \
+                          {'scheduler': {'b/live': {}}, 'pool': {'open': 1, 'failures': 0}, \
+                           'health': {'skipped': {'night': 1}, 'open': [], 'timeout_median': 0.4}}])
+    assert list(merged['scheduler']) == ['a/live', 'b/live']
+    assert merged['pool'] == {'open': 3, 'failures': 1}
+    assert merged['health'] == {'skipped': {'night': 4}, 'open': ['a'], 'timeout_median': 0.4}
@@ -0,0 +1,51 @@
+"""tests of the SunnyBoy simulator"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+from sma_modbus import SunnyBoy, GatewayClient
+from sma_modbus.instrumentation import EXCEPTION_RESPONSE
+from sma_modbus.simulator import SimulatorSettings, SunnyBoySimulatorContext
+
+
+def test_values_follow_the_day():
+    context = SunnyBoySimulatorContext(SimulatorSettings(day_seconds=100.0, phases=3), seed=1)
+    noon_time = context._started + (1 - context._phase) * 100.0
+    noon = context.values(noon_time)
+    assert noon['active_power'][0] > 3.0 and None not in noon['active_power']
+    night = context.values(noon_time + 50.0)
+    assert night['active_power'] == (0.0, 0.0, 0.0, 0.0)
+    assert night['dc_power_in'] is None and night['dc_voltage_in'] is None
+    assert night['total_yield'] > 1_000_000
+
+
+def test_nan_of_unused_phases(simulator):
+    port = simulator(SimulatorSettings(phases=1))
+    sunny_obj = SunnyBoy('127.0.0.1', port)
+    assert sunny_obj.get_ac_current()[1:] == (None, None)
+    sunny_obj.close()
+
+
+def test_pipelined_requests_of_one_packet_are_all_answered(simulator):
+    """Requests written without waiting arrive in one packet, every one gets its own response"""
+    port = simulator(unit_ids=(3, 4, 5))
+
+    async def sweep():
+        async with GatewayClient('127.0.0.1', port, timeout=2) as gateway:
+            return await asyncio.gather(*(gateway.read_register_block(30057, 2, unit_id) \
+                                          for unit_id in (3, 4, 5) for _ in range(10)))
+
+    results = asyncio.run(sweep())
+    assert all(isinstance(registers, list) for registers in results)
+    serial_numbers = {(high << 16) | low for high, low in results}
+    assert serial_numbers == {3000000000 + port * 1000 + unit_id for unit_id in (3, 4, 5)}
+
+
+def test_unknown_unit_ids_get_a_gateway_exception(simulator):
+    port = simulator(unit_ids=(3,))
+
+    async def read():
+        async with GatewayClient('127.0.0.1', port, timeout=2) as gateway:
+            return await gateway.request_register_block(30057, 2, 7)
+
+    assert asyncio.run(read()) == EXCEPTION_RESPONSE
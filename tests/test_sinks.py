@@ -0,0 +1,85 @@
+"""tests of the sinks"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import glob
+import os
+import pyarrow
+import pyarrow.parquet
+from sma_modbus.aggregation import Aggregator
+from sma_modbus.sinks import ParquetSink
+
+HOUR = 1792234800.0
+
+
+def _live(timestamp, power = None):
+    return {'timestamp': timestamp, 'device': 'sb1', 'group': 'live', 'dc_current_in': None, \
+            'dc_voltage_in': None, 'dc_power_in': None, 'active_power': (power, power, None, None), \
+            'ac_current': (None, None, None)}
+
+
+def _files(directory, group = 'live'):
+    return sorted(glob.glob(os.path.join(str(directory), f'group={group}', '*', '*.parquet')))
+
+
+def test_columns_are_typed_by_the_register_map(tmp_path, capsys):
+    sink = ParquetSink(str(tmp_path), batch_size=2)
+    # the night: no value in the first batch
+    sink.write([_live(HOUR), _live(HOUR + 1)])
+    record = _live(HOUR + 2, 1.5)
+    record['unknown'] = 1
+    sink.write([record, _live(HOUR + 3, 2.0)])
+    sink.close()
+    table = pyarrow.parquet.read_table(_files(tmp_path)[0])
+    assert table.schema.field('dc_power_in').type == pyarrow.int64()
+    assert table.schema.field('dc_voltage_in').type == pyarrow.float64()
+    assert table.schema.field('active_power_0').type == pyarrow.float64()
+    assert table.column('active_power_0').to_pylist() == [None, None, 1.5, 2.0]
+    assert 'unknown' not in table.schema.names
+    assert sink.dropped == {('live', 'unknown')}
+    assert "'unknown'" in capsys.readouterr().out
+
+
+def test_windows_of_aggregated_groups(tmp_path):
+    sink = ParquetSink(str(tmp_path))
+    stage = Aggregator(lambda record: sink.write([record]), windows=(60,))
+    for offset in range(0, 130, 10):
+        stage(_live(HOUR + offset, 1.0 if offset > 60 else None))
+    stage.flush()
+    sink.close()
+    table = pyarrow.parquet.read_table(_files(tmp_path, 'live_60s')[0])
+    assert table.num_rows == 3
+    assert table.schema.field('active_power_mean_0').type == pyarrow.float64()
+    assert table.schema.field('dc_power_in_min').type == pyarrow.int64()
+    assert table.column('active_power_max_0').to_pylist() == [None, 1.0, 1.0]
+
+
+def test_out_of_order_windows_keep_their_files(tmp_path):
+    sink = ParquetSink(str(tmp_path), batch_size=1, grace=300)
+    for offset in (3590, 3600, 3595, 3610, 3599):
+        sink.write([_live(HOUR + offset, 1.0)])
+    assert len(_files(tmp_path)) == 2
+    # past the grace period the window 3600 s before is closed
+    sink.write([_live(HOUR + 3600 + 300, 1.0)])
+    sink.write([_live(HOUR + 3598, 1.0)])
+    sink.close()
+    files = _files(tmp_path)
+    assert [os.path.basename(path) for path in files] == ['11-0.parquet', '11-1.parquet', '12-0.parquet']
+    assert [pyarrow.parquet.read_table(path).num_rows for path in files] == [3, 1, 3]
+    assert sink.files == 3 and sink.rows_written == 7
+
+
+def test_only_the_current_window_is_buffered(tmp_path):
+    sink = ParquetSink(str(tmp_path), batch_size=100)
+    sink.write([_live(HOUR + offset, 1.0) for offset in (3590, 3595, 3599)])
+    assert sink.rows_written == 0
+    # the next window writes the rows of the window before
+    sink.write([_live(HOUR + 3600, 1.0)])
+    assert sink.rows_written == 3
+    sink.write([{'timestamp': HOUR, 'group': 'events', 'device': 'sb1', 'code': 1}, \
+                {'timestamp': HOUR + 1, 'group': 'events', 'device': 'sb1', 'text': 'ok'}])
+    sink.close()
+    assert sink.rows_written == 6
+    table = pyarrow.parquet.read_table(_files(tmp_path, 'events')[0])
+    assert table.column('code').to_pylist() == [1, None]
+    assert table.column('text').to_pylist() == [None, 'ok']
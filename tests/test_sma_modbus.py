@@ -0,0 +1,26 @@
+"""tests of the synchronous client"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from types import SimpleNamespace
+import pytest
+from sma_modbus import SunnyBoy
+
+
+def test_decode_register_readings_decodes_count_values():
+    sunny_obj = SunnyBoy('127.0.0.1')
+    readings = SimpleNamespace(registers=[0, 1, 0, 2, 0xFFFF, 0xFFFF])
+    assert sunny_obj.decode_register_readings(readings, 'U32', 1) == 1
+    assert sunny_obj.decode_register_readings(readings, 'U32', 2) == [1, 2]
+    assert sunny_obj.decode_register_readings(readings, 'S16', 3) == [0, 1, 0]
+    assert sunny_obj.decode_register_readings(readings, 'U64', 2) is False
+
+
+def test_read_snapshot_rejects_fields_without_slot(simulator):
+    sunny_obj = SunnyBoy('127.0.0.1', simulator())
+    with pytest.raises(ValueError, match='active_power_limit'):
+        sunny_obj.read_snapshot(['active_power', 'active_power_limit'])
+    with pytest.raises(ValueError, match='no_such_field'):
+        sunny_obj.read_snapshot(['no_such_field'])
+    assert sunny_obj.read_snapshot(['serial_number']).serial_number is not None
+    sunny_obj.close()
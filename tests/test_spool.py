@@ -0,0 +1,57 @@
+"""tests of the durable spool"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from maria_db_mysql.spool import Spool
+
+
+def _rows(batches):
+    return [(table, columns, row) for table, columns, rows in batches for row in rows]
+
+
+def test_rows_are_replayed_in_order(tmp_path):
+    with Spool(str(tmp_path)) as spool:
+        spool.append('leistung', ('p_act_sum', 'device'), (1.5, 'sb1'))
+        spool.append('leistung', ('p_act_sum', 'device'), (None, 'sb1'))
+        spool.append('ertrag', ('total', 'night'), (123456789012, True))
+    written = []
+    assert Spool(str(tmp_path)).replay(lambda batches: written.extend(_rows(batches)) or True) == 3
+    assert written == [('leistung', ('p_act_sum', 'device'), (1.5, 'sb1')), \
+                       ('leistung', ('p_act_sum', 'device'), (None, 'sb1')), \
+                       ('ertrag', ('total', 'night'), (123456789012, True))]
+    assert not Spool(str(tmp_path)).pending
+
+
+def test_torn_records_are_ignored_after_a_crash(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append('leistung', ('p_act_sum',), (1.0,))
+    spool.append('leistung', ('p_act_sum',), (2.0,))
+    spool.sync()
+    # the process dies while writing the next record
+    spool._file.write(b'\x02\x00\x00\x00\x20\x00')
+    spool._file.flush()
+    path, = [os.path.join(str(tmp_path), name) for name in os.listdir(str(tmp_path))]
+    assert _rows(Spool.read_segment(path)) == [('leistung', ('p_act_sum',), (1.0,)), \
+                                               ('leistung', ('p_act_sum',), (2.0,))]
+    recovered = Spool(str(tmp_path))
+    assert recovered.pending
+    assert recovered.replay(lambda batches: True) == 2
+
+
+def test_refused_segments_are_kept(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=1)
+    for value in range(3):
+        spool.append('leistung', ('p_act_sum',), (value,))
+    spool.close()
+    assert len(os.listdir(str(tmp_path))) == 3
+    calls = []
+
+    def write(batches):
+        calls.append(_rows(batches))
+        return len(calls) < 2
+
+    assert spool.replay(write) == 1
+    assert len(os.listdir(str(tmp_path))) == 2
+    assert spool.replay(lambda batches: True) == 2
+    assert os.listdir(str(tmp_path)) == []
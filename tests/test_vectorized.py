@@ -0,0 +1,47 @@
+"""tests of the vectorized decoder"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import struct
+import numpy
+from sma_modbus.modbus_constants import ModbusConstants as CONSTS
+from sma_modbus.register_map import REGISTER_MAP, compile_plan
+from sma_modbus.vectorized import VectorDecoder
+
+
+def _registers(plan, raw):
+    """Return the registers of a block with the raw values of the fields, the gaps are 0"""
+    registers = [0] * plan.count
+    for register in plan.fields:
+        value = raw[register.name]
+        data = struct.pack('>' + CONSTS.TYPE_TO_STRUCT[register.datatype], value)
+        offset = register.address - plan.start
+        registers[offset:offset + register.length] = struct.unpack(f'>{register.length}H', data)
+    return registers
+
+
+def test_counters_stay_exact_integers():
+    plans = compile_plan(frozenset(('total_yield', 'dc_power_in', 'dc_voltage_in')))
+    decoder = VectorDecoder(plans)
+    big = 2 ** 53 + 1
+    raws = [{'total_yield': big, 'dc_power_in': -5, 'dc_voltage_in': 23050}, \
+            {'total_yield': CONSTS.NAN_VALUE['U64'], 'dc_power_in': CONSTS.NAN_VALUE['S32'], \
+             'dc_voltage_in': CONSTS.NAN_VALUE['S32']}]
+    columns = decoder.decode([[_registers(plan, raw) for raw in raws] for plan in plans])
+    assert columns['total_yield'].dtype == numpy.uint64
+    assert columns['total_yield'][0] == big
+    assert columns['total_yield'][1] == REGISTER_MAP['total_yield'].nan
+    assert columns['dc_power_in'].dtype == numpy.int64
+    # clamped, the NaN sentinel is kept
+    assert columns['dc_power_in'].tolist() == [0, CONSTS.NAN_VALUE['S32']]
+    assert columns['dc_voltage_in'][0] == 230.5 and numpy.isnan(columns['dc_voltage_in'][1])
+
+
+def test_failed_reads_and_no_devices():
+    plans = compile_plan(frozenset(('total_yield', 'dc_voltage_in')))
+    decoder = VectorDecoder(plans)
+    columns = decoder.decode([[[0] * plan.count] for plan in plans], [[False]] * len(plans))
+    assert columns['total_yield'][0] == CONSTS.NAN_VALUE['U64']
+    assert numpy.isnan(columns['dc_voltage_in'][0])
+    empty = decoder.decode([[] for plan in plans])
+    assert len(empty) == 0 and empty.dtype == decoder.dtype